@@ -1,44 +1,119 @@
 import os
 import logging
 import glob
+import time
+import shutil
+import asyncio
+import threading
 # import ollama
-import requests
-import certifi
-import urllib3
-from langchain.schema import Document
-from urllib.parse import urljoin
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
-from openai import OpenAI
-from langchain_community.document_loaders import UnstructuredPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+import metrics
+from log_config import configure_logging
 from dotenv import load_dotenv
-
-# Disable only insecure request warnings for UTAR's SSL issue
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from embedding_cache import CachedEmbeddings, LazyEmbeddings
+from context_builder import build_prompt
+from hybrid_retriever import BM25Index, reciprocal_rank_fusion
+from numpy_vector_store import NumpyVectorStore
+from unified_index import query_by_vectors
+from ingestion import IngestionPipeline, IndexManifest, DownloadManifest, MANIFEST_FILE_NAME, download_pdfs, iter_parsed_pdfs, file_hash, text_hash
+from scraper import RenderedPages, find_pdf_links, scrape_webpages
 
 # Load environment variables
 load_dotenv()
 
-# Openai setup
-chat_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY_CHAT"))
-embedding_model = OpenAIEmbeddings(
-    model="text-embedding-3-large",
-    api_key=os.getenv("OPENAI_API_KEY_EMBED")
-    )
+# Openai setup. Clients are created on first use, keeping the openai and langchain_openai imports out of worker boot
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(name, create):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = create()
+    return client
+
+
+def get_chat_client():
+    """The process-wide OpenAI chat client"""
+    def create():
+        from openai import OpenAI
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY_CHAT"))
+    return _shared_client("chat", create)
+
+
+def get_async_chat_client():
+    """Async client for the ASGI entry point, sharing one pooled set of keep-alive connections"""
+    def create():
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY_CHAT"),
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+            )
+        )
+    return _shared_client("async_chat", create)
+
+
+EMBEDDING_MODEL_NAME = "text-embedding-3-large"
+
+
+def create_openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL_NAME,
+        api_key=os.getenv("OPENAI_API_KEY_EMBED")
+        )
+
+
+openai_embeddings = LazyEmbeddings(create_openai_embeddings)
+
+# Cache embeddings on disk so identical chunks and repeated queries are only embedded once
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/var/data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "1024"))
+embedding_model = CachedEmbeddings(
+    openai_embeddings,
+    EMBEDDING_MODEL_NAME,
+    db_path=EMBEDDING_CACHE_PATH,
+    memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES
+) if EMBEDDING_CACHE_ENABLED else openai_embeddings
 OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("chatbot_debug.log"), logging.StreamHandler()]
-)
+GENERATION_ERROR_MESSAGE = "Sorry, something went wrong while generating the answer."
+
+# Retrieval mode: "vector" (dense only) or "hybrid" (BM25 fused with dense results)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("HYBRID_CANDIDATES_FACTOR", "3"))  # candidates per retriever = k * factor
+# Answer from BM25 alone when the best match contains an identifier from the query and outscores the runner-up this many times
+HYBRID_KEYWORD_RATIO = float(os.getenv("HYBRID_KEYWORD_RATIO", "2.0"))
+
+# Vector store used to answer queries: "chroma", or "numpy" to serve a memory-mapped export of the Chroma index.
+# Exports are written offline (build_index.py --numpy, or refresh_index), never by serving workers
+# Override per agent with VECTOR_BACKEND_<NAME>, where NAME is the folder name of its database (e.g. VECTOR_BACKEND_FINANCE)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+NUMPY_VECTOR_DTYPE = os.getenv("NUMPY_VECTOR_DTYPE", "float32")  # float16 halves memory, but rows are upcast to score each query
+
+# Build a missing index inside the request that needs it (scraping, parsing and embedding on the serving path).
+# Off by default: indexes are built offline with build_index.py and published as releases
+INDEX_BUILD_ON_DEMAND = os.getenv("INDEX_BUILD_ON_DEMAND", "false").lower() == "true"
+
+# Backoff between attempts to load a vector database that failed to load
+INIT_RETRY_BASE_SECONDS = float(os.getenv("INIT_RETRY_BASE_SECONDS", "5"))
+INIT_RETRY_MAX_SECONDS = float(os.getenv("INIT_RETRY_MAX_SECONDS", "300"))
+
+# Setup logging (see log_config for the output, format and file settings)
+configure_logging()
 
 class BaseAgent:
     """Base agent class with common functionality"""
+
+    no_context_response = None  # Returned without calling the model when no context is retrieved
+    system_prompt = None
+    prompt_template = None  # Filled by build_prompt with {name}, {history}, {context} and {query}
     
     def __init__(self, name, description, vector_db_path=None, department=None, urls=[]):
         self.name = name
@@ -47,137 +122,89 @@ class BaseAgent:
         self.vector_db_path = vector_db_path
         self.department = department
         self.urls = urls
+        self.doc_folder_path = f"/var/data/{department}"  # where the department's PDFs are downloaded to
         self._is_initialized = False  # Track initialization state
+        self.index_version = 0  # Bumped whenever the vector database is (re)loaded, invalidates cached answers
+        self._init_lock = threading.Lock()  # Single-flight loading: one load at a time, concurrent callers wait on it
+        self.load_state = "idle"
+        self.load_error = None
+        self.load_attempts = 0
+        self.load_seconds = None
+        self._retry_at = 0.0
+        self._bm25_index = None
+        self._bm25_version = None
+        self._bm25_lock = threading.Lock()
+        self.index_name = os.path.basename(vector_db_path or "").lower()  # e.g. "finance"
+        self.vector_backend = os.getenv(f"VECTOR_BACKEND_{self.index_name.upper()}", VECTOR_BACKEND).lower()
+        self.unified_index = None  # set by the orchestrator when all departments share one index
         
     def initialize(self):
-        """Load the Vector Database for the current agent (lazy loading)"""
+        """Load the Vector Database for the current agent (lazy loading).
+        Concurrent callers wait for the load in progress instead of starting another one,
+        and a failed load is retried with exponential backoff instead of being given up on"""
         if self._is_initialized:
             logging.info(f"Agent {self.name} already initialized, skipping...")
             return
-            
-        if self.vector_db_path:
+
+        with self._init_lock:
+            # Another caller may have finished loading while we waited for the lock
+            if self._is_initialized:
+                logging.info(f"Agent {self.name} already initialized, skipping...")
+                return
+
+            if not self.vector_db_path:
+                return
+
+            retry_in = self._retry_at - time.monotonic()
+            if retry_in > 0:
+                logging.warning(f"Vector database for {self.name} failed to load, next attempt in {retry_in:.1f}s")
+                return
+
             logging.info(f"Lazy loading vector database for {self.name}...")
-            self.vector_db = self._load_vector_db()
-            self._is_initialized = True
-            if self.vector_db:
+            self.load_state = "loading"
+            self.load_attempts += 1
+            start = time.perf_counter()
+            vector_db = self._load_vector_db()
+            self.load_seconds = time.perf_counter() - start
+
+            if vector_db:
+                self.vector_db = vector_db
+                self.index_version += 1
+                self._is_initialized = True
+                self.load_state = "ready"
+                self.load_error = None
+                self.load_attempts = 0
                 logging.info(f"Successfully loaded vector database for {self.name}")
             else:
-                logging.warning(f"Failed to load vector database for {self.name}")
-
-    def scrape_webpage(self, urls):
-        print("\nScrapping some UTAR Webpages.")
-        seen_links = set()
-        results = []
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-
-            for url in urls:
-                page = browser.new_page()
-                page.goto(url)  
-                page.wait_for_timeout(3000)  # wait for JS to load
-                html_content = page.content()
-                page.close()
-
-                soup = BeautifulSoup(html_content, 'html.parser')
-
-                # ---- Collect Text ----
-                page_text_parts = []
-                for div in soup.find_all('div', class_='mg'):
-                    section_text = div.get_text(separator='\n', strip=True)
-                    if section_text:
-                        page_text_parts.append(section_text)
-
-                # ---- Collect Unique Links ----
-                seen_links = set()
-                link_texts = []
-                link_metadata_list = []
-                for link in soup.find_all('a', href=True):
-                    full_url = urljoin(url, link['href'])
-                    if full_url not in seen_links:  # ensure uniqueness
-                        seen_links.add(full_url)
-                        text = link.get_text(strip=True)
-                        if text:
-                            link_texts.append(text)
-                            link_metadata_list.append({"text": text, "url": full_url})
-
-                # ---- Decide How to Combine ----
-                if not page_text_parts:  # if no main text, combine link texts
-                    combined_text = " | ".join(link_texts)
-                else:
-                    combined_text = "\n".join(page_text_parts)
-                    if link_texts:
-                        combined_text += "\nLinks: " + " | ".join(link_texts)
-
-                results.append(
-                    Document(
-                        page_content=combined_text,
-                        metadata={"source":url}
-                    )
-                )
-
-
-            browser.close()
-            print("\nDone Scraping UTAR Webpages.")
+                backoff = min(INIT_RETRY_MAX_SECONDS, INIT_RETRY_BASE_SECONDS * 2 ** (self.load_attempts - 1))
+                self._retry_at = time.monotonic() + backoff
+                self.load_state = "failed"
+                logging.warning(f"Failed to load vector database for {self.name}, retrying in {backoff:.1f}s")
+
+    def load_status(self):
+        """Observable state of the agent's vector database load"""
+        return {
+            "state": self.load_state,
+            "attempts": self.load_attempts,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.load_error
+        }
 
-        return results
+    def scrape_webpage(self, urls, pages=None):
+        return scrape_webpages(urls, pages=pages)
 
-    def scrape_web_pdfs(self, urls, department, base_folder="/var/data"):
+    def scrape_web_pdfs(self, urls, department, base_folder="/var/data", pages=None):
         """
         Scrapes a webpage for all linked PDFs and downloads them into a department folder.
         Handles UTAR's broken SSL for PDFs specifically.
+        Pass the RenderedPages shared with scrape_webpage so each page is rendered once.
         """
-        print("Looking for PDF files in some UTAR Webpages to download...")
         print("department", department)
         download_folder = os.path.join(base_folder, department)
         os.makedirs(download_folder, exist_ok=True)
 
-        pdf_files = []
-
-        # Use Playwright to fetch rendered HTML
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-
-            for url in urls:
-                page = browser.new_page()
-                page.goto(url)
-                page.wait_for_timeout(3000)  # wait for JS to load
-                html_content = page.content()
-                page.close()
-
-
-                soup = BeautifulSoup(html_content, 'html.parser')
-
-                # Download PDFs only
-                for link in soup.find_all('a', href=True):
-                    full_url = urljoin(url, link['href'])
-                    if full_url.lower().endswith(".pdf"):
-                        file_name = os.path.basename(full_url)
-                        pdf_path = os.path.join(download_folder, file_name)
-
-                        if os.path.exists(pdf_path):
-                            print(f"Skipping (already exists): {file_name}")
-                            continue
-
-                        try:
-                            if "utar.edu.my" in full_url.lower():
-                                # Bypass SSL verification for UTAR
-                                r = requests.get(full_url, stream=True, verify=False, timeout=10)
-                            else:
-                                r = requests.get(full_url, stream=True, verify=certifi.where(), timeout=10)
-                            r.raise_for_status() # Check HTTP response for errors to avoid downloading broken files
-                            with open(pdf_path, "wb") as f: # Open pdf in binary write mode
-                                for chunk in r.iter_content(8192):
-                                    if chunk:
-                                        f.write(chunk)
-                            pdf_files.append(pdf_path)
-                            print(f"Downloaded PDF: {pdf_path}")
-                        except Exception as e:
-                            print(f"Failed to download {full_url}: {e}")
-                            
-            browser.close()
-
-        return pdf_files
+        # Only new and changed PDFs are downloaded, over a pooled session with a bounded pool
+        return download_pdfs(find_pdf_links(urls, pages=pages), download_folder)
     
     
     def ingest_pdf(self, doc_folder_path):
@@ -188,33 +215,179 @@ class BaseAgent:
             logging.error(f"Folder not found: {doc_folder_path}")
             return None
 
+        # PDFs are parsed in parallel worker processes
         all_data = []
-        for pdf_file in glob.glob(os.path.join(doc_folder_path, "*.pdf")):
-            try:
-                print(f"Loading PDF: {pdf_file}")
-                loader = UnstructuredPDFLoader(file_path=pdf_file)
-                data = loader.load()
-
-                # add source metadata
-                for doc in data:
-                    doc.metadata["source"] = os.path.basename(pdf_file)
-
-                all_data.extend(data)
-            except Exception as e:
-                logging.error(f"Failed to load {pdf_file}: {e}")
+        for pdf_file, data in iter_parsed_pdfs(glob.glob(os.path.join(doc_folder_path, "*.pdf"))):
+            print(f"Loaded PDF: {pdf_file}")
+            all_data.extend(data)
 
         return all_data
 
 
     def split_documents(self, documents):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
         return text_splitter.split_documents(documents)
 
 
+    def _replace_source(self, vector_database, pipeline, manifest, source, content_hash, documents):
+        """Delete the chunks previously indexed for a source and queue its new content"""
+        old_ids = manifest.chunk_ids(source)
+        if old_ids:
+            vector_database._collection.delete(ids=old_ids)
+        elif source not in manifest.sources():
+            # Databases built before the manifest existed only know their chunks by source metadata
+            vector_database._collection.delete(where={"source": source})
+
+        # Prefix IDs with the source and content hash so rerunning an interrupted refresh overwrites instead of duplicating
+        id_prefix = f"{text_hash(source)[:8]}-{content_hash[:16]}"
+        manifest.update(source, content_hash, pipeline.add_documents(documents, id_prefix=id_prefix))
+
+    def _sync_index(self, vector_database):
+        """Bring the vector database in line with the current PDFs and webpages, re-parsing and
+        re-embedding only new or changed sources and deleting chunks of removed ones"""
+        doc_folder_path = self.doc_folder_path
+        manifest = IndexManifest(self._manifest_path())
+        pipeline = IngestionPipeline(vector_database, embedding_model, self.split_documents, name=self.name)
+        seen_sources = set()
+        unchanged = 0
+        updated = 0
+
+        # Each webpage is rendered once, on first use, for both its PDF links and its text
+        pages = RenderedPages(self.urls)
+
+        # Download the PDFs linked from UTAR webpages
+        start = time.perf_counter()
+        self.scrape_web_pdfs(self.urls, self.department, pages=pages)
+        pipeline.record("download", time.perf_counter() - start)
+
+        print(f"Looking for PDFs in: {doc_folder_path}")
+        if not os.path.exists(doc_folder_path):
+            logging.error(f"Folder not found: {doc_folder_path}")
+            return None
+
+        # Hash every PDF, only new or changed ones are parsed. Downloaded PDFs reuse the checksum
+        # taken while downloading them
+        downloads = DownloadManifest(doc_folder_path)
+        changed_pdfs = {}
+        for pdf_file in glob.glob(os.path.join(doc_folder_path, "*.pdf")):
+            source = os.path.basename(pdf_file)
+            seen_sources.add(source)
+            content_hash = downloads.checksum(pdf_file)
+            if manifest.is_current(source, content_hash):
+                unchanged += 1
+            else:
+                changed_pdfs[pdf_file] = content_hash
+
+        # Parse PDFs in worker processes, streaming each file's chunks into the database as it is parsed
+        start = time.perf_counter()
+        for i, (pdf_file, data) in enumerate(iter_parsed_pdfs(list(changed_pdfs), content_hashes=changed_pdfs)):
+            print(f"Loaded PDF {i+1}/{len(changed_pdfs)}: {pdf_file}")
+            self._replace_source(vector_database, pipeline, manifest, os.path.basename(pdf_file), changed_pdfs[pdf_file], data)
+            updated += 1
+        pipeline.record("parse", time.perf_counter() - start)
+
+        # Scrape data from UTAR website
+        start = time.perf_counter()
+        scraped_data = self.scrape_webpage(self.urls, pages=pages)
+        pipeline.record("scrape", time.perf_counter() - start)
+        for doc in scraped_data or []:
+            source = doc.metadata["source"]
+            seen_sources.add(source)
+            content_hash = text_hash(doc.page_content)
+            if manifest.is_current(source, content_hash):
+                unchanged += 1
+            else:
+                self._replace_source(vector_database, pipeline, manifest, source, content_hash, [doc])
+                updated += 1
+
+        # Delete chunks of sources that no longer exist
+        removed_sources = manifest.sources() - seen_sources
+        for source in removed_sources:
+            old_ids = manifest.remove(source)
+            if old_ids:
+                vector_database._collection.delete(ids=old_ids)
+
+        pipeline.close()
+        manifest.save()
+
+        logging.info(f"Index for {self.name}: {updated} sources re-embedded, {unchanged} unchanged, {len(removed_sources)} removed")
+        return {"updated": updated, "unchanged": unchanged, "removed": len(removed_sources)}
+
+    def _manifest_path(self):
+        if self.unified_index is not None:
+            return self.unified_index.manifest_path(self.index_name)
+        return os.path.join(self.vector_db_path, MANIFEST_FILE_NAME)
+
+    def index_exists(self):
+        """Whether a built index exists for the agent, so loading it does not trigger a build"""
+        if self.unified_index is not None and os.path.exists(self.unified_index.path):
+            return True
+        return bool(self.vector_db_path) and os.path.exists(self.vector_db_path)
+
+    def _load_unified_view(self):
+        """The agent's slice of the unified index. An empty slice is filled from the agent's own
+        database if one exists (without re-embedding), otherwise it is built from the sources.
+        A slice with an index manifest was built, so it is served even when empty (no sources)"""
+        view = self.unified_index.view(self.index_name)
+        if view.count() == 0 and not os.path.exists(self.unified_index.manifest_path(self.index_name)):
+            if os.path.exists(self.vector_db_path):
+                self.unified_index.migrate(self.index_name, self.vector_db_path)
+            elif not INDEX_BUILD_ON_DEMAND:
+                raise FileNotFoundError(f"No index for {self.index_name} in {self.unified_index.path}, build one with build_index.py")
+            else:
+                print(f"Indexing {self.department} into the unified vector database...")
+                if self._sync_index(view) is None:
+                    return None
+        return view
+
+    def _numpy_store_path(self):
+        return f"{self.vector_db_path}.numpy"
+
+    def _index_stamp(self):
+        """Identifies the state of the agent's Chroma data: the hash of its index manifest, which every
+        refresh rewrites. None for databases built before the manifest existed"""
+        manifest_path = self._manifest_path()
+        return file_hash(manifest_path) if os.path.exists(manifest_path) else None
+
+    def _numpy_store_current(self):
+        """Whether a numpy export exists and was exported from the Chroma data it sits next to"""
+        path = self._numpy_store_path()
+        return NumpyVectorStore.exists(path) and NumpyVectorStore.source_stamp(path) == self._index_stamp()
+
+    def _serving_store(self, vector_database, export=False):
+        """The store queries are answered from. With the numpy backend that is the numpy export of the
+        index, written only when export is set (on refresh): serving workers must not write into
+        published releases. Falls back to Chroma when there is no matching export or it fails"""
+        if self.vector_backend != "numpy":
+            return vector_database
+        try:
+            if export:
+                return NumpyVectorStore.export(vector_database, self._numpy_store_path(), embedding_model,
+                                               dtype=NUMPY_VECTOR_DTYPE, source_stamp=self._index_stamp())
+            if self._numpy_store_current():
+                return NumpyVectorStore(self._numpy_store_path(), embedding_model)
+            logging.warning(f"No numpy vector store for {self.name} matching its index, serving from Chroma. "
+                            f"Export one with build_index.py --numpy")
+        except Exception as e:
+            logging.error(f"Failed to {'export' if export else 'open'} the numpy vector store of {self.name}, serving from Chroma: {e}")
+        return vector_database
+
     def _load_vector_db(self):
 
         """Load vector database from the defined path"""            
         try:
+            if self.vector_backend == "numpy" and self._numpy_store_current():
+                print(f"Mapping numpy vector store for {self.department} from {self._numpy_store_path()}...")
+                return NumpyVectorStore(self._numpy_store_path(), embedding_model)
+
+            # Imported here so workers serving only numpy stores never load Chroma
+            from langchain_chroma import Chroma
+
+            if self.unified_index is not None:
+                view = self._load_unified_view()
+                return self._serving_store(view) if view is not None else None
+
             if os.path.exists(self.vector_db_path):
                 print(f"Loading vector database for {self.department} from {self.vector_db_path}...")
 
@@ -222,68 +395,296 @@ class BaseAgent:
                     persist_directory=self.vector_db_path, 
                     embedding_function=embedding_model
                 )
+            elif not INDEX_BUILD_ON_DEMAND:
+                raise FileNotFoundError(f"No index at {self.vector_db_path}, build one with build_index.py")
             else:
                 print(f"Creating vector database for {self.department}...")
-                doc_folder_path = f"/var/data/{self.department}"
-
-                # Load PDF data
-                pdf_data = self.ingest_pdf(doc_folder_path)
-                if pdf_data is None:
-                    return None
-                
-                # Scrape data from UTAR website
-                scraped_data = self.scrape_webpage(self.urls)
-
-                # Combine both
-                combined_texts = []
-                if pdf_data:
-                    combined_texts.extend(pdf_data)
-                if scraped_data:
-                    combined_texts.extend(scraped_data)
-
-                # Chunk the combined text content
-                chunks = self.split_documents(combined_texts)
-
-                for i, chunk in enumerate(chunks[:5]):
-                    print(f"Chunk {i+1}")
-                    print("Text:", chunk.page_content[:200])
-                    print("Source:", chunk.metadata.get("source"))
-                    print("Metadata:", chunk.metadata)
-                    print("------")
-
-                vector_database = Chroma.from_documents(
-                    documents=chunks,
-                    embedding=embedding_model,
-                    persist_directory=self.vector_db_path
+                vector_database = Chroma(
+                    persist_directory=self.vector_db_path,
+                    embedding_function=embedding_model
                 )
+                if self._sync_index(vector_database) is None:
+                    # Do not leave an empty database behind, it would be loaded as-is next time
+                    shutil.rmtree(self.vector_db_path, ignore_errors=True)
+                    return None
+                return self._serving_store(vector_database, export=True)
 
-            return vector_database
+            return self._serving_store(vector_database)
         
         except Exception as e:
             logging.error(f"Failed to load Vector Database for {self.name}: {e}")
+            self.load_error = str(e)
             return None
-        
-    def retrieve_context(self, query, k=3):
-        """Retrieve context relevant and related to the user query"""
+
+    def refresh_index(self):
+        """Incrementally re-index the agent's sources, only re-embedding new or changed PDFs and pages.
+        Returns a summary of updated, unchanged and removed sources, or None on failure"""
+        from langchain_chroma import Chroma
+
+        with self._init_lock:
+            try:
+                # A numpy store is read-only, the refresh goes through Chroma and is exported again
+                if self.unified_index is not None:
+                    vector_database = self.unified_index.view(self.index_name)
+                else:
+                    vector_database = self.vector_db if isinstance(self.vector_db, Chroma) else Chroma(
+                        persist_directory=self.vector_db_path,
+                        embedding_function=embedding_model
+                    )
+                summary = self._sync_index(vector_database)
+            except Exception as e:
+                logging.error(f"Failed to refresh Vector Database for {self.name}: {e}")
+                return None
+
+            if summary is not None:
+                self.vector_db = self._serving_store(vector_database, export=True)
+                self.index_version += 1
+                self._is_initialized = True
+                self.load_state = "ready"
+            return summary
+
+    def switch_index(self, vector_db_path, unified_index=None):
+        """Serve from another built index, e.g. a newly published release. A loaded agent opens the new
+        index before swapping it in, so queries are answered from the old one until then.
+        Returns False, keeping the current index, if the new one cannot be loaded"""
+        with self._init_lock:
+            previous = self.vector_db_path, self.unified_index
+            self.vector_db_path = vector_db_path
+            self.unified_index = unified_index
+            if not self._is_initialized:
+                self._retry_at = 0.0  # a load that failed for want of an index can be retried right away
+                return True
+
+            vector_db = self._load_vector_db()
+            if vector_db is None:
+                self.vector_db_path, self.unified_index = previous
+                return False
+            self.vector_db = vector_db
+            self.index_version += 1
+            return True
+
+    def retrieve_context(self, query, k=3, query_embedding=None):
+        """Retrieve context relevant and related to the user query.
+        If the query has already been embedded (e.g. by the router), the embedding is reused."""
         if not self.vector_db:
             logging.warning(f"There is no Vector Database available for {self.name}")
             return []
             
         try:
-            docs = self.vector_db.similarity_search(query, k=k)
-            return docs
+            with metrics.span("retrieve", self.name):
+                if RETRIEVAL_MODE == "hybrid":
+                    return self._hybrid_search(query, k, query_embedding)
+                return self._vector_search(query, k, query_embedding)
         except Exception as e:
             logging.error(f"Failed to retrieve context for the query: {e}")
             return []
+
+    def _vector_search(self, query, k, query_embedding=None):
+        if query_embedding is not None:
+            return self.vector_db.similarity_search_by_vector(query_embedding, k=k)
+        return self.vector_db.similarity_search(query, k=k)
+
+    def retrieve_batch(self, queries, query_embeddings, k=3):
+        """Retrieve context for many queries at once. Dense retrieval searches every query vector in one call,
+        hybrid retrieval scores the queries one by one"""
+        if not self.vector_db:
+            logging.warning(f"There is no Vector Database available for {self.name}")
+            return [[] for _ in queries]
+
+        try:
+            if RETRIEVAL_MODE == "hybrid":
+                return [self._hybrid_search(query, k, embedding) for query, embedding in zip(queries, query_embeddings)]
+            if hasattr(self.vector_db, "similarity_search_by_vectors"):
+                return self.vector_db.similarity_search_by_vectors(query_embeddings, k=k)
+            return query_by_vectors(self.vector_db._collection, query_embeddings, k)
+        except Exception as e:
+            logging.error(f"Failed to retrieve context for a batch of {len(queries)} queries: {e}")
+            return [[] for _ in queries]
+
+    def get_bm25_index(self):
+        """The agent's BM25 index, built on first use and rebuilt when the vector database changes"""
+        with self._bm25_lock:
+            if self._bm25_index is None or self._bm25_version != self.index_version:
+                self._bm25_index = BM25Index.from_vector_db(self.vector_db)
+                self._bm25_version = self.index_version
+            return self._bm25_index
+
+    def _hybrid_search(self, query, k, query_embedding=None):
+        """Fuse BM25 and vector results with reciprocal-rank fusion. Queries that name an exact
+        identifier with a clear lexical winner skip the embedding call and vector search, unless BM25
+        found fewer than k chunks and the rest come from the vector results"""
+        bm25_index = self.get_bm25_index()
+        lexical_results = bm25_index.search(query, k=k * HYBRID_CANDIDATES_FACTOR)
+        lexical_docs = [bm25_index.document(position) for _, position in lexical_results]
+
+        if bm25_index.is_strong_keyword_hit(query, lexical_results, ratio=HYBRID_KEYWORD_RATIO):
+            logging.info(f"Lexical fast path for {self.name}")
+            docs = lexical_docs[:k]
+            if len(docs) < k:
+                seen = {doc.id for doc in docs}
+                docs += [doc for doc in self._vector_search(query, k, query_embedding) if doc.id not in seen][:k - len(docs)]
+            return docs
+
+        vector_docs = self._vector_search(query, k * HYBRID_CANDIDATES_FACTOR, query_embedding)
+        return reciprocal_rank_fusion([vector_docs, lexical_docs])[:k]
         
+    def get_references(self, contexts):
+        """Retrieve and store references used to generate a response"""
+        references = []
+        for doc in contexts:
+            source = doc.metadata.get("source", None)
+            if source and source not in references:
+                references.append(source)
+        return references
+
+    def build_messages(self, query, contexts, history):
+        """Build the chat messages sent to the model from the agent's prompt template, within the prompt token budget"""
+        if self.prompt_template is None:
+            return None
+
+        prompt = build_prompt(self.prompt_template, query, contexts, history, self.name)
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
     def generate_response(self, query, contexts, history):
         """Generate a response based on the query and contexts"""
-        # Base implementation
-        return f"Hello, I'm {self.name}. I don't have specific information related and relevant to the context of the query."
+        if not contexts and self.no_context_response:
+            return {
+                "response": self.no_context_response,
+                "references": []
+            }
+
+        messages = self.build_messages(query, contexts, history)
+        if messages is None:
+            # Base implementation
+            return {
+                "response": f"Hello, I'm {self.name}. I don't have specific information related and relevant to the context of the query.",
+                "references": []
+            }
+
+        try:
+            with metrics.span("generate", self.name):
+                response = get_chat_client().chat.completions.create(
+                    model=OPENAI_MODEL_NAME,
+                    messages=messages
+                )
+            metrics.record_usage(self.name, response.usage)
+            return {
+                "response": response.choices[0].message.content.strip(),
+                "references": self.get_references(contexts)
+            }
+        except Exception as e:
+            logging.error(f"Failed to generate response: {e}")
+            return {
+            "response": GENERATION_ERROR_MESSAGE,
+            "references": []
+        }
+
+    async def ainitialize(self):
+        """Async variant of initialize. Loading is disk and CPU bound, so it runs in a worker thread"""
+        await asyncio.to_thread(self.initialize)
+
+    async def aretrieve_context(self, query, k=3, query_embedding=None):
+        """Async variant of retrieve_context. Chroma searches locally, so it runs in a worker thread"""
+        if query_embedding is None and self.vector_db:
+            # Embed with the async client so the event loop is not blocked on the OpenAI round-trip
+            try:
+                with metrics.span("embed"):
+                    query_embedding = await embedding_model.aembed_query(query)
+            except Exception as e:
+                logging.error(f"Failed to embed the query: {e}")
+                return []
+        return await asyncio.to_thread(self.retrieve_context, query, k, query_embedding)
+
+    async def agenerate_response(self, query, contexts, history):
+        """Async variant of generate_response using the pooled async OpenAI client"""
+        if not contexts and self.no_context_response:
+            return {
+                "response": self.no_context_response,
+                "references": []
+            }
+
+        messages = self.build_messages(query, contexts, history)
+        if messages is None:
+            return self.generate_response(query, contexts, history)
+
+        try:
+            with metrics.span("generate", self.name):
+                response = await get_async_chat_client().chat.completions.create(
+                    model=OPENAI_MODEL_NAME,
+                    messages=messages
+                )
+            metrics.record_usage(self.name, response.usage)
+            return {
+                "response": response.choices[0].message.content.strip(),
+                "references": self.get_references(contexts)
+            }
+        except Exception as e:
+            logging.error(f"Failed to generate response: {e}")
+            return {
+            "response": GENERATION_ERROR_MESSAGE,
+            "references": []
+        }
+
+    def stream_response(self, query, contexts, history):
+        """Generate a response as a stream of text chunks from the OpenAI streaming API"""
+        if not contexts and self.no_context_response:
+            yield self.no_context_response
+            return
+
+        messages = self.build_messages(query, contexts, history)
+        if messages is None:
+            yield f"Hello, I'm {self.name}. I don't have specific information related and relevant to the context of the query."
+            return
+
+        start = time.perf_counter()
+        try:
+            # With metrics on, the last chunk carries the token usage
+            stream = get_chat_client().chat.completions.create(
+                model=OPENAI_MODEL_NAME,
+                messages=messages,
+                stream=True,
+                **({"stream_options": {"include_usage": True}} if metrics.METRICS_ENABLED else {})
+            )
+            first_token = True
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        metrics.observe("first_token", time.perf_counter() - start, self.name)
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    metrics.record_usage(self.name, chunk.usage)
+        except Exception as e:
+            logging.error(f"Failed to stream response: {e}")
+            yield GENERATION_ERROR_MESSAGE
+        finally:
+            metrics.observe("generate", time.perf_counter() - start, self.name)
 
 
 class AdmissionsAgent(BaseAgent):
     """An Agent class which is specialized in handling admissions queries and questions"""
+
+    no_context_response = "I don't have specific information about that admissions question. Please contact the Division of Admissions directly."
+    system_prompt = "You are a helpful university admissions assistant."
+    prompt_template = """You are an admissions assistant at a university named University Tunku Abdul Rahman or UTAR. Your name is {name}.
+Use the following context to answer the question concisely and helpfully, you need to answer the question
+based on context.
+
+Conversation history:
+{history}
+
+Context:
+{context}
+
+Question: {query}
+
+Respond as a knowledgeable admissions professional. Be helpful but concise.
+Only answer based on the given context and the given conversation history.
+When interpreting questions, refer back to the conversation history to resolve pronouns or implied references.
+If you cannot find an answer, politely tell the user to contact the Division of Admissions and Credit Evaluation."""
     
     def __init__(self):
         super().__init__(
@@ -296,65 +697,27 @@ class AdmissionsAgent(BaseAgent):
                 "https://admission.utar.edu.my/Entry-Qualifications-and-English-Language-Requirements.php"
             ]
         )
-    
-    def generate_response(self, query, contexts, history):
-        """Generate responses that is related to admissions queries"""
-        if not contexts:
-            return {
-                "response": "I don't have specific information about that admissions question. Please contact the Division of Admissions directly.",
-                "references": []
-            }
-                
-        # Retrieve and store references used to generate a response
-        references = []
-        for doc in contexts:
-            source = doc.metadata.get("source", None)
-            if source and source not in references:
-                references.append(source)
 
-        # Retrieve conversation history of the session
-        formatted_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in history[-6:]])
-        
-        combined_context = "\n\n---\n\n".join(doc.page_content for doc in contexts)
-        prompt = f"""You are an admissions assistant at a university named University Tunku Abdul Rahman or UTAR. Your name is {self.name}.
-        Use the following context to answer the question concisely and helpfully, you need to answer the question
-        based on context.
+class FinanceAgent(BaseAgent):
+    """An Agent class which is specialized in handling finance queries"""
 
-        Conversation history:
-        {formatted_history}
+    no_context_response = "I don't have specific information about that financial question. Please contact the Division of Finance directly."
+    system_prompt = "You are a precise university financial advisor."
+    prompt_template = """You are a financial advisor at a university named University Tunku Abdul Rahman or UTAR. Your name is {name}.
+Use the following context to answer the question precisely and accurately.
 
-        Context:
-        {combined_context}
-        
-        Question: {query}
-        
-        Respond as a knowledgeable admissions professional. Be helpful but concise.
-        Only answer based on the given context and the given conversation history. 
-        When interpreting questions, refer back to the conversation history to resolve pronouns or implied references. 
-        If you cannot find an answer, politely tellthe user to contact the Division of Admissions and Credit Evaluation.
-        """
-        
-        try:
-            response = chat_client.chat.completions.create(
-                model=OPENAI_MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a helpful university admissions assistant."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return {
-                "response": response.choices[0].message.content.strip(),
-                "references": references
-            }
-        except Exception as e:
-            logging.error(f"Failed to generate response: {e}")
-            return {
-            "response": "Sorry, something went wrong while generating the answer.",
-            "references": []
-        }
+Conversation history:
+{history}
 
-class FinanceAgent(BaseAgent):
-    """An Agent class which is specialized in handling finance queries"""
+Context:
+{context}
+
+Question: {query}
+
+Respond as a precise and detail-oriented finance professional. Mention specific
+numbers and dates when available. Only answer based on the given context and the given conversation history.
+When interpreting questions, refer back to the conversation history to resolve pronouns or implied references.
+If you can't find an answer, politely direct the user to contact the Division of Finance."""
     
     def __init__(self):
         super().__init__(
@@ -367,64 +730,28 @@ class FinanceAgent(BaseAgent):
                 "https://dfn.utar.edu.my/DFN-3.php"
             ]
         )
-        
-    def generate_response(self, query, contexts, history):
-        """Generate finance-specific responses"""
-        if not contexts:
-            return {
-                "response": "I don't have specific information about that financial question. Please contact the Division of Finance directly.",
-                "references": []
-            }
-                
-        # Retrieve and store references used to generate a response
-        references = []
-        for doc in contexts:
-            source = doc.metadata.get("source", None)
-            if source and source not in references:
-                references.append(source)
 
-        # Retrieve conversation history of the session
-        formatted_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in history[-6:]])
+class ExaminationAgent(BaseAgent):
+    """An Agent class which is specialized in handling examination, academic and course queries"""
 
-        combined_context = "\n\n---\n\n".join(doc.page_content for doc in contexts)
-        prompt = f"""You are a financial advisor at a university named University Tunku Abdul Rahman or UTAR. Your name is {self.name}.
-        Use the following context to answer the question precisely and accurately.
+    no_context_response = "I don't have specific information about that academic question. Please contact the Department of Examination and Awards directly."
+    system_prompt = "You are a helpful university academic coordinator."
+    prompt_template = """You are an academic coordinator at a university named University Tunku Abdul Rahman or UTAR. Your name is {name}.
+Use the following context to answer the question clearly and informatively.
 
-        Conversation history:
-        {formatted_history}
-        
-        Context:
-        {combined_context}
-        
-        Question: {query}
-        
-        Respond as a precise and detail-oriented finance professional. Mention specific 
-        numbers and dates when available. Only answer based on the given context and the given conversation history.
-        When interpreting questions, refer back to the conversation history to resolve pronouns or implied references. 
-        If you can't find an answer, politely direct the user to contact the Division of Finance.
-        """
-        
-        try:
-            response = chat_client.chat.completions.create(
-                model=OPENAI_MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a precise university financial advisor."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return {
-                "response": response.choices[0].message.content.strip(),
-                "references": references
-            }
-        except Exception as e:
-            logging.error(f"Failed to generate response: {e}")
-            return {
-            "response": "Sorry, something went wrong while generating the answer.",
-            "references": []
-        }
+Conversation history:
+{history}
 
-class ExaminationAgent(BaseAgent):
-    """An Agent class which is specialized in handling examination, academic and course queries"""
+Context:
+{context}
+
+Question: {query}
+
+Respond as a knowledgeable academic professional. Be educational but approachable.
+Only answer based on the given context and based on the given conversation history.
+When interpreting questions, refer back to the conversation history to resolve pronouns or implied references.
+If you can't find an answer, politely direct the user
+to contact the Department of Examination and Awards."""
     
     def __init__(self):
         super().__init__(
@@ -437,67 +764,22 @@ class ExaminationAgent(BaseAgent):
                 "https://deas.utar.edu.my/Home.php"
             ]
         )
-        
-    def generate_response(self, query, contexts, history):
-        """Generate academic-specific responses"""
-        if not contexts:
-            return {
-                "response": "I don't have specific information about that academic question. Please contact the Department of Examination and Awards directly.",
-                "references": []
-            }
-        
-        # Retrieve and store references used to generate a response
-        references = []
-        for doc in contexts:
-            source = doc.metadata.get("source", None)
-            if source and source not in references:
-                references.append(source)
-        
-        # Retrieve conversation history of the session
-        formatted_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in history[-6:]])
 
-        print("Formatted history for agent: ", formatted_history)
+class GeneralAgent(BaseAgent):
+    """General agent for handling queries that do not fit any specific department"""
 
-        combined_context = "\n\n---\n\n".join(doc.page_content for doc in contexts)
-        prompt = f"""You are an academic coordinator at a university named University Tunku Abdul Rahman or UTAR. Your name is {self.name}.
-        Use the following context to answer the question clearly and informatively.
-        
-        Conversation history:
-        {formatted_history}
+    system_prompt = "You are a helpful university information assistant."
+    prompt_template = """You are a general university information assistant for a university named University Tunku Abdul Rahman or UTAR. Your name is {name}.
+Use the following context and conversation history to answer the question concisely and helpfully, you need to answer the question
+based on context.
 
-        Context:
-        {combined_context}
-        
-        Question: {query}
-        
-        Respond as a knowledgeable academic professional. Be educational but approachable.
-        Only answer based on the given context and based on the given conversation history.
-        When interpreting questions, refer back to the conversation history to resolve pronouns or implied references.
-        If you can't find an answer, politely direct the user 
-        to contact the Department of Examination and Awards.
-        """
-        
-        try:
-            response = chat_client.chat.completions.create(
-                model=OPENAI_MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a helpful university academic coordinator."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return {
-                "response": response.choices[0].message.content.strip(),
-                "references": references
-            }
-        except Exception as e:
-            logging.error(f"Failed to generate response: {e}")
-            return {
-            "response": "Sorry, something went wrong while generating the answer.",
-            "references": []
-        }
+Conversation history:
+{history}
 
-class GeneralAgent(BaseAgent):
-    """General agent for handling queries that do not fit any specific department"""
+Question: {query}
+
+Respond as a helpful university assistant. For this query, if you do not have any specific information,
+then you should provide a general response and suggest which department might help."""
     
     def __init__(self):
         super().__init__(
@@ -506,48 +788,3 @@ class GeneralAgent(BaseAgent):
             vector_db_path="/var/data/vector_db/general",
             department="General"
         )
-        
-    def generate_response(self, query, contexts, history):
-        """Generate general responses for the user query"""
-
-        # Retrieve and store references used to generate a response
-        references = []
-        for doc in contexts:
-            source = doc.metadata.get("source", None)
-            if source and source not in references:
-                references.append(source)
-
-        # Retrieve conversation history of the session
-        formatted_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in history[-6:]])
-        
-        prompt = f"""You are a general university information assistant for a university named University Tunku Abdul Rahman or UTAR. Your name is {self.name}.
-        Use the following context and conversation history to answer the question concisely and helpfully, you need to answer the question
-        based on context.
-
-        Conversation history:
-        {formatted_history}
-        
-        Question: {query}
-        
-        Respond as a helpful university assistant. For this query, if you do not have any specific information,
-        then you should provide a general response and suggest which department might help.
-        """
-        
-        try:
-            response = chat_client.chat.completions.create(
-                model=OPENAI_MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a helpful university information assistant."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return {
-                "response": response.choices[0].message.content.strip(),
-                "references": references
-            }
-        except Exception as e:
-            logging.error(f"Failed to generate response: {e}")
-            return {
-            "response": "Sorry, something went wrong while generating the answer.",
-            "references": []
-        }
\ No newline at end of file
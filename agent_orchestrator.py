@@ -1,133 +1,641 @@
 import os
+import time
+import asyncio
 import logging
-from openai import OpenAI
-from agent_classes import AdmissionsAgent, FinanceAgent, ExaminationAgent, GeneralAgent
+import threading
+import contextvars
+import metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agent_classes import AdmissionsAgent, FinanceAgent, ExaminationAgent, GeneralAgent, embedding_model, get_chat_client, get_async_chat_client, GENERATION_ERROR_MESSAGE
+from agent_router import EmbeddingRouter
+from response_cache import SemanticResponseCache, has_unresolved_references
+from unified_index import UnifiedIndex
+from index_releases import IndexReleases
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-chat_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY_CHAT"))
 OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
 
+# Routing mode: "llm" asks the chat model on every query, "embedding" scores the query locally
+# and only falls back to the LLM when the top-two agent margin is below the threshold
+ROUTER_MODE = os.getenv("ROUTER_MODE", "llm").lower()
+ROUTER_MARGIN_THRESHOLD = float(os.getenv("ROUTER_MARGIN_THRESHOLD", "0.03"))
+
+# Semantic answer cache in front of retrieval and generation
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+# Speculatively retrieve context for every loaded agent while the router call is in flight
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "8"))
+
+# Background preloading of the agents' vector databases at boot
+PRELOAD_ORDER = os.getenv("PRELOAD_ORDER", "")  # e.g. "finance,admissions,examinations,general"
+PRELOAD_WORKERS = int(os.getenv("PRELOAD_WORKERS", "1"))
+PRELOAD_WAIT_TIMEOUT = float(os.getenv("PRELOAD_WAIT_TIMEOUT", "300"))
+
+# Batch answering (/chat/batch): generation calls in flight at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+# Store every department in one Chroma collection, filtered by a department metadata field
+UNIFIED_INDEX = os.getenv("UNIFIED_INDEX", "false").lower() == "true"
+UNIFIED_INDEX_PATH = os.getenv("UNIFIED_INDEX_PATH", "/var/data/vector_db/unified")
+# With the unified index and embedding routing, search all departments when the router cannot tell them apart
+CROSS_DEPARTMENT_RETRIEVAL = os.getenv("CROSS_DEPARTMENT_RETRIEVAL", "false").lower() == "true"
+
+# Index releases built offline by build_index.py. While one is published the agents serve from it, and a newly
+# published release is swapped in without a restart. Checked every INDEX_RELEASE_CHECK_SECONDS (0 disables)
+INDEX_RELEASES_PATH = os.getenv("INDEX_RELEASES_PATH", "/var/data/index_releases")
+INDEX_RELEASE_CHECK_SECONDS = float(os.getenv("INDEX_RELEASE_CHECK_SECONDS", "30"))
+
+
+def create_agents():
+    """The specialized agents, followed by the general agent as the last candidate to answer
+    a query when no specialized agent is relevant"""
+    return [AdmissionsAgent(), FinanceAgent(), ExaminationAgent(), GeneralAgent()]
+
+
 class AgentOrchestrator:
     """An agent that manages multiple specialized agents and routes queries to the appropriate one"""
 
     
     def __init__(self):
         self.agents = []
+        self.unified_index = UnifiedIndex(UNIFIED_INDEX_PATH, embedding_model) if UNIFIED_INDEX else None
         self.initialize_agents()
+        self.router = EmbeddingRouter(self.agents)
+        self.releases = IndexReleases(INDEX_RELEASES_PATH)
+        self.index_release = None
+        release = self.releases.current()
+        if release:
+            try:
+                self.switch_release(release)
+            except Exception as e:
+                logging.error(f"Failed to use index release {release}: {e}")
+        if INDEX_RELEASE_CHECK_SECONDS > 0:
+            threading.Thread(target=self._watch_releases, name="index-releases", daemon=True).start()
+        self.response_cache = SemanticResponseCache(
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+            similarity_threshold=RESPONSE_CACHE_SIMILARITY
+        ) if RESPONSE_CACHE_ENABLED else None
+        self.executor = ThreadPoolExecutor(
+            max_workers=SPECULATIVE_WORKERS,
+            thread_name_prefix="speculative-retrieval"
+        ) if SPECULATIVE_RETRIEVAL else None
+        self.preload_status = {}  # agent name -> preload state and timings
+        self.preload_events = {}  # agent name -> set once its preload has finished
         
 
     def initialize_agents(self):
         """Initialize all available agents"""
-        # Add specialized agents
-        self.agents.append(AdmissionsAgent())
-        self.agents.append(FinanceAgent())
-        self.agents.append(ExaminationAgent())
-        
-        # Add the general agent as the last candidate to answer query if no relevant and related specified agents found
-        self.agents.append(GeneralAgent())
-        
+        self.agents.extend(create_agents())
+
         # Initialize each agent
         for agent in self.agents:
+            agent.unified_index = self.unified_index
             logging.info(f"Initialized agent: {agent.name}")
             
-    def get_agent_for_query(self, query):
-        """Find the most appropriate agent to handle a query using LLM"""
+    def switch_release(self, version):
+        """Serve every agent from a published index release. Loaded agents open their new index before
+        swapping it in, agents not loaded yet load it when first needed. Returns whether all agents switched"""
+        info = self.releases.read(version)
+        if info.get("unified", False) != UNIFIED_INDEX:
+            logging.error(f"Index release {version} does not match UNIFIED_INDEX={UNIFIED_INDEX}, not switching to it")
+            return False
+
+        folder = self.releases.vector_db_folder(version)
+        unified_index = UnifiedIndex(os.path.join(folder, "unified"), embedding_model) if UNIFIED_INDEX else None
+        failed = []
+        for agent in self.agents:
+            vector_db_path = os.path.join(folder, agent.index_name)
+            if agent.vector_db_path == vector_db_path:
+                continue  # switched on an earlier attempt
+            if not agent.switch_index(vector_db_path, unified_index):
+                failed.append(agent.name)
+
+        if failed:
+            logging.error(f"Could not switch {', '.join(failed)} to index release {version}, retrying on the next check")
+            return False
+        self.unified_index = unified_index
+        self.index_release = version
+        self.router.invalidate()
+        logging.info(f"Serving index release {version}")
+        return True
+
+    def _watch_releases(self):
+        while True:
+            time.sleep(INDEX_RELEASE_CHECK_SECONDS)
+            version = self.releases.current()
+            if version and version != self.index_release:
+                try:
+                    self.switch_release(version)
+                except Exception as e:
+                    logging.error(f"Failed to switch to index release {version}: {e}")
+
+    def _build_router_messages(self, query):
+        """Build the chat messages asking the LLM to pick an agent for the query"""
+        # Create agent descriptions for the LLM
+        agent_descriptions = []
+        for i, agent in enumerate(self.agents):
+            agent_descriptions.append(f"Agent {i+1}: {agent.name} - {agent.description}")
+        
+        agent_info = "\n".join(agent_descriptions)
+        
+        prompt = f"""You are a router that determines which university agent should handle a user query.
+        
+        Available agents:
+        {agent_info}
+
+        User query: "{query}"
+
+        ROUTING INSTRUCTIONS:
+        1. Examine both the TOPIC and CONTEXT of the query carefully
+        2. Look for department-specific keywords and subjects (admissions, finance/fees/scholarships, exams/courses)
+        3. If the query relates to a department's core responsibility area, route to that department EVEN IF some terms are unfamiliar
+        4. Examples of routing logic:
+        - Questions about exam procedures, exam rules, exam requirements, or anything happening during exams → Department of Examination and Awards
+        - Questions about admissions process, applications, entry requirements → Division of Admissions
+        - Questions about fees, payments, scholarships, financial aid → Division of Finance
+        5. Only route to the General Agent if the query clearly doesn't relate to the core responsibilities of any specialized department
+
+        Based on these instructions, respond ONLY with the appropriate agent designation (e.g., "Agent 1", "Agent 2", etc.) without any explanation.
+        """
+
+        return [
+            {"role": "system", "content": "You are a helpful router assistant that determines which specialized agent should handle a query."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _parse_agent_selection(self, agent_selection):
+        """Map the router's reply to an agent"""
+        agent_selection = agent_selection.strip().lower()
+
+        # Extract the agent number from the response
         try:
-            # Create agent descriptions for the LLM
-            agent_descriptions = []
-            for i, agent in enumerate(self.agents):
-                agent_descriptions.append(f"Agent {i+1}: {agent.name} - {agent.description}")
-            
-            agent_info = "\n".join(agent_descriptions)
-            
-            prompt = f"""You are a router that determines which university agent should handle a user query.
+            if "agent 1" in agent_selection:
+                selected_index = 0
+            elif "agent 2" in agent_selection:
+                selected_index = 1
+            elif "agent 3" in agent_selection:
+                selected_index = 2
+            else:
+                # Default to the general agent
+                selected_index = 3
             
-            Available agents:
-            {agent_info}
-
-            User query: "{query}"
-
-            ROUTING INSTRUCTIONS:
-            1. Examine both the TOPIC and CONTEXT of the query carefully
-            2. Look for department-specific keywords and subjects (admissions, finance/fees/scholarships, exams/courses)
-            3. If the query relates to a department's core responsibility area, route to that department EVEN IF some terms are unfamiliar
-            4. Examples of routing logic:
-            - Questions about exam procedures, exam rules, exam requirements, or anything happening during exams → Department of Examination and Awards
-            - Questions about admissions process, applications, entry requirements → Division of Admissions
-            - Questions about fees, payments, scholarships, financial aid → Division of Finance
-            5. Only route to the General Agent if the query clearly doesn't relate to the core responsibilities of any specialized department
-
-            Based on these instructions, respond ONLY with the appropriate agent designation (e.g., "Agent 1", "Agent 2", etc.) without any explanation.
-            """
+            selected_agent = self.agents[selected_index]
+            logging.info(f"LLM selected agent: {selected_agent.name}")
+            return selected_agent
             
+        except (ValueError, IndexError) as e:
+            logging.error(f"Error parsing agent selection: {e}. Using general agent.")
+            return self.agents[-1]  # Return the general agent as fallback
+
+    def get_agent_for_query(self, query):
+        """Find the most appropriate agent to handle a query using LLM"""
+        try:
             # Call the LLM to determine the appropriate agent
-            response = chat_client.chat.completions.create(
+            response = get_chat_client().chat.completions.create(
                 model=OPENAI_MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a helpful router assistant that determines which specialized agent should handle a query."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_router_messages(query),
                 temperature=0.0,  # Use low temperature for more deterministic results
                 max_tokens=10     # We only need a short response
             )
-            
-            agent_selection = response.choices[0].message.content.strip().lower()
-            
-            # Extract the agent number from the response
-            try:
-                if "agent 1" in agent_selection:
-                    selected_index = 0
-                elif "agent 2" in agent_selection:
-                    selected_index = 1
-                elif "agent 3" in agent_selection:
-                    selected_index = 2
-                else:
-                    # Default to the general agent
-                    selected_index = 3
-                
-                selected_agent = self.agents[selected_index]
-                logging.info(f"LLM selected agent: {selected_agent.name}")
-                return selected_agent
-                
-            except (ValueError, IndexError) as e:
-                logging.error(f"Error parsing agent selection: {e}. Using general agent.")
-                return self.agents[-1]  # Return the general agent as fallback
+            metrics.record_usage("router", response.usage)
+            return self._parse_agent_selection(response.choices[0].message.content)
                 
         except Exception as e:
             logging.error(f"Error in LLM agent selection: {e}")
             # Fallback to the general agent if there's any error
             return self.agents[-1]
 
+    async def aget_agent_for_query(self, query):
+        """Async variant of get_agent_for_query"""
+        try:
+            response = await get_async_chat_client().chat.completions.create(
+                model=OPENAI_MODEL_NAME,
+                messages=self._build_router_messages(query),
+                temperature=0.0,
+                max_tokens=10
+            )
+            metrics.record_usage("router", response.usage)
+            return self._parse_agent_selection(response.choices[0].message.content)
+
+        except Exception as e:
+            logging.error(f"Error in LLM agent selection: {e}")
+            return self.agents[-1]
+
+    def route_query(self, query, query_embedding=None):
+        """Select the agent for a query, returning the agent and the query embedding (None if not computed)"""
+        if ROUTER_MODE != "embedding":
+            return self.get_agent_for_query(query), None
+
+        try:
+            if query_embedding is None:
+                query_embedding = embedding_model.embed_query(query)
+            selected_index, margin = self.router.route(query_embedding)
+        except Exception as e:
+            logging.error(f"Error in embedding agent selection: {e}. Falling back to LLM routing.")
+            return self.get_agent_for_query(query), None
+
+        if margin < ROUTER_MARGIN_THRESHOLD:
+            logging.info(f"Embedding router margin {margin:.3f} below threshold, falling back to LLM routing")
+            return self.get_agent_for_query(query), query_embedding
+
+        selected_agent = self.agents[selected_index]
+        logging.info(f"Embedding router selected agent: {selected_agent.name} (margin {margin:.3f})")
+        return selected_agent, query_embedding
+
+    async def aroute_query(self, query):
+        """Async variant of route_query"""
+        if ROUTER_MODE != "embedding":
+            return await self.aget_agent_for_query(query), None
+
+        try:
+            query_embedding = await embedding_model.aembed_query(query)
+            # Off the event loop: the router (re)builds itself with embedding calls when it was invalidated
+            selected_index, margin = await asyncio.to_thread(self.router.route, query_embedding)
+        except Exception as e:
+            logging.error(f"Error in embedding agent selection: {e}. Falling back to LLM routing.")
+            return await self.aget_agent_for_query(query), None
+
+        if margin < ROUTER_MARGIN_THRESHOLD:
+            logging.info(f"Embedding router margin {margin:.3f} below threshold, falling back to LLM routing")
+            return await self.aget_agent_for_query(query), query_embedding
+
+        selected_agent = self.agents[selected_index]
+        logging.info(f"Embedding router selected agent: {selected_agent.name} (margin {margin:.3f})")
+        return selected_agent, query_embedding
+
+    def start_speculative_retrieval(self, query):
+        """Embed the query and retrieve context for every loaded agent in the background while routing is in flight.
+        Agents whose database is not loaded yet are skipped, so speculation never triggers a build"""
+        # Each task runs in a copy of the request's context, keeping its correlation ID and stage timings
+        embedding_future = self.executor.submit(contextvars.copy_context().run, embedding_model.embed_query, query)
+
+        def retrieve(agent):
+            return agent.retrieve_context(query, query_embedding=embedding_future.result())
+
+        retrievals = {
+            agent.name: self.executor.submit(contextvars.copy_context().run, retrieve, agent)
+            for agent in self.agents if agent.vector_db
+        }
+        return embedding_future, retrievals
+
+    def _speculative_embedding(self, speculation):
+        """Wait for the speculatively computed query embedding, or None if it failed"""
+        try:
+            return speculation[0].result()
+        except Exception as e:
+            logging.error(f"Speculative query embedding failed: {e}")
+            return None
+
+    def _discard_speculation(self, speculation, keep=None):
+        """Cancel speculative retrievals that have not started yet. Running ones finish and are ignored"""
+        for name, future in speculation[1].items():
+            if name != keep:
+                future.cancel()
+
+    def prepare_query(self, query, history, speculation=None):
+        """Route the query, make sure the agent's database is loaded and look up the answer cache.
+        Returns the agent, the query embedding (if computed), whether the answer may be cached and any cached response"""
+        # Select the appropriate agent, reusing the speculative embedding when routing by embedding
+        query_embedding = None
+        with metrics.span("route"):
+            if speculation is not None and ROUTER_MODE == "embedding":
+                query_embedding = self._speculative_embedding(speculation)
+            agent, query_embedding = self.route_query(query, query_embedding)
+        logging.info(f"Selected agent: {agent.name}")
+
+        if speculation is not None and query_embedding is None:
+            query_embedding = self._speculative_embedding(speculation)
+
+        # Lazy load the agent's vector database if not already loaded
+        with metrics.span("initialize", agent.name):
+            self.wait_for_preload(agent)
+            if not agent.vector_db:
+                logging.info(f"Loading vector database for {agent.name}...")
+                agent.initialize()
+
+        # Serve repeated standalone questions from the answer cache
+        cacheable = self.response_cache is not None and not has_unresolved_references(query, history)
+        cached_response = None
+        if cacheable:
+            if query_embedding is None:
+                with metrics.span("embed"):
+                    query_embedding = embedding_model.embed_query(query)
+            with metrics.span("cache_lookup", agent.name):
+                cached_response = self.response_cache.lookup(agent, query_embedding)
+
+        return agent, query_embedding, cacheable, cached_response
+
+    def _is_ambiguous(self, query_embedding):
+        """Whether ambiguous queries search all departments and the router cannot tell them apart for this one"""
+        if self.unified_index is None or not CROSS_DEPARTMENT_RETRIEVAL or ROUTER_MODE != "embedding" or query_embedding is None:
+            return False
+        try:
+            _, margin = self.router.route(query_embedding)
+        except Exception as e:
+            logging.error(f"Failed to score the query for cross-department retrieval: {e}")
+            return False
+        return margin < ROUTER_MARGIN_THRESHOLD
+
+    def retrieve_cross_department(self, query_embedding, k=3):
+        """Retrieve context from every department's slice of the unified index"""
+        logging.info("Ambiguous query, retrieving context across all departments")
+        try:
+            return self.unified_index.view(None).similarity_search_by_vector(query_embedding, k=k)
+        except Exception as e:
+            logging.error(f"Failed to retrieve cross-department context: {e}")
+            return []
+
+    def retrieve_context(self, agent, query, query_embedding, speculation=None):
+        """Retrieve context for the selected agent, using its speculative retrieval when one was started"""
+        if self._is_ambiguous(query_embedding):
+            if speculation is not None:
+                self._discard_speculation(speculation)
+            return self.retrieve_cross_department(query_embedding)
+
+        if speculation is not None:
+            self._discard_speculation(speculation, keep=agent.name)
+            if agent.name in speculation[1]:
+                try:
+                    return speculation[1][agent.name].result()
+                except Exception as e:
+                    logging.error(f"Speculative retrieval failed for {agent.name}: {e}")
+
+        return agent.retrieve_context(query, query_embedding=query_embedding)
+
     def process_query(self, query, history):
         """Process a user query through the appropriate agent"""
-        # Select the appropriate agent
-        agent = self.get_agent_for_query(query)
+        speculation = self.start_speculative_retrieval(query) if self.executor else None
+        agent, query_embedding, cacheable, response = self.prepare_query(query, history, speculation)
+
+        if response is None:
+            # Get context information and data from the agent's knowledge base
+            contexts = self.retrieve_context(agent, query, query_embedding, speculation)
+
+            # Generate the response from the agent
+            response = agent.generate_response(query, contexts, history)
+            if cacheable and response.get("response") != GENERATION_ERROR_MESSAGE:
+                self.response_cache.store(agent, query_embedding, response)
+        elif speculation is not None:
+            self._discard_speculation(speculation)
+
+        return {
+            "agent_name": agent.name,
+            "agent_description": agent.description,
+            "response": response
+        }
+
+    async def aprepare_query(self, query, history):
+        """Async variant of prepare_query"""
+        with metrics.span("route"):
+            agent, query_embedding = await self.aroute_query(query)
         logging.info(f"Selected agent: {agent.name}")
 
-        # Lazy load the agent's vector database if not already loaded
-        if not agent.vector_db:
-            logging.info(f"Loading vector database for {agent.name}...")
-            agent.initialize()
-        
-        # Get context information and data from the agent's knowledge base
-        contexts = agent.retrieve_context(query)
+        with metrics.span("initialize", agent.name):
+            await asyncio.to_thread(self.wait_for_preload, agent)
+            if not agent.vector_db:
+                logging.info(f"Loading vector database for {agent.name}...")
+                await agent.ainitialize()
+
+        cacheable = self.response_cache is not None and not has_unresolved_references(query, history)
+        cached_response = None
+        if cacheable:
+            if query_embedding is None:
+                with metrics.span("embed"):
+                    query_embedding = await embedding_model.aembed_query(query)
+            with metrics.span("cache_lookup", agent.name):
+                cached_response = self.response_cache.lookup(agent, query_embedding)
+
+        return agent, query_embedding, cacheable, cached_response
+
+    async def aprocess_query(self, query, history):
+        """Async variant of process_query, so one event loop can serve many in-flight chats"""
+        agent, query_embedding, cacheable, response = await self.aprepare_query(query, history)
+
+        if response is None:
+            # Scoring the query may rebuild the router, which embeds, so it runs in a thread too
+            ambiguous = self.unified_index is not None and await asyncio.to_thread(self._is_ambiguous, query_embedding)
+            if ambiguous:
+                contexts = await asyncio.to_thread(self.retrieve_cross_department, query_embedding)
+            else:
+                contexts = await agent.aretrieve_context(query, query_embedding=query_embedding)
+
+            response = await agent.agenerate_response(query, contexts, history)
+            if cacheable and response.get("response") != GENERATION_ERROR_MESSAGE:
+                self.response_cache.store(agent, query_embedding, response)
 
-        # Generate and return the response from the agent
         return {
             "agent_name": agent.name,
             "agent_description": agent.description,
-            "response": agent.generate_response(query, contexts, history)
+            "response": response
         }
+
+    def stream_query(self, query, history):
+        """Process a user query and yield events as the response is generated:
+        the selected agent first, then text chunks, then the complete response with its references"""
+        speculation = self.start_speculative_retrieval(query) if self.executor else None
+        agent, query_embedding, cacheable, response = self.prepare_query(query, history, speculation)
+        yield {"event": "agent", "data": {"name": agent.name, "description": agent.description}}
+
+        if response is None:
+            contexts = self.retrieve_context(agent, query, query_embedding, speculation)
+
+            chunks = []
+            for chunk in agent.stream_response(query, contexts, history):
+                chunks.append(chunk)
+                yield {"event": "token", "data": chunk}
+
+            response = {
+                "response": "".join(chunks).strip(),
+                "references": agent.get_references(contexts)
+            }
+            if response["response"].endswith(GENERATION_ERROR_MESSAGE):
+                response = {"response": GENERATION_ERROR_MESSAGE, "references": []}
+            elif cacheable:
+                self.response_cache.store(agent, query_embedding, response)
+        else:
+            if speculation is not None:
+                self._discard_speculation(speculation)
+            yield {"event": "token", "data": response["response"]}
+
+        yield {"event": "done", "data": response}
         
-    # def preload_all_databases(self):
-    #     """Preload all vector databases for faster response times"""
-    #     for agent in self.agents:
-    #         agent.initialize()
-
-    def preload_all_databases(self):
-        """DEPRECATED: This method is kept for backward compatibility but does nothing"""
-        logging.warning("preload_all_databases() is deprecated. Using lazy loading instead.")
-        pass
\ No newline at end of file
+    def _route_batch(self, queries, query_embeddings, executor):
+        """Agent index for every query: one vectorized embedding-router pass, with the LLM router
+        (run concurrently) for ambiguous queries, or for all of them in LLM routing mode"""
+        llm_routed = list(range(len(queries)))
+        selected = [len(self.agents) - 1] * len(queries)
+        if ROUTER_MODE == "embedding":
+            try:
+                indices, margins = self.router.route_batch(query_embeddings)
+                selected = [int(index) for index in indices]
+                llm_routed = [i for i, margin in enumerate(margins) if margin < ROUTER_MARGIN_THRESHOLD]
+            except Exception as e:
+                logging.error(f"Error in batch embedding agent selection: {e}. Falling back to LLM routing.")
+
+        futures = {executor.submit(self.get_agent_for_query, queries[i]): i for i in llm_routed}
+        for future in as_completed(futures):
+            selected[futures[future]] = self.agents.index(future.result())
+        return selected
+
+    def _answer(self, index, query, agent, contexts, query_embedding):
+        response = agent.generate_response(query, contexts, [])
+        if self.response_cache is not None and response.get("response") != GENERATION_ERROR_MESSAGE:
+            self.response_cache.store(agent, query_embedding, response)
+        return self._batch_result(index, query, agent, response)
+
+    def _batch_result(self, index, query, agent, response):
+        return {
+            "index": index,
+            "question": query,
+            "agent_name": agent.name,
+            "agent_description": agent.description,
+            "response": response
+        }
+
+    def process_batch(self, queries, concurrency=BATCH_CONCURRENCY):
+        """Answer many standalone questions, yielding results as they complete (each carries its index).
+        All queries are embedded in one request and routed in bulk, retrieval runs once per agent for
+        its whole group, and generation calls run with bounded concurrency"""
+        start = time.perf_counter()
+        query_embeddings = embedding_model.embed_documents(queries) if queries else []
+        logging.info(f"Embedded {len(queries)} batch queries in {time.perf_counter() - start:.2f}s")
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        try:
+            selected = self._route_batch(queries, query_embeddings, executor)
+
+            groups = {}
+            for i, agent_index in enumerate(selected):
+                groups.setdefault(agent_index, []).append(i)
+
+            futures = []
+            for agent_index, members in groups.items():
+                agent = self.agents[agent_index]
+                self.wait_for_preload(agent)
+                if not agent.vector_db:
+                    agent.initialize()
+
+                # Cached answers are returned right away, the rest is retrieved in one call for the group
+                pending = []
+                for i in members:
+                    cached = self.response_cache.lookup(agent, query_embeddings[i]) if self.response_cache is not None else None
+                    if cached is not None:
+                        yield self._batch_result(i, queries[i], agent, cached)
+                    else:
+                        pending.append(i)
+
+                ambiguous = {i for i in pending if self._is_ambiguous(query_embeddings[i])}
+                focused = [i for i in pending if i not in ambiguous]
+                contexts = dict(zip(focused, agent.retrieve_batch(
+                    [queries[i] for i in focused], [query_embeddings[i] for i in focused]
+                )))
+                for i in ambiguous:
+                    contexts[i] = self.retrieve_cross_department(query_embeddings[i])
+                logging.info(f"Retrieved context for {len(pending)} batch queries routed to {agent.name}")
+
+                for i in pending:
+                    futures.append(executor.submit(self._answer, i, queries[i], agent, contexts[i], query_embeddings[i]))
+
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # A client that disconnects mid-batch closes the generator, drop the questions not started yet
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        logging.info(f"Answered a batch of {len(queries)} queries in {time.perf_counter() - start:.2f}s")
+
+    def refresh_indexes(self, agent_names=None):
+        """Incrementally re-index the given agents (all by default), e.g. from a nightly refresh job.
+        Cached answers of refreshed agents are invalidated through their index version"""
+        summaries = {}
+        for agent in self.agents:
+            if agent_names is None or agent.name in agent_names:
+                summaries[agent.name] = agent.refresh_index()
+        self.router.invalidate()
+        return summaries
+
+    def _agents_in_order(self, order):
+        """Agents sorted by a comma-separated priority list of database names (e.g. "finance,admissions"),
+        unlisted agents keep their default order after the listed ones"""
+        priority = [name.strip().lower() for name in order.split(",") if name.strip()]
+
+        def rank(agent):
+            key = agent.index_name
+            return priority.index(key) if key in priority else len(priority)
+
+        return sorted(self.agents, key=rank)
+
+    def preload_all_databases(self, order=None, wait_for=None):
+        """Load the agents' vector databases in background threads in priority order and warm each one
+        with a synthetic query. Queries to an agent that is still loading wait for it instead of racing it.
+        wait_for is called first in the background, e.g. to wait until the bundled databases are extracted"""
+        agents = self._agents_in_order(PRELOAD_ORDER if order is None else order)
+        for agent in agents:
+            self.preload_status[agent.name] = {"state": "queued", "load_seconds": None, "warmup_seconds": None}
+            self.preload_events[agent.name] = threading.Event()
+
+        # A single worker loads strictly by priority; more workers load several agents at once
+        executor = ThreadPoolExecutor(max_workers=PRELOAD_WORKERS, thread_name_prefix="preload")
+        for agent in agents:
+            executor.submit(self._preload_agent, agent, wait_for)
+        executor.shutdown(wait=False)
+
+    def _preload_agent(self, agent, wait_for=None):
+        status = self.preload_status[agent.name]
+        try:
+            if wait_for is not None:
+                wait_for()
+
+            # Preloading only loads existing databases, building one stays on the lazy path
+            if not agent.index_exists():
+                status["state"] = "missing"
+                return
+
+            status["state"] = "loading"
+            start = time.perf_counter()
+            agent.initialize()
+            status["load_seconds"] = round(time.perf_counter() - start, 3)
+            if not agent.vector_db:
+                status["state"] = "failed"
+                return
+
+            # Warm the index, embedding cache and connections with a synthetic query
+            status["state"] = "warming"
+            start = time.perf_counter()
+            agent.retrieve_context(agent.description)
+            status["warmup_seconds"] = round(time.perf_counter() - start, 3)
+            status["state"] = "ready"
+            logging.info(f"Preloaded {agent.name} in {status['load_seconds']}s, warm-up {status['warmup_seconds']}s")
+
+        except Exception as e:
+            logging.error(f"Failed to preload {agent.name}: {e}")
+            status["state"] = "failed"
+        finally:
+            self.preload_events[agent.name].set()
+
+    def wait_for_preload(self, agent, timeout=None):
+        """Block while a background preload is loading the agent's database. A preload still queued
+        behind other agents is not waited for: the request loads the agent itself through the
+        single-flight initialize, and the preload then finds it loaded"""
+        event = self.preload_events.get(agent.name)
+        status = self.preload_status.get(agent.name)
+        if event is not None and status is not None and status["state"] == "loading" and not event.is_set():
+            logging.info(f"Waiting for {agent.name} to finish preloading...")
+            event.wait(PRELOAD_WAIT_TIMEOUT if timeout is None else timeout)
+
+    def agent_readiness(self):
+        """Per-agent readiness and load times, for /health"""
+        readiness = {}
+        for agent in self.agents:
+            readiness[agent.name] = agent.load_status()
+            if agent.name in self.preload_status:
+                readiness[agent.name]["preload"] = dict(self.preload_status[agent.name])
+        return readiness
@@ -0,0 +1,119 @@
+import os
+import logging
+import threading
+import numpy as np
+from agent_classes import embedding_model
+
+# Number of stored chunk embeddings sampled from each agent's collection to compute its centroid
+ROUTER_CENTROID_SAMPLE = int(os.getenv("ROUTER_CENTROID_SAMPLE", "2000"))
+
+
+def _normalize(vectors):
+    """L2-normalize a vector or every row of a matrix"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingRouter:
+    """Routes queries to agents by cosine similarity against precomputed agent exemplar embeddings"""
+
+    def __init__(self, agents, centroid_sample=ROUTER_CENTROID_SAMPLE):
+        self.agents = agents
+        self.centroid_sample = centroid_sample
+        self.exemplars = None  # (n_exemplars, dim) matrix of normalized exemplar vectors
+        self.owners = None     # agent index for each exemplar row
+        self._descriptions = None  # normalized description embeddings, one per agent
+        self._centroids = {}       # agent index -> (store, centroid of that store or None)
+        self._lock = threading.Lock()
+
+    def _store_centroid(self, store):
+        """Mean embedding of the chunks in a loaded agent's vector database. Only loaded agents get
+        one: routing never loads a database (preloading or queries do)"""
+        stored = store.get(include=["embeddings"], limit=self.centroid_sample)
+        embeddings = stored.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        return _normalize(embeddings).mean(axis=0)
+
+    def _unscored_agents(self):
+        """Agents loaded (or reloaded) since their centroid was last computed"""
+        return [i for i, agent in enumerate(self.agents)
+                if agent.vector_db and (i not in self._centroids or self._centroids[i][0] is not agent.vector_db)]
+
+    def build(self):
+        """Embed each agent's description and add the collection centroids of the agents that are loaded,
+        adding the centroids of agents loaded later on the next call. Returns the exemplars and their
+        owners, read together under the lock"""
+        with self._lock:
+            unscored = self._unscored_agents()
+            if self.exemplars is not None and not unscored:
+                return self.exemplars, self.owners
+
+            if self._descriptions is None:
+                descriptions = [f"{agent.department or agent.name}: {agent.description}" for agent in self.agents]
+                self._descriptions = list(embedding_model.embed_documents(descriptions))
+
+            for i in unscored:
+                agent = self.agents[i]
+                store = agent.vector_db
+                try:
+                    self._centroids[i] = (store, self._store_centroid(store))
+                except Exception as e:
+                    logging.error(f"Failed to compute routing centroid for {agent.name}: {e}")
+                    self._centroids[i] = (store, None)
+
+            vectors = list(self._descriptions)
+            owners = list(range(len(self.agents)))
+            for i, (_, centroid) in sorted(self._centroids.items()):
+                if centroid is not None:
+                    vectors.append(centroid)
+                    owners.append(i)
+
+            self.owners = np.asarray(owners)
+            self.exemplars = _normalize(vectors)
+            logging.info(f"Embedding router built with {len(owners)} exemplars for {len(self.agents)} agents")
+            return self.exemplars, self.owners
+
+    def invalidate(self):
+        """Drop the exemplars so they are rebuilt, e.g. after an agent's index was refreshed"""
+        with self._lock:
+            self.exemplars = None
+            self.owners = None
+            self._centroids = {}
+
+    def score(self, query_embedding):
+        """Return the best cosine similarity of the query against each agent's exemplars"""
+        exemplars, owners = self.build()
+
+        similarities = exemplars @ _normalize(query_embedding)
+        scores = np.full(len(self.agents), -1.0, dtype=np.float32)
+        np.maximum.at(scores, owners, similarities)
+        return scores
+
+    def score_batch(self, query_embeddings):
+        """Best cosine similarity of each query against each agent's exemplars, as a (queries, agents) matrix"""
+        exemplars, owners = self.build()
+
+        similarities = exemplars @ _normalize(query_embeddings).T
+        scores = np.full((len(self.agents), similarities.shape[1]), -1.0, dtype=np.float32)
+        np.maximum.at(scores, owners, similarities)
+        return scores.T
+
+    def route_batch(self, query_embeddings):
+        """Vectorized route: the best agent index and margin over the runner-up for every query"""
+        scores = self.score_batch(query_embeddings)
+        ranked = np.argsort(scores, axis=1)[:, ::-1]
+        rows = np.arange(len(scores))
+        best = ranked[:, 0]
+        if scores.shape[1] < 2:
+            return best, np.ones(len(scores), dtype=np.float32)
+        return best, scores[rows, best] - scores[rows, ranked[:, 1]]
+
+    def route(self, query_embedding):
+        """Return the index of the best agent and its score margin over the runner-up"""
+        scores = self.score(query_embedding)
+        top_two = np.argsort(scores)[::-1][:2]
+        margin = float(scores[top_two[0]] - scores[top_two[1]]) if len(top_two) > 1 else 1.0
+        return int(top_two[0]), margin
@@ -1,90 +1,112 @@
 import uuid
-from flask import Flask, request, jsonify, session
-from flask_session import Session
+import json
+from flask import Flask, Response, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 import os
 import logging
-import zipfile
+import metrics
+import log_config
 from agent_orchestrator import AgentOrchestrator
+from vector_db_bundle import VectorDBBundle
+from agent_classes import embedding_model
+from session_store import create_session_store, SESSION_BACKEND
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+log_config.configure_logging()
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
 
-app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(32)
+# Must be the same on every worker and host, the signed session cookie is verified with it
+app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+if not app.secret_key:
+    app.secret_key = os.urandom(32)
+    if SESSION_BACKEND != "memory":
+        logging.error(
+            f"FLASK_SECRET_KEY is not set: this worker signs session cookies with a random key, so other "
+            f"workers and hosts reject them and the shared {SESSION_BACKEND} session store loses its purpose. "
+            f"Set FLASK_SECRET_KEY to the same value everywhere"
+        )
 
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_FILE_DIR'] = './.flask_session/'
-app.config['SESSION_USE_SIGNER'] = True
+# The cookie only carries the session ID, chat histories are kept in the shared session store
 app.config['SESSION_COOKIE_SAMESITE'] = "None"
 app.config['SESSION_COOKIE_SECURE'] = True
 
-
-Session(app)
+session_store = create_session_store()
 
 # Path for vector DB storage
 VECTOR_DB_EXTRACT_PATH = "/var/data"
 VECTOR_DB_FOLDER = "/var/data/vector_db"
 
-BUNDLED_ZIP_PATH = "./vector_db.zip"  
+# A ZIP is extracted only when it changed since the last boot; a directory is served in place
+BUNDLED_ZIP_PATH = os.environ.get("VECTOR_DB_BUNDLE_PATH", "./vector_db.zip")
+# Extract in the background while /health reports "warming" and chats wait for it
+VECTOR_DB_BACKGROUND_EXTRACT = os.environ.get("VECTOR_DB_BACKGROUND_EXTRACT", "false").lower() == "true"
+VECTOR_DB_READY_TIMEOUT = float(os.environ.get("VECTOR_DB_READY_TIMEOUT", "300"))
 
-if os.path.exists(BUNDLED_ZIP_PATH):
-    # Create parent directory
-    os.makedirs(VECTOR_DB_EXTRACT_PATH, exist_ok=True)
-    
-    logging.info(f"Unzipping bundled vector DB from {BUNDLED_ZIP_PATH} to {VECTOR_DB_EXTRACT_PATH}")
-    with zipfile.ZipFile(BUNDLED_ZIP_PATH, 'r') as zip_ref:
-        # Extract to /var/data so that vector_db folder is created there
-        zip_ref.extractall(VECTOR_DB_EXTRACT_PATH)
-    
-    # Verify the extraction worked
-    if os.path.exists(VECTOR_DB_FOLDER):
-        logging.info(f"Successfully extracted vector DB to {VECTOR_DB_FOLDER}")
-    else:
-        logging.error(f"Extraction failed - {VECTOR_DB_FOLDER} not found")
-else:
-    logging.warning(f"No bundled vector DB ZIP found at {BUNDLED_ZIP_PATH}. Continuing without preload.")
-    # Create empty directory as fallback
-    os.makedirs(VECTOR_DB_FOLDER, exist_ok=True)
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "10000"))
+
+vector_db_bundle = VectorDBBundle(BUNDLED_ZIP_PATH, VECTOR_DB_EXTRACT_PATH, VECTOR_DB_FOLDER)
+vector_db_bundle.prepare(background=VECTOR_DB_BACKGROUND_EXTRACT)
 
 # Initialize the agent orchestrator
 agent_orchestrator = AgentOrchestrator()
-logging.info("Agent orchestrator initialized. Vector databases will be loaded on-demand.")
+
+# Optionally load and warm the agents' databases in the background once the bundle is ready
+if os.environ.get("PRELOAD_AGENTS", "false").lower() == "true":
+    agent_orchestrator.preload_all_databases(wait_for=vector_db_bundle.wait_ready)
+    logging.info("Agent orchestrator initialized. Vector databases are being preloaded in the background.")
+else:
+    logging.info("Agent orchestrator initialized. Vector databases will be loaded on-demand.")
+
+if metrics.METRICS_ENABLED:
+    if agent_orchestrator.response_cache is not None:
+        metrics.register_gauge("chatbot_response_cache", "Response cache statistics", agent_orchestrator.response_cache.stats)
+    if hasattr(embedding_model, 'stats'):
+        metrics.register_gauge("chatbot_embedding_cache", "Embedding cache statistics", embedding_model.stats)
 
 @app.before_request
 def assign_session_id():
     """Ensure every user gets a unique session ID for each session"""
     if "session_id" not in session:
         session["session_id"] = str(uuid.uuid4())
+    metrics.start_request()
+    log_config.start_request(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def add_timing_header(response):
+    """Report the request's stage timings. Streamed responses send their headers before any stage has run"""
+    if not response.is_streamed:
+        header = metrics.server_timing_header()
+        if header:
+            response.headers['Server-Timing'] = header
+    response.headers['X-Request-ID'] = log_config.current_request_id()
+    return response
 
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
         data = request.get_json()
         query = data.get('question')
-        history = session.get('chat_history', [])
         sid = session.get("session_id", "NoSession")
+        history = session_store.load(sid)
 
-        # ADD THESE DEBUG LINES
-        # logging.info(f"Session ID: {session.get('_id', 'No session ID')}")
-        logging.info(f"Incoming question: {query}")
-        logging.info(f"Current history length: {len(history)}")
-        logging.info(f"History so far: {history}")
+        logging.info(f"[Session {sid}] Incoming question ({len(query or '')} chars, history of {len(history)} messages)")
+        if log_config.payload_sampled():
+            logging.info(f"[Session {sid}] Question: {query!r} History: {history}")
 
         if not query:
             return jsonify({'error': 'No question provided'}), 400
         
         history.append({'role':'user', 'content':query})
+
+        # Agents must not look at the vector DB folder while the bundle is still being extracted
+        if not vector_db_bundle.wait_ready(VECTOR_DB_READY_TIMEOUT):
+            raise TimeoutError("Vector databases are still being prepared")
         
-        result = agent_orchestrator.process_query(query, history)
+        with metrics.span("total"):
+            result = agent_orchestrator.process_query(query, history)
 
         # # Handle the response format properly
         # response_content = result['response']
@@ -99,11 +121,11 @@ def chat():
         
         history.append({'role':'assistant', 'content': result['response']})
         # logging.info(f"Final History List: {history}")
-        session['chat_history'] = history[-6:]
-        # session.modified = True
+        session_store.save(sid, history)
 
-        logging.info(f"[Session {sid}] Assistant response: {result['response']}")
-        logging.debug(f"[Session {sid}] Updated history: {session['chat_history']}")
+        logging.info(f"[Session {sid}] Answered by {result['agent_name']}")
+        if log_config.payload_sampled():
+            logging.info(f"[Session {sid}] Assistant response: {result['response']}")
 
         return jsonify({
             'response': result['response'],
@@ -122,9 +144,103 @@ def chat():
             'agent': {'name': 'System', 'description': 'Error handler'}
         }), 500
     
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the answer as server-sent events: the agent first, then text chunks, then the full response"""
+    data = request.get_json(silent=True) or {}
+    query = data.get('question') if isinstance(data, dict) else None
+    if not query or not isinstance(query, str):
+        return jsonify({'error': 'No question provided'}), 400
+
+    sid = session.get("session_id", "NoSession")
+    history = session_store.load(sid)
+
+    logging.info(f"[Session {sid}] Incoming streamed question ({len(query)} chars, history of {len(history)} messages)")
+    if log_config.payload_sampled():
+        logging.info(f"[Session {sid}] Question: {query!r} History: {history}")
+
+    history.append({'role':'user', 'content':query})
+
+    def generate():
+        try:
+            if not vector_db_bundle.wait_ready(VECTOR_DB_READY_TIMEOUT):
+                raise TimeoutError("Vector databases are still being prepared")
+
+            for event in agent_orchestrator.stream_query(query, history):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event['event'] == 'done':
+                    history.append({'role':'assistant', 'content': event['data']})
+
+            session_store.save(sid, history)
+            if log_config.payload_sampled():
+                logging.info(f"[Session {sid}] Streamed assistant response: {history[-1]['content']}")
+
+        except Exception as e:
+            logging.error(f"[Session {sid}] Error in chat stream endpoint: {e}")
+            yield f"event: error\ndata: {json.dumps({'response': 'I apologize, but I am experiencing technical difficulties. Please try again in a moment.'})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of standalone questions, e.g. for evaluations or FAQ pages. Results stream back as
+    JSON lines in completion order, each with the index of its question. Chat history is not used or updated"""
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q for q in questions):
+        return jsonify({'error': 'Provide a non-empty list of questions'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch'}), 400
+
+    logging.info(f"Incoming batch of {len(questions)} questions")
+
+    def generate():
+        try:
+            if not vector_db_bundle.wait_ready(VECTOR_DB_READY_TIMEOUT):
+                raise TimeoutError("Vector databases are still being prepared")
+
+            for result in agent_orchestrator.process_batch(questions):
+                yield json.dumps({
+                    'index': result['index'],
+                    'question': result['question'],
+                    'response': result['response'],
+                    'agent': {
+                        'name': result['agent_name'],
+                        'description': result['agent_description']
+                    }
+                }) + "\n"
+
+        except Exception as e:
+            logging.error(f"Error in chat batch endpoint: {e}")
+            yield json.dumps({'error': 'I apologize, but I am experiencing technical difficulties. Please try again in a moment.'}) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok'})
+    health = {
+        'status': 'warming' if vector_db_bundle.state == 'warming' else 'ok',
+        'vector_db': vector_db_bundle.status(),
+        'index_release': agent_orchestrator.index_release,
+        'agents': agent_orchestrator.agent_readiness()
+    }
+    if agent_orchestrator.response_cache is not None:
+        health['response_cache'] = agent_orchestrator.response_cache.stats()
+    if hasattr(embedding_model, 'stats'):
+        health['embedding_cache'] = embedding_model.stats()
+    return jsonify(health)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics of this worker process"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(port=5000)
@@ -0,0 +1,178 @@
+"""ASGI entry point serving /chat through the async agent pipeline.
+
+Run with: uvicorn asgi:app --workers 1
+A single event loop holds many in-flight chats while they wait on OpenAI, instead of
+one gunicorn thread per chat.
+"""
+import json
+import uuid
+import asyncio
+import logging
+import metrics
+import log_config
+from itsdangerous import URLSafeSerializer, BadSignature
+from app import app as flask_app, agent_orchestrator, vector_db_bundle, session_store, VECTOR_DB_READY_TIMEOUT
+from agent_classes import embedding_model
+
+SESSION_COOKIE_NAME = "session_id"
+
+cookie_serializer = URLSafeSerializer(flask_app.secret_key, salt="asgi-session")
+
+
+def get_session_id(headers):
+    """Read the signed session ID cookie, returning None when it is missing or tampered with"""
+    for part in headers.get(b"cookie", b"").decode().split(";"):
+        name, _, value = part.strip().partition("=")
+        if name == SESSION_COOKIE_NAME:
+            try:
+                return cookie_serializer.loads(value)
+            except BadSignature:
+                return None
+    return None
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, status, payload, headers):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": headers + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(query, sid):
+    metrics.start_request()
+    # The session store may be on the network (Redis), keep it off the event loop
+    history = await asyncio.to_thread(session_store.load, sid)
+
+    logging.info(f"[Session {sid}] Incoming question ({len(query)} chars, history of {len(history)} messages)")
+    if log_config.payload_sampled():
+        logging.info(f"[Session {sid}] Question: {query!r} History: {history}")
+
+    history.append({'role':'user', 'content':query})
+
+    if not await asyncio.to_thread(vector_db_bundle.wait_ready, VECTOR_DB_READY_TIMEOUT):
+        raise TimeoutError("Vector databases are still being prepared")
+    with metrics.span("total"):
+        result = await agent_orchestrator.aprocess_query(query, history)
+    history.append({'role':'assistant', 'content': result['response']})
+    await asyncio.to_thread(session_store.save, sid, history)
+
+    logging.info(f"[Session {sid}] Answered by {result['agent_name']}")
+    if log_config.payload_sampled():
+        logging.info(f"[Session {sid}] Assistant response: {result['response']}")
+
+    return {
+        'response': result['response'],
+        'agent': {
+            'name': result['agent_name'],
+            'description': result['agent_description']
+        }
+    }
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] == "websocket":
+        # Not served: reject the handshake instead of leaving the client waiting
+        await receive()
+        await send({"type": "websocket.close", "code": 1003})
+        return
+    if scope["type"] != "http":
+        logging.warning(f"Ignoring unsupported ASGI scope type {scope['type']!r}")
+        return
+
+    headers = dict(scope["headers"])
+    origin = headers.get(b"origin")
+    # Each request runs in its own task, so the correlation ID stays with it across awaits
+    request_id = log_config.start_request(headers.get(b"x-request-id", b"").decode("latin-1"))
+    response_headers = [(b"x-request-id", request_id.encode("latin-1"))]
+    if origin:
+        response_headers += [
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin")
+        ]
+
+    if scope["method"] == "OPTIONS":
+        response_headers += [
+            (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+            (b"access-control-allow-headers", headers.get(b"access-control-request-headers", b"content-type"))
+        ]
+        await send({"type": "http.response.start", "status": 204, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    if scope["path"] == "/health" and scope["method"] == "GET":
+        health = {
+            'status': 'warming' if vector_db_bundle.state == 'warming' else 'ok',
+            'vector_db': vector_db_bundle.status(),
+            'index_release': agent_orchestrator.index_release,
+            'agents': agent_orchestrator.agent_readiness()
+        }
+        if agent_orchestrator.response_cache is not None:
+            health['response_cache'] = agent_orchestrator.response_cache.stats()
+        if hasattr(embedding_model, 'stats'):
+            health['embedding_cache'] = embedding_model.stats()
+        await send_json(send, 200, health, response_headers)
+        return
+
+    if scope["path"] == "/metrics" and scope["method"] == "GET" and metrics.METRICS_ENABLED:
+        body = metrics.render().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": response_headers + [(b"content-type", b"text/plain; version=0.0.4"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    if scope["path"] != "/chat" or scope["method"] != "POST":
+        await send_json(send, 404, {'error': 'Not found'}, response_headers)
+        return
+
+    # Ensure every user gets a unique session ID for each session
+    sid = get_session_id(headers)
+    if sid is None:
+        sid = str(uuid.uuid4())
+        cookie = f"{SESSION_COOKIE_NAME}={cookie_serializer.dumps(sid)}; Path=/; HttpOnly; Secure; SameSite=None"
+        response_headers.append((b"set-cookie", cookie.encode()))
+
+    try:
+        data = json.loads(await read_body(receive) or b"{}")
+        query = data.get('question')
+        if not query:
+            await send_json(send, 400, {'error': 'No question provided'}, response_headers)
+            return
+
+        result = await chat(query, sid)
+        timing = metrics.server_timing_header()
+        if timing:
+            response_headers.append((b"server-timing", timing.encode()))
+        await send_json(send, 200, result, response_headers)
+
+    except Exception as e:
+        logging.error(f"[Session {sid}] Error in chat endpoint: {e}")
+        await send_json(send, 500, {
+            'response': "I apologize, but I'm experiencing technical difficulties. If this is your first query to a specific department, the database might still be loading. Please try again in a moment.",
+            'references': [],
+            'agent': {'name': 'System', 'description': 'Error handler'}
+        }, response_headers)
@@ -0,0 +1,175 @@
+"""PDF downloads against a local server that sends ETag and Last-Modified, answers conditional and Range
+requests, adds latency per request and can cut responses off part way. Runs ingestion.download_pdfs on a
+cold folder (one worker and the full pool), again with nothing changed, after some files changed, and with
+interrupted transfers that must resume. Checks every file against the server's copy and reports the time,
+requests and bytes sent for each run.
+
+Usage: python -m benchmarks.download_benchmark --files 40 --size-kb 512 --latency 0.05 --workers 4 --output downloads.json
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class PdfHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled connections are reused
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        name = self.path.lstrip("/")
+        with server.lock:
+            server.requests += 1
+            body = server.files.get(name)
+            cut = server.cut_after.pop(name, None)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        last_modified = formatdate(server.modified[name], usegmt=True)
+        if self.headers.get("If-None-Match") == etag or (
+                not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since")
+                and parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp() >= int(server.modified[name])):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and self.headers.get("If-Range") in (None, etag, last_modified):
+            start = int(range_header[len("bytes="):].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body) - start))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+
+        payload = body[start:] if cut is None else body[start:cut]
+        self.wfile.write(payload)
+        with server.lock:
+            server.bytes_sent += len(payload)
+        if cut is not None:
+            self.close_connection = True  # the client sees a short read
+
+
+class PdfServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(("127.0.0.1", 0), PdfHandler)
+        self.latency = latency
+        self.files = {}
+        self.modified = {}
+        self.cut_after = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def put(self, name, body):
+        self.files[name] = body
+        self.modified[name] = time.time()
+
+
+def make_pdf(index, size, revision=0):
+    header = f"%PDF-1.4\n% document {index} revision {revision}\n".encode()
+    return header + os.urandom(max(0, size - len(header)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF downloads against a local server")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--changed", type=int, default=5, help="Files to change before the update run")
+    parser.add_argument("--output", help="Save the results as JSON")
+    args = parser.parse_args()
+
+    from ingestion import DownloadManifest, download_pdfs, file_hash
+
+    server = PdfServer(args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    names = [f"doc-{index}.pdf" for index in range(args.files)]
+    for index, name in enumerate(names):
+        server.put(name, make_pdf(index, args.size_kb * 1024))
+    urls = [f"{base_url}/{name}" for name in names]
+    folders = []
+    results = {"files": args.files, "size_kb": args.size_kb, "latency": args.latency, "runs": {}}
+
+    def run(name, folder, workers, expect_downloaded):
+        server.requests = server.bytes_sent = 0
+        start = time.perf_counter()
+        downloaded = download_pdfs(urls, folder, max_workers=workers)
+        seconds = time.perf_counter() - start
+        results["runs"][name] = {"seconds": round(seconds, 2), "downloaded": len(downloaded), "requests": server.requests,
+                                 "mb_sent": round(server.bytes_sent / 2**20, 2)}
+        if len(downloaded) != expect_downloaded:
+            raise SystemExit(f"{name}: downloaded {len(downloaded)} files, expected {expect_downloaded}")
+        manifest = DownloadManifest(folder)
+        for file_name in names:
+            path = os.path.join(folder, file_name)
+            if file_hash(path) != hashlib.sha256(server.files[file_name]).hexdigest() or manifest.checksum(path) != file_hash(path):
+                raise SystemExit(f"{name}: {file_name} does not match the server's copy")
+        if any(file_name.endswith(".part") for file_name in os.listdir(folder)):
+            raise SystemExit(f"{name}: partial files left behind")
+
+    try:
+        single = tempfile.mkdtemp(prefix="download-benchmark-")
+        pooled = tempfile.mkdtemp(prefix="download-benchmark-")
+        folders += [single, pooled]
+        run("cold, 1 worker", single, 1, args.files)
+        run(f"cold, {args.workers} workers", pooled, args.workers, args.files)
+        run("unchanged", pooled, args.workers, 0)
+
+        changed = names[:args.changed]
+        for index, name in enumerate(changed):
+            server.put(name, make_pdf(index, args.size_kb * 1024, revision=1))
+        run(f"{len(changed)} changed", pooled, args.workers, len(changed))
+
+        # Cut the first response for some files at half way, the retry must fetch only the rest
+        interrupted = names[-args.changed:]
+        for index, name in enumerate(interrupted):
+            server.put(name, make_pdf(index, args.size_kb * 1024, revision=2))
+            server.cut_after[name] = len(server.files[name]) // 2
+        run(f"{len(interrupted)} interrupted", pooled, args.workers, len(interrupted))
+    finally:
+        server.shutdown()
+        for folder in folders:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    print(f"\n{'run':<24} {'seconds':>8} {'files':>6} {'requests':>9} {'MB sent':>8}")
+    for name, run_result in results["runs"].items():
+        print(f"{name:<24} {run_result['seconds']:8.2f} {run_result['downloaded']:6} {run_result['requests']:9} {run_result['mb_sent']:8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
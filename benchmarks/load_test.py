@@ -0,0 +1,82 @@
+"""Concurrency load test: threaded sync pipeline vs the async pipeline, against the stub OpenAI server.
+
+Usage: python -m benchmarks.load_test --requests 200 --concurrency 200 --latency 0.5
+"""
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.stub_openai import start_stub_server, configure_stub_environment
+
+QUERIES = [
+    "What are the tuition fees for the foundation programme?",
+    "How do I apply for admission with STPM results?",
+    "When is the final exam timetable released?",
+    "Where is the university library?"
+]
+
+
+def build_orchestrator():
+    import agent_classes
+    from agent_orchestrator import AgentOrchestrator
+
+    # Stub embeddings take raw text, so skip tiktoken chunking (which downloads encodings)
+    agent_classes.openai_embeddings.embeddings.check_embedding_ctx_length = False
+    orchestrator = AgentOrchestrator()
+    for agent in orchestrator.agents:
+        agent.vector_db_path = None  # measure the OpenAI-bound path, not database builds
+    return orchestrator
+
+
+def run_sync(orchestrator, total, threads):
+    def one(i):
+        start = time.perf_counter()
+        orchestrator.process_query(QUERIES[i % len(QUERIES)], [])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(total)))
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(orchestrator, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await orchestrator.aprocess_query(QUERIES[i % len(QUERIES)], [])
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def summarize(label, elapsed, latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<28} {len(latencies) / elapsed:8.1f} req/s   wall {elapsed:6.2f}s   p50 {p50:5.2f}s   p95 {p95:5.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync and async request pipelines under concurrent load")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=200, help="In-flight requests for the async pipeline")
+    parser.add_argument("--threads", type=int, default=2, help="Threads for the sync pipeline (gunicorn --threads)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub completion latency in seconds")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency)
+    configure_stub_environment(base_url)
+    orchestrator = build_orchestrator()
+
+    summarize(f"sync ({args.threads} threads)", *run_sync(orchestrator, args.requests, args.threads))
+    summarize(f"async ({args.concurrency} in flight)", *asyncio.run(run_async(orchestrator, args.requests, args.concurrency)))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
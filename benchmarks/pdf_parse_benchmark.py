@@ -0,0 +1,132 @@
+"""PDF parsing throughput per tier over a folder of sample PDFs: the PyMuPDF text layer, Unstructured, the
+tiered load_pdf across the process pool with a cold parse cache, and again with a warm one. Reports pages/sec
+for each and which files the text layer tier passed on to Unstructured.
+
+Without --folder, sample PDFs are generated: text PDFs from the synthetic corpus and image-only "scanned" ones.
+
+Usage: python -m benchmarks.pdf_parse_benchmark --folder /var/data/finance --workers 4 --output parse.json
+       python -m benchmarks.pdf_parse_benchmark --text-pdfs 30 --scanned-pdfs 3 --pages 8
+"""
+import os
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import importlib.util
+
+
+def make_sample_pdfs(folder, text_pdfs, scanned_pdfs, pages):
+    import pymupdf
+    from benchmarks.synthetic_corpus import DEPARTMENT_TOPICS, make_documents
+
+    documents = [doc.page_content for department in DEPARTMENT_TOPICS for doc in make_documents(department, text_pdfs * pages // len(DEPARTMENT_TOPICS) + pages)]
+    for index in range(text_pdfs):
+        pdf = pymupdf.open()
+        for page_number in range(pages):
+            page = pdf.new_page()
+            page.insert_textbox(pymupdf.Rect(50, 50, 550, 800), documents[(index * pages + page_number) % len(documents)], fontsize=9)
+        pdf.save(os.path.join(folder, f"text-{index}.pdf"))
+        pdf.close()
+
+    for index in range(scanned_pdfs):
+        # Render text pages to images, so the PDF has no text layer, like a scan
+        source = pymupdf.open()
+        for page_number in range(pages):
+            source.new_page().insert_textbox(pymupdf.Rect(50, 50, 550, 800), documents[page_number % len(documents)], fontsize=9)
+        pdf = pymupdf.open()
+        for source_page in source:
+            pixmap = source_page.get_pixmap(dpi=100)
+            page = pdf.new_page(width=source_page.rect.width, height=source_page.rect.height)
+            page.insert_image(page.rect, pixmap=pixmap)
+        pdf.save(os.path.join(folder, f"scanned-{index}.pdf"))
+        pdf.close()
+        source.close()
+
+
+def page_count(pdf_file):
+    import pymupdf
+    with pymupdf.open(pdf_file) as pdf:
+        return pdf.page_count
+
+
+def measure(name, pdf_files, parse, pages):
+    start = time.perf_counter()
+    parsed = [pdf_file for pdf_file in pdf_files if parse(pdf_file) is not None]
+    seconds = time.perf_counter() - start
+    total_pages = sum(pages[pdf_file] for pdf_file in parsed)
+    result = {"files": len(parsed), "pages": total_pages, "seconds": round(seconds, 2), "pages_per_second": round(total_pages / seconds, 1) if seconds else None}
+    print(f"{name:<34} {len(parsed):6} files {total_pages:7} pages {seconds:8.2f}s {result['pages_per_second'] or 0:9.1f} pages/s")
+    return result, parsed
+
+
+def measure_pool(name, pdf_files, workers, pages):
+    import ingestion
+    start = time.perf_counter()
+    parsers = [docs[0].metadata["parser"] for _, docs in ingestion.iter_parsed_pdfs(pdf_files, max_workers=workers) if docs]
+    seconds = time.perf_counter() - start
+    total_pages = sum(pages[pdf_file] for pdf_file in pdf_files)
+    result = {"files": len(pdf_files), "pages": total_pages, "seconds": round(seconds, 2), "pages_per_second": round(total_pages / seconds, 1),
+              "text_layer_files": parsers.count("text_layer"), "unstructured_files": parsers.count("unstructured")}
+    print(f"{name:<34} {len(pdf_files):6} files {total_pages:7} pages {seconds:8.2f}s {result['pages_per_second']:9.1f} pages/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF parsing per tier")
+    parser.add_argument("--folder", help="Folder of sample PDFs (generated when left out)")
+    parser.add_argument("--text-pdfs", type=int, default=30)
+    parser.add_argument("--scanned-pdfs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=8, help="Pages per generated PDF")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--skip-unstructured", action="store_true", help="Leave out the slow Unstructured tier")
+    parser.add_argument("--output", help="Save the results as JSON")
+    args = parser.parse_args()
+
+    cache_folder = tempfile.mkdtemp(prefix="parse-cache-")
+    os.environ["PARSE_CACHE_PATH"] = cache_folder  # read by the worker processes
+    import ingestion
+    ingestion.PARSE_CACHE_PATH = cache_folder
+
+    sample_folder = None
+    folder = args.folder
+    if not folder:
+        folder = sample_folder = tempfile.mkdtemp(prefix="parse-samples-")
+        make_sample_pdfs(folder, args.text_pdfs, args.scanned_pdfs, args.pages)
+
+    try:
+        pdf_files = sorted(glob.glob(os.path.join(folder, "*.pdf")))
+        pages = {pdf_file: page_count(pdf_file) for pdf_file in pdf_files}
+        print(f"{len(pdf_files)} PDFs, {sum(pages.values())} pages in {folder}\n")
+        results = {"folder": args.folder or "generated", "files": len(pdf_files), "pages": sum(pages.values()), "workers": args.workers, "tiers": {}}
+
+        results["tiers"]["text_layer"], accepted = measure("text layer (1 process)", pdf_files, ingestion.extract_text_layer, pages)
+        fallback = [pdf_file for pdf_file in pdf_files if pdf_file not in accepted]
+        results["fallback"] = [os.path.basename(pdf_file) for pdf_file in fallback]
+
+        if not args.skip_unstructured:
+            if importlib.util.find_spec("unstructured") is None:
+                print("unstructured is not installed, skipping its tier")
+            else:
+                results["tiers"]["unstructured"], _ = measure("unstructured (1 process)", pdf_files, ingestion.load_pdf_unstructured, pages)
+
+        # Without Unstructured, the tiered parse can only run over the files the text layer tier takes
+        tiered_files = pdf_files if "unstructured" in results["tiers"] else accepted
+        for name in ("tiered, cold cache", "tiered, warm cache"):
+            results["tiers"][name] = measure_pool(f"{name} ({args.workers} processes)", tiered_files, args.workers, pages)
+        if fallback:
+            print(f"\nPassed on to Unstructured: {', '.join(results['fallback'])}")
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+        if sample_folder:
+            shutil.rmtree(sample_folder, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
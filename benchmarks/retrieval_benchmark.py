@@ -0,0 +1,78 @@
+"""Retrieval quality and latency: dense-only vs hybrid (BM25 + vector) retrieval on a synthetic corpus.
+
+Queries either name an exact form code or a topic plus code, the kind of lookup dense
+embeddings tend to blur together. Runs against the stub OpenAI server.
+
+Usage: python -m benchmarks.retrieval_benchmark --documents 2000 --queries 200 --embedding-latency 0.05
+"""
+import time
+import shutil
+import argparse
+import tempfile
+from benchmarks.stub_openai import start_stub_server, configure_stub_environment
+from benchmarks.synthetic_corpus import make_documents, make_queries
+
+
+def build_agent(department, documents, persist_directory):
+    import agent_classes
+    from langchain_chroma import Chroma
+
+    # Stub embeddings take raw text, so skip tiktoken chunking (which downloads encodings)
+    agent_classes.openai_embeddings.embeddings.check_embedding_ctx_length = False
+    agent = agent_classes.BaseAgent(f"{department.capitalize()} Agent", "Benchmark agent")
+    agent.vector_db = Chroma(persist_directory=persist_directory, embedding_function=agent_classes.embedding_model)
+    for start in range(0, len(documents), 500):
+        agent.vector_db.add_documents(documents[start:start + 500])
+    agent.index_version = 1
+    return agent
+
+
+def run_mode(agent, mode, queries, k):
+    import agent_classes
+
+    agent_classes.RETRIEVAL_MODE = mode
+    if mode == "hybrid":
+        agent.get_bm25_index()  # build outside the timed loop, as the first request after a load would
+
+    hits = 0
+    latencies = []
+    for query, expected_source in queries:
+        start = time.perf_counter()
+        docs = agent.retrieve_context(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(doc.metadata.get("source") == expected_source for doc in docs)
+    return hits / len(queries), sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dense-only and hybrid retrieval recall and latency")
+    parser.add_argument("--department", default="examinations", choices=["admissions", "finance", "examinations", "general"])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Stub embedding latency in seconds")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(embedding_latency=0.0)
+    configure_stub_environment(base_url)
+    persist_directory = tempfile.mkdtemp(prefix="retrieval-benchmark-")
+    try:
+        documents = make_documents(args.department, args.documents)
+        queries = make_queries(args.department, args.documents, args.queries)
+        agent = build_agent(args.department, documents, persist_directory)
+        # Only query-time embedding calls pay the simulated network latency
+        server.RequestHandlerClass.embedding_latency = args.embedding_latency
+
+        print(f"{args.documents} chunks, {args.queries} queries, k={args.k}")
+        for mode in ["vector", "hybrid"]:
+            recall, latencies = run_mode(agent, mode, queries, args.k)
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+            print(f"{mode:<8} recall@{args.k} {recall:6.1%}   p50 {p50:7.1f}ms   p95 {p95:7.1f}ms")
+    finally:
+        server.shutdown()
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Webpage scraping against a local static site whose pages load their content with a script, like UTAR's.
+Compares the previous scraping (one browser per pass, pages loaded one at a time with a fixed 3s wait, and
+every page rendered twice: once for its text, once for its PDF links) with scraper.RenderedPages (each page
+rendered once over a pool of browser contexts, waiting for network idle) on a cold cache, a warm cache and
+after some pages changed. Checks that every run extracts the same text and PDF links.
+
+Needs Playwright's Chromium (`playwright install chromium`).
+
+Usage: python -m benchmarks.scrape_benchmark --pages 20 --concurrency 4 --script-delay 300 --output scrape.json
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+PAGE_TEMPLATE = """<html><head><title>Page {index}</title></head><body>
+<nav><a href="/page-0.html">Home</a> <a href="/forms/form-{index}.pdf">Form {index}</a></nav>
+<div id="content"></div>
+<script>
+  // Content arrives after a request, as on pages that load their sections from an API
+  setTimeout(function () {{
+    fetch("/data-{index}.json").then(function (r) {{ return r.json(); }}).then(function (data) {{
+      document.getElementById("content").innerHTML =
+        '<div class="mg">' + data.text + '</div><a href="' + data.pdf + '">' + data.title + '</a>';
+    }});
+  }}, {delay});
+</script>
+</body></html>
+"""
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static files with Last-Modified, answering If-Modified-Since with 304"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_page(folder, index, delay_ms, version=0):
+    with open(os.path.join(folder, f"page-{index}.html"), "w") as f:
+        f.write(PAGE_TEMPLATE.format(index=index, delay=delay_ms) + f"<!-- revision {version} -->")
+    with open(os.path.join(folder, f"data-{index}.json"), "w") as f:
+        json.dump({
+            "title": f"Guide {index}",
+            "text": f"Section {index} of the handbook, revision {version}.",
+            "pdf": f"/docs/guide-{index}-v{version}.pdf"
+        }, f)
+
+
+def change_pages(folder, indexes, delay_ms):
+    """Give some pages (and the data they load) new content and a newer modification time"""
+    later = time.time() + 5
+    for index in indexes:
+        write_page(folder, index, delay_ms, version=1)
+        for name in (f"page-{index}.html", f"data-{index}.json"):
+            os.utime(os.path.join(folder, name), (later, later))
+
+
+def start_site(folder):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=folder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def previous_render_pages(urls):
+    """The scraping before the shared renderer: a new browser per pass and a fixed wait per page"""
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        for url in urls:
+            page = browser.new_page()
+            page.goto(url)
+            page.wait_for_timeout(3000)  # wait for JS to load
+            html_content = page.content()
+            page.close()
+            yield url, html_content
+        browser.close()
+
+
+def extract(items):
+    from scraper import page_document, pdf_links
+    items = list(items)
+    texts = {url: page_document(url, html).page_content for url, html in items}
+    links = sorted({link for url, html in items for link in pdf_links(url, html)})
+    return texts, links
+
+
+def run_previous(urls):
+    start = time.perf_counter()
+    texts, _ = extract(previous_render_pages(urls))  # scrape_webpage
+    _, links = extract(previous_render_pages(urls))  # scrape_web_pdfs
+    return time.perf_counter() - start, texts, links
+
+
+def run_shared(urls, cache_path, concurrency):
+    from scraper import RenderedPages
+    pages = RenderedPages(urls, cache_path=cache_path, concurrency=concurrency)
+    start = time.perf_counter()
+    texts, links = extract(pages.items())
+    return time.perf_counter() - start, texts, links
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark webpage scraping against a local site")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="Browser contexts for the shared renderer")
+    parser.add_argument("--script-delay", type=int, default=300, help="Milliseconds before a page loads its content")
+    parser.add_argument("--changed", type=int, default=3, help="Pages to change before the last run")
+    parser.add_argument("--skip-previous", action="store_true", help="Leave out the slow previous scraping")
+    parser.add_argument("--output", help="Save the results as JSON")
+    args = parser.parse_args()
+
+    site_folder = tempfile.mkdtemp(prefix="scrape-site-")
+    cache_folder = tempfile.mkdtemp(prefix="scrape-cache-")
+    server, base_url = start_site(site_folder)
+    try:
+        for index in range(args.pages):
+            write_page(site_folder, index, args.script_delay)
+        urls = [f"{base_url}/page-{index}.html" for index in range(args.pages)]
+        results = {"pages": args.pages, "concurrency": args.concurrency, "script_delay_ms": args.script_delay, "runs": {}}
+
+        def record(name, seconds, texts, links):
+            results["runs"][name] = {"seconds": round(seconds, 2), "pages_per_second": round(len(urls) / seconds, 2), "pdf_links": len(links)}
+            print(f"{name:<22} {seconds:7.2f}s  {len(urls) / seconds:7.2f} pages/s  {len(links)} PDF links")
+
+        expected = None
+        if not args.skip_previous:
+            seconds, texts, links = run_previous(urls)
+            record("previous", seconds, texts, links)
+            expected = (texts, links)
+
+        seconds, texts, links = run_shared(urls, cache_folder, args.concurrency)
+        record("shared cold cache", seconds, texts, links)
+        if expected is not None and (texts, links) != expected:
+            raise SystemExit("The shared renderer extracted different text or PDF links")
+        expected = (texts, links)
+
+        seconds, texts, links = run_shared(urls, cache_folder, args.concurrency)
+        record("shared warm cache", seconds, texts, links)
+        if (texts, links) != expected:
+            raise SystemExit("Cached pages extracted different text or PDF links")
+
+        changed = list(range(min(args.changed, args.pages)))
+        change_pages(site_folder, changed, args.script_delay)
+        seconds, texts, links = run_shared(urls, cache_folder, args.concurrency)
+        record(f"shared {len(changed)} changed", seconds, texts, links)
+        stale = [urls[index] for index in changed if "revision 1" not in texts[urls[index]]]
+        if stale:
+            raise SystemExit(f"Changed pages were served from the cache: {', '.join(stale)}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(site_folder, ignore_errors=True)
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Worker boot cost: time and RSS to import the app in a fresh interpreter, with a `python -X importtime`
+profile summarised per top-level package, and which of the ingestion and client libraries got imported.
+
+Usage: python -m benchmarks.startup_benchmark --runs 5 --top 15 --output startup.json
+       VECTOR_BACKEND=numpy python -m benchmarks.startup_benchmark   # profile a numpy-serving worker
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+from collections import defaultdict
+
+# Libraries a serving worker should not need until it builds an index or calls OpenAI
+WATCHED_PACKAGES = ("playwright", "bs4", "unstructured", "langchain_text_splitters", "chromadb", "openai", "langchain_openai")
+
+CHILD_CODE = """
+import sys, time, json, resource, importlib
+start = time.perf_counter()
+importlib.import_module({module!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "packages": sorted({{name.split(".")[0] for name in sys.modules}})
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Self time in seconds per top-level package, from `-X importtime` output"""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return packages
+
+
+def run_once(module, env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE.format(module=module)],
+        env=env, capture_output=True, text=True, timeout=600
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement["profile"] = parse_importtime(result.stderr)
+    return measurement
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time and memory of a worker")
+    parser.add_argument("--module", default="app", help="Module a worker imports at boot")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Packages to list by import time")
+    parser.add_argument("--output", help="Save the results as JSON")
+    args = parser.parse_args()
+
+    # Keep the import from touching /var/data or a real bundle
+    folder = tempfile.mkdtemp(prefix="startup-benchmark-")
+    env = dict(os.environ)
+    env.setdefault("VECTOR_DB_BUNDLE_PATH", os.path.join(folder, "no_bundle.zip"))
+    env.setdefault("SESSION_BACKEND", "memory")
+    env.setdefault("PRELOAD_AGENTS", "false")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+
+    try:
+        runs = [run_once(args.module, env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    # The first run warms the OS file cache, it is reported but left out of the medians
+    measured = runs[1:] or runs
+
+    profile = defaultdict(list)
+    for run in measured:
+        for package, seconds in run["profile"].items():
+            profile[package].append(seconds)
+    profile = {package: statistics.median(values) for package, values in profile.items()}
+    imported = set(runs[-1]["packages"])
+
+    results = {
+        "module": args.module,
+        "vector_backend": env.get("VECTOR_BACKEND", "chroma"),
+        "cold_seconds": round(runs[0]["seconds"], 3),
+        "import_seconds": round(statistics.median(run["seconds"] for run in measured), 3),
+        "max_rss_mb": round(statistics.median(run["max_rss_mb"] for run in measured), 1),
+        "imported": {package: package in imported for package in WATCHED_PACKAGES},
+        "top_packages": {package: round(seconds, 3) for package, seconds in sorted(profile.items(), key=lambda item: -item[1])[:args.top]}
+    }
+
+    print(f"import {args.module}: {results['import_seconds']}s median of {len(measured)} runs "
+          f"(first run {results['cold_seconds']}s), max RSS {results['max_rss_mb']} MB")
+    print("\nSlowest packages (self time, summed over their modules):")
+    for package, seconds in results["top_packages"].items():
+        print(f"  {package:<28} {seconds * 1000:8.1f}ms")
+    print("\nImported at boot:")
+    for package, was_imported in results["imported"].items():
+        print(f"  {package:<28} {'yes' if was_imported else 'no'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""A local OpenAI-compatible stub server for benchmarks.
+
+Serves /v1/embeddings with deterministic hashed bag-of-words vectors and
+/v1/chat/completions (streaming and non-streaming) after a configurable delay,
+so the chatbot can be measured without real API calls.
+"""
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+EMBEDDING_DIM = 256
+
+
+def stub_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic embedding: hashed bag of words, L2-normalized, so similar texts score high"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.5         # seconds before a completion is returned
+    embedding_latency = 0.0  # seconds before embeddings are returned
+    token_latency = 0.0   # seconds between streamed chunks
+    router_reply = None   # fixed reply for router prompts, or None to pick an agent from keywords
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat_completion(body)
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def _embeddings(self, body):
+        time.sleep(self.embedding_latency)
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = [
+            {"object": "embedding", "index": i, "embedding": stub_embedding(text if isinstance(text, str) else " ".join(map(str, text)))}
+            for i, text in enumerate(inputs)
+        ]
+        self._send_json({"object": "list", "model": body["model"], "data": data, "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+    def _route(self, prompt):
+        if self.router_reply:
+            return self.router_reply
+        query = prompt.split("User query:", 1)[-1].split("ROUTING INSTRUCTIONS", 1)[0].lower()
+        for agent, keywords in (("Agent 1", ("admission", "apply", "entry")), ("Agent 2", ("fee", "finance", "scholarship", "payment")), ("Agent 3", ("exam", "course", "result"))):
+            if any(keyword in query for keyword in keywords):
+                return agent
+        return "Agent 4"
+
+    def _chat_completion(self, body):
+        prompt = body["messages"][-1]["content"]
+        is_router = "router" in body["messages"][0]["content"]
+        content = self._route(prompt) if is_router else "This is a stub answer generated for benchmarking the UTAR chatbot pipeline."
+        prompt_tokens = sum(len(message["content"].split()) for message in body["messages"])
+        time.sleep(self.latency)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in content.split(" "):
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(self.token_latency)
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+            return
+
+        self._send_json({
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()), "total_tokens": prompt_tokens + len(content.split())}
+        })
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the socketserver default of 5 refuses connections under load
+
+
+def start_stub_server(port=0, latency=0.5, token_latency=0.0, embedding_latency=0.0, router_reply=None):
+    """Start the stub in a background thread and return (server, base_url)"""
+    handler = type("ConfiguredStubHandler", (StubOpenAIHandler,), {
+        "latency": latency, "token_latency": token_latency,
+        "embedding_latency": embedding_latency, "router_reply": router_reply
+    })
+    server = StubOpenAIServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def configure_stub_environment(base_url):
+    """Point the chatbot's OpenAI clients at the stub. Must run before agent_classes is imported"""
+    import os
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY_CHAT", "stub")
+    os.environ.setdefault("OPENAI_API_KEY_EMBED", "stub")
+    os.environ.setdefault("OPENAI_MODEL_NAME", "stub-model")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # Keep stub vectors out of the real persistent embedding cache
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each completion is returned")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds before embeddings are returned")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.latency, args.token_latency, args.embedding_latency)
+    print(f"Stub OpenAI server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,106 @@
+"""A local stand-in for Redis speaking enough of its protocol (PING, GET, SET with EX/PX, DEL, EXPIRE, TTL,
+AUTH, SELECT) to exercise SESSION_BACKEND=redis without a Redis server.
+
+Usage: python -m benchmarks.stub_redis --port 6379
+"""
+import time
+import argparse
+import threading
+import socketserver
+
+
+class StubRedisHandler(socketserver.StreamRequestHandler):
+    store = None  # key -> (value, expires at or None), shared by the server
+    lock = None
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _reply(self, value):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(value, int):
+            self.wfile.write(b":%d\r\n" % value)
+        elif isinstance(value, bytes):
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+        elif value.startswith("ERR"):
+            self.wfile.write(f"-{value}\r\n".encode())
+        else:
+            self.wfile.write(f"+{value}\r\n".encode())
+
+    def _get(self, key):
+        entry = self.store.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.store[key]
+            return None
+        return entry
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            with self.lock:
+                if command in (b"PING", b"AUTH", b"SELECT"):
+                    reply = "PONG" if command == b"PING" else "OK"
+                elif command == b"GET":
+                    entry = self._get(args[1])
+                    reply = entry[0] if entry else None
+                elif command == b"SET":
+                    expires_at = None
+                    options = [arg.upper() for arg in args[3:]]
+                    if b"EX" in options:
+                        expires_at = time.time() + int(args[3 + options.index(b"EX") + 1])
+                    elif b"PX" in options:
+                        expires_at = time.time() + int(args[3 + options.index(b"PX") + 1]) / 1000
+                    self.store[args[1]] = (args[2], expires_at)
+                    reply = "OK"
+                elif command == b"DEL":
+                    reply = sum(self.store.pop(key, None) is not None for key in args[1:])
+                elif command == b"EXPIRE":
+                    entry = self._get(args[1])
+                    if entry:
+                        self.store[args[1]] = (entry[0], time.time() + int(args[2]))
+                    reply = 1 if entry else 0
+                elif command == b"TTL":
+                    entry = self._get(args[1])
+                    reply = -2 if entry is None else -1 if entry[1] is None else int(entry[1] - time.time())
+                else:
+                    reply = f"ERR unknown command '{command.decode()}'"
+            self._reply(reply)
+
+
+class StubRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_stub_redis(port=0):
+    """Start the stand-in in a background thread and return (server, url)"""
+    handler = type("ConfiguredStubRedisHandler", (StubRedisHandler,), {"store": {}, "lock": threading.Lock()})
+    server = StubRedisServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{server.server_address[1]}/0"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local Redis protocol stand-in for the session store")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server, url = start_stub_redis(args.port)
+    print(f"Stub Redis listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
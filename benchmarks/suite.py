@@ -0,0 +1,227 @@
+"""Offline benchmark suite: builds synthetic department corpora through the agents' indexing pipeline and drives
+AgentOrchestrator.process_query and the Flask /chat route at controlled concurrency, all against the stub
+OpenAI server. Reports throughput, p50/p95/p99 latency, RSS and startup time, and saves them as JSON.
+
+Usage: python -m benchmarks.suite --sizes 100,1000 --concurrency 1,8,32 --requests 200 --output results.json
+       python -m benchmarks.suite ... --baseline previous.json   # print changes against an earlier run
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.stub_openai import start_stub_server, configure_stub_environment
+from benchmarks.synthetic_corpus import DEPARTMENT_TOPICS, make_documents, make_queries
+
+DEPARTMENTS = list(DEPARTMENT_TOPICS)  # in the orchestrator's agent order
+
+
+def rss_mb():
+    import psutil
+    return round(psutil.Process().memory_info().rss / 2**20, 1)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1)
+    }
+
+
+def measure_cold_import(env):
+    """Seconds to import the app in a fresh interpreter, i.e. worker boot time before serving"""
+    code = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return round(float(result.stdout.strip().splitlines()[-1]), 3)
+
+
+def reset_agent(agent):
+    agent.vector_db = None
+    agent._is_initialized = False
+    agent.load_state = "idle"
+    agent._retry_at = 0.0
+
+
+def load_corpus(orchestrator, size, folder):
+    """Point every agent at a synthetic corpus of `size` documents and build its database the way
+    build_index.py does, then time loading the built databases as a serving worker would"""
+    result = {"documents_per_agent": size}
+    for agent, department in zip(orchestrator.agents, DEPARTMENTS):
+        documents = make_documents(department, size)
+        agent.vector_db_path = os.path.join(folder, "vector_db", department)
+        agent.doc_folder_path = os.path.join(folder, "docs", department)
+        os.makedirs(agent.doc_folder_path, exist_ok=True)
+        # The corpus arrives as scraped pages, so indexing runs the manifest, split, embed and insert stages
+        agent.scrape_web_pdfs = lambda urls, department, pages=None: []
+        agent.scrape_webpage = lambda urls, pages=None, documents=documents: documents
+        reset_agent(agent)
+
+    start = time.perf_counter()
+    for agent in orchestrator.agents:
+        agent.refresh_index()
+    result["build_seconds"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    for agent in orchestrator.agents:
+        reset_agent(agent)
+        agent.initialize()
+    result["reload_seconds"] = round(time.perf_counter() - start, 3)
+
+    orchestrator.router.invalidate()
+    result["rss_mb"] = rss_mb()
+    return result
+
+
+def run_load(call, queries, total, concurrency):
+    errors = []
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            call(queries[i % len(queries)])
+        except Exception as e:
+            errors.append(str(e))
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(total)))
+    return summarize(latencies, time.perf_counter() - start, len(errors))
+
+
+def start_flask_server(flask_app):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def flask_caller(base_url):
+    import httpx
+    local = threading.local()
+
+    def call(query):
+        if not hasattr(local, "client"):
+            local.client = httpx.Client(base_url=base_url, timeout=120)
+        response = local.client.post("/chat", json={"question": query})
+        response.raise_for_status()
+
+    return call
+
+
+def compare(results, baseline):
+    """Print the change of each load result against a matching one in the baseline"""
+    def key(entry):
+        return entry["target"], entry["documents_per_agent"], entry["concurrency"]
+
+    previous = {key(entry): entry for entry in baseline.get("load", [])}
+    print("\nChange against baseline:")
+    for entry in results["load"]:
+        old = previous.get(key(entry))
+        if old is None:
+            continue
+        changes = []
+        for metric in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+            if old[metric]:
+                changes.append(f"{metric} {(entry[metric] - old[metric]) / old[metric]:+.1%}")
+        print(f"  {entry['target']:<14} size {entry['documents_per_agent']:<6} c={entry['concurrency']:<4} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite against the stub OpenAI server")
+    parser.add_argument("--sizes", default="100,1000", help="Comma-separated documents per department")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per load run")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub completion latency in seconds")
+    parser.add_argument("--targets", default="process_query,flask_chat")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    targets = args.targets.split(",")
+
+    server, base_url = start_stub_server(latency=args.latency)
+    configure_stub_environment(base_url)
+    folder = tempfile.mkdtemp(prefix="benchmark-suite-")
+    os.environ.setdefault("VECTOR_DB_BUNDLE_PATH", os.path.join(folder, "no_bundle.zip"))
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "startup": {},
+        "corpora": [],
+        "load": []
+    }
+
+    try:
+        results["startup"]["cold_import_seconds"] = measure_cold_import(dict(os.environ))
+        results["startup"]["rss_before_import_mb"] = rss_mb()
+        start = time.perf_counter()
+        import agent_classes
+        # Stub embeddings take raw text, so skip tiktoken chunking (which downloads encodings)
+        agent_classes.openai_embeddings.embeddings.check_embedding_ctx_length = False
+        import app
+        results["startup"]["import_seconds"] = round(time.perf_counter() - start, 3)
+        results["startup"]["rss_after_import_mb"] = rss_mb()
+
+        orchestrator = app.agent_orchestrator
+        app.app.config["SESSION_COOKIE_SECURE"] = False
+        flask_server, flask_url = start_flask_server(app.app)
+        callers = {
+            "process_query": lambda query: orchestrator.process_query(query, [{"role": "user", "content": query}]),
+            "flask_chat": flask_caller(flask_url)
+        }
+
+        for size in sizes:
+            corpus = load_corpus(orchestrator, size, os.path.join(folder, str(size)))
+            results["corpora"].append(corpus)
+            print(f"{size} docs/agent: built in {corpus['build_seconds']}s, reloaded in {corpus['reload_seconds']}s, RSS {corpus['rss_mb']} MB")
+
+            queries = [query for department in DEPARTMENTS for query, _ in make_queries(department, size, 25)]
+            for target in targets:
+                for concurrency in levels:
+                    entry = {"target": target, "documents_per_agent": size, "concurrency": concurrency}
+                    entry.update(run_load(callers[target], queries, args.requests, concurrency))
+                    entry["rss_mb"] = rss_mb()
+                    results["load"].append(entry)
+                    print(f"  {target:<14} c={concurrency:<4} {entry['throughput']:8.1f} req/s   p50 {entry['p50_ms']:7.1f}ms   "
+                          f"p95 {entry['p95_ms']:7.1f}ms   p99 {entry['p99_ms']:7.1f}ms   errors {entry['errors']}   RSS {entry['rss_mb']} MB")
+
+        flask_server.shutdown()
+    finally:
+        server.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Deterministic synthetic department corpora and query sets for benchmarks."""
+import random
+from langchain_core.documents import Document
+
+DEPARTMENT_TOPICS = {
+    "admissions": ["entry requirements", "application deadline", "foundation programme", "credit transfer", "English language requirement", "intake"],
+    "finance": ["tuition fee", "scholarship", "payment schedule", "refund policy", "late payment penalty", "bursary"],
+    "examinations": ["exam timetable", "resit examination", "grading scheme", "exam regulations", "transcript", "convocation"],
+    "general": ["library hours", "campus shuttle", "student portal", "hostel", "counselling service", "sports complex"]
+}
+
+FILLER = (
+    "Students are advised to refer to the latest announcement on the portal. "
+    "Enquiries may be directed to the relevant division during office hours. "
+    "The university reserves the right to amend these terms without prior notice. "
+)
+
+CODE_PREFIX = {"admissions": "ADM", "finance": "DFN", "examinations": "UECS", "general": "GEN"}
+
+
+def make_documents(department, count, seed=0):
+    """Documents that each mention a unique code and a topic, padded with boilerplate to chunk-like sizes"""
+    rng = random.Random(f"{department}-{seed}")
+    topics = DEPARTMENT_TOPICS[department]
+    documents = []
+    for i in range(count):
+        topic = topics[i % len(topics)]
+        code = f"{CODE_PREFIX[department]}{1000 + i}"
+        amount = f"{rng.randint(1, 90) * 100:,}.00"
+        text = (
+            f"{topic.capitalize()} notice {code}. "
+            f"Regarding the {topic}, form {code} must be submitted and the charge is RM{amount}. "
+            + FILLER * rng.randint(2, 6)
+        )
+        documents.append(Document(page_content=text, metadata={"source": f"{department}-{code}.pdf"}))
+    return documents
+
+
+def make_queries(department, corpus_size, count, seed=0):
+    """(query, expected source) pairs over a corpus from make_documents:
+    half exact-code lookups, half topical questions naming the code's topic"""
+    rng = random.Random(f"queries-{department}-{seed}")
+    topics = DEPARTMENT_TOPICS[department]
+    queries = []
+    for n in range(count):
+        i = rng.randrange(corpus_size)
+        code = f"{CODE_PREFIX[department]}{1000 + i}"
+        if n % 2 == 0:
+            query = f"What is form {code}?"
+        else:
+            query = f"Tell me about the {topics[i % len(topics)]} notice {code}"
+        queries.append((query, f"{department}-{code}.pdf"))
+    return queries
@@ -0,0 +1,91 @@
+"""Chroma vs the memory-mapped NumPy vector store: load time, top-k latency and agreement of results.
+
+Uses random text-embedding-3-large sized vectors, so no embedding calls are made.
+
+Usage: python -m benchmarks.vector_store_benchmark --documents 5000 --queries 200 --dtype float16
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from benchmarks.synthetic_corpus import make_documents
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+
+
+def time_queries(store, query_vectors, k):
+    latencies = []
+    results = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector.tolist(), k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([doc.id for doc in docs])
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Chroma and the numpy vector store")
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    from langchain_chroma import Chroma
+    from numpy_vector_store import NumpyVectorStore
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.documents, args.dimensions), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries close to stored chunks, like a question about one of them
+    targets = rng.integers(0, args.documents, args.queries)
+    query_vectors = vectors[targets] + 0.5 * rng.standard_normal((args.queries, args.dimensions), dtype=np.float32) / np.sqrt(args.dimensions)
+
+    documents = make_documents("general", args.documents)
+    folder = tempfile.mkdtemp(prefix="vector-store-benchmark-")
+    try:
+        chroma_path = os.path.join(folder, "general")
+        chroma = Chroma(persist_directory=chroma_path, collection_metadata={"hnsw:space": "cosine"})
+        for start in range(0, args.documents, 1000):
+            end = min(start + 1000, args.documents)
+            chroma._collection.add(
+                ids=[str(i) for i in range(start, end)],
+                embeddings=vectors[start:end],
+                documents=[doc.page_content for doc in documents[start:end]],
+                metadatas=[doc.metadata for doc in documents[start:end]]
+            )
+
+        start = time.perf_counter()
+        store = NumpyVectorStore.export(chroma, f"{chroma_path}.numpy", None, dtype=args.dtype)
+        export_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        Chroma(persist_directory=chroma_path).similarity_search_by_vector(query_vectors[0].tolist(), k=args.k)
+        chroma_load = time.perf_counter() - start
+        start = time.perf_counter()
+        NumpyVectorStore(f"{chroma_path}.numpy", None).similarity_search_by_vector(query_vectors[0], k=args.k)
+        numpy_load = time.perf_counter() - start
+
+        chroma_latencies, chroma_results = time_queries(chroma, query_vectors, args.k)
+        numpy_latencies, numpy_results = time_queries(store, query_vectors, args.k)
+        agreement = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(chroma_results, numpy_results)])
+
+        print(f"{args.documents} x {args.dimensions} vectors, {args.queries} queries, k={args.k}, export {export_seconds:.2f}s")
+        for label, load, latencies in [("chroma", chroma_load, chroma_latencies), (f"numpy {args.dtype}", numpy_load, numpy_latencies)]:
+            p50, p95 = percentiles(latencies)
+            print(f"{label:<14} open + first query {load * 1000:8.1f}ms   p50 {p50:6.2f}ms   p95 {p95:6.2f}ms")
+        print(f"top-{args.k} agreement with Chroma: {agreement:.1%}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Build the agents' indexes offline and publish them as a versioned release, which running servers
+swap in without a restart (see INDEX_RELEASES_PATH in agent_orchestrator.py).
+
+A build starts from a copy of the published release (or --seed), so only new or changed sources are
+scraped, parsed and embedded again. The release is checksummed, verified and then published.
+
+Usage: python build_index.py                                  # build every agent and publish
+       python build_index.py --agents finance,admissions      # rebuild some agents, copy the others
+       python build_index.py --clean --no-publish             # re-embed everything, publish later
+       python build_index.py --seed /var/data/vector_db       # first release from existing databases
+       python build_index.py --list
+       python build_index.py --verify VERSION
+       python build_index.py --publish VERSION                # e.g. roll back to an earlier release
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import logging
+import subprocess
+from agent_classes import embedding_model, EMBEDDING_MODEL_NAME
+from agent_orchestrator import create_agents, INDEX_RELEASES_PATH, UNIFIED_INDEX
+from index_releases import IndexReleases
+from unified_index import UnifiedIndex
+
+
+def count_chunks(vector_db):
+    if hasattr(vector_db, "count"):
+        return vector_db.count()
+    return vector_db._collection.count()
+
+
+def copy_databases(source_folder, target_folder, skip=()):
+    """Copy built databases (and their numpy exports) into a staged release, except the skipped index names"""
+    for name in os.listdir(source_folder):
+        if name.split(".")[0] in skip or name.startswith("."):
+            continue
+        source = os.path.join(source_folder, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(target_folder, name), symlinks=True)
+
+
+def index_in_release(agent, vector_db_folder, unified_index):
+    """Whether a staged release holds an index for the agent (every built index has a manifest)"""
+    if unified_index is not None:
+        return os.path.exists(unified_index.manifest_path(agent.index_name))
+    return os.path.isdir(os.path.join(vector_db_folder, agent.index_name))
+
+
+def build(releases, args):
+    all_agents = agents = [agent for agent in create_agents() if agent.vector_db_path]
+    # The databases served without releases, e.g. extracted from the bundle
+    live_vector_db_folder = os.path.dirname(agents[0].vector_db_path)
+    if args.agents != "all":
+        selected = set(args.agents.split(","))
+        unknown = selected - {agent.index_name for agent in agents}
+        if unknown:
+            raise SystemExit(f"Unknown agents: {', '.join(sorted(unknown))}")
+        agents = [agent for agent in agents if agent.index_name in selected]
+        if args.clean and UNIFIED_INDEX:
+            raise SystemExit("--clean rebuilds the whole unified index, leave out --agents")
+
+    version = releases.new_version()
+    staging_path = releases.staging_path(version)
+    vector_db_folder = os.path.join(staging_path, "vector_db")
+    os.makedirs(vector_db_folder)
+
+    base = releases.current()
+    seed = args.seed or (releases.vector_db_folder(base) if base else None)
+    if not seed and args.agents != "all" and os.path.isdir(live_vector_db_folder):
+        # No release yet: the agents that are not built come from the databases served now
+        seed = live_vector_db_folder
+    if seed:
+        # Built agents reuse their previous chunks unless --clean, the others are copied as they are
+        skip = {agent.index_name for agent in agents} if args.clean else set()
+        if not (args.clean and UNIFIED_INDEX):
+            logging.info(f"Starting from {seed}")
+            copy_databases(seed, vector_db_folder, skip)
+
+    unified_index = UnifiedIndex(os.path.join(vector_db_folder, "unified"), embedding_model) if UNIFIED_INDEX else None
+    built = {}
+    try:
+        for agent in agents:
+            agent.vector_db_path = os.path.join(vector_db_folder, agent.index_name)
+            agent.unified_index = unified_index
+            if args.numpy:
+                agent.vector_backend = "numpy"
+
+            logging.info(f"Building the index for {agent.name}...")
+            start = time.perf_counter()
+            summary = agent.refresh_index()
+            if summary is None:
+                raise RuntimeError(f"Building the index for {agent.name} failed")
+            chunks = count_chunks(agent.vector_db)
+            if chunks == 0:
+                if agent.urls:
+                    raise RuntimeError(f"The index for {agent.name} is empty")
+                # e.g. the general agent, which has no webpages and may have no PDFs
+                logging.warning(f"{agent.name} has no webpages and no PDFs in {agent.doc_folder_path}, its index is empty")
+            built[agent.index_name] = dict(summary, name=agent.name, chunks=chunks, seconds=round(time.perf_counter() - start, 1))
+            logging.info(f"Built {agent.name}: {chunks} chunks in {built[agent.index_name]['seconds']}s")
+            agent.vector_db = None
+
+        missing = [agent.name for agent in all_agents if not index_in_release(agent, vector_db_folder, unified_index)]
+        if missing:
+            # Servers would keep failing to load them from this release
+            raise RuntimeError(f"The release has no index for {', '.join(missing)}, build them too or pass --seed")
+
+        # Stop Chroma's clients so everything they buffer is on disk before the files are checksummed
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+
+        info = releases.finalize(version, {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip(),
+            "base": args.seed or base or seed,
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "unified": UNIFIED_INDEX,
+            "built": built
+        })
+    except BaseException:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
+    print(f"Built index release {version} ({len(info['files'])} files)")
+    return version
+
+
+def verify(releases, version):
+    mismatched = releases.verify(version)
+    if mismatched:
+        raise SystemExit(f"Release {version} is damaged: {', '.join(mismatched[:10])}")
+    print(f"Release {version} verified")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and publish versioned index releases")
+    parser.add_argument("--releases", default=INDEX_RELEASES_PATH, help="Folder holding the releases")
+    parser.add_argument("--agents", default="all", help="Comma-separated index names, e.g. finance,admissions")
+    parser.add_argument("--clean", action="store_true", help="Re-embed the built agents from scratch")
+    parser.add_argument("--seed", help="Databases folder to start from instead of the published release")
+    parser.add_argument("--numpy", action="store_true", help="Also export numpy vector stores for VECTOR_BACKEND=numpy")
+    parser.add_argument("--no-publish", action="store_true", help="Build without publishing")
+    parser.add_argument("--keep", type=int, default=3, help="Releases to keep, older ones are deleted")
+    parser.add_argument("--list", action="store_true", help="List the releases")
+    parser.add_argument("--verify", metavar="VERSION", help="Check a release against its checksums")
+    parser.add_argument("--publish", metavar="VERSION", help="Publish an existing release")
+    args = parser.parse_args()
+
+    releases = IndexReleases(args.releases)
+
+    if args.list:
+        current = releases.current()
+        for version in releases.versions():
+            built = releases.read(version).get("built", {})
+            print(f"{'*' if version == current else ' '} {version}  built: {', '.join(built) or '-'}")
+        return
+
+    if args.verify:
+        verify(releases, args.verify)
+        return
+
+    if args.publish:
+        verify(releases, args.publish)
+        releases.publish(args.publish)
+        print(f"Published {args.publish}")
+        return
+
+    os.makedirs(args.releases, exist_ok=True)
+    version = build(releases, args)
+    verify(releases, version)
+    if not args.no_publish:
+        releases.publish(version)
+        print(f"Published {version}")
+        removed = releases.prune(args.keep)
+        if removed:
+            print(f"Deleted old releases: {', '.join(removed)}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except RuntimeError as e:
+        logging.error(str(e))
+        sys.exit(1)
@@ -0,0 +1,163 @@
+import os
+import logging
+import threading
+
+# Token budgets for the user prompt (template, question, history and context together)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "6"))  # most recent messages considered
+RECENT_TURNS_KEPT_IN_FULL = 2  # the last question and answer share the history budget, earlier messages are clipped
+OLDER_TURN_TOKENS = int(os.getenv("OLDER_TURN_TOKENS", "80"))
+MIN_PASSAGE_TOKENS = 50  # a passage cut shorter than this is dropped instead
+
+# Overlap between consecutive chunks of the same source, see BaseAgent.split_documents (chunk_overlap=200)
+MIN_OVERLAP_CHARS = 40
+MAX_OVERLAP_CHARS = 300
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+class _ApproximateEncoding:
+    """Roughly four characters per token, used when tiktoken's encodings cannot be loaded"""
+
+    def encode(self, text):
+        return range(0, len(text), 4)
+
+    def truncate(self, text, tokens):
+        return text[:tokens * 4]
+
+
+class _TiktokenEncoding:
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+    def encode(self, text):
+        return self.encoding.encode(text, disallowed_special=())
+
+    def truncate(self, text, tokens):
+        return self.encoding.decode(self.encode(text)[:tokens])
+
+
+def get_encoding():
+    """The tokenizer of the chat model, loaded once"""
+    global _encoding
+    if _encoding is not None:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(os.getenv("OPENAI_MODEL_NAME") or "")
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                _encoding = _TiktokenEncoding(encoding)
+            except Exception as e:
+                logging.warning(f"Could not load a tiktoken encoding, approximating token counts: {e}")
+                _encoding = _ApproximateEncoding()
+        return _encoding
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text))
+
+
+def truncate_tokens(text, tokens):
+    return get_encoding().truncate(text, tokens)
+
+
+def _overlap(previous, text):
+    """Length of the longest suffix of previous that starts text, as left by the splitter's chunk overlap"""
+    for length in range(min(len(previous), len(text), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:length]):
+            return length
+    return 0
+
+
+def merge_passages(contexts):
+    """Turn retrieved chunks into passages in rank order: duplicates are dropped, and a chunk that
+    continues another chunk of the same source is appended to it without the repeated overlap"""
+    passages = []  # [source, text]
+    for doc in contexts:
+        source = doc.metadata.get("source")
+        text = doc.page_content.strip()
+        for passage in passages:
+            if passage[0] != source:
+                continue
+            if text in passage[1]:
+                break
+            overlap = _overlap(passage[1], text)
+            if overlap:
+                passage[1] += text[overlap:]
+                break
+            overlap = _overlap(text, passage[1])
+            if overlap:
+                passage[1] = text + passage[1][overlap:]
+                break
+        else:
+            passages.append([source, text])
+    return [text for _, text in passages]
+
+
+def compact_history(history, budget=HISTORY_TOKEN_BUDGET):
+    """Format the recent conversation within a token budget. The last exchange gets most of the budget,
+    earlier messages are clipped harder, and the oldest are dropped until the rest fits"""
+    recent = history[-HISTORY_TURNS:] if HISTORY_TURNS else []
+    lines = []
+    for i, msg in enumerate(recent):
+        content = msg["content"]
+        if isinstance(content, dict):
+            content = content.get("response", "")  # assistant turns hold the response with its references
+        if i < len(recent) - RECENT_TURNS_KEPT_IN_FULL:
+            limit = OLDER_TURN_TOKENS
+        else:
+            limit = budget // RECENT_TURNS_KEPT_IN_FULL - 5  # leave room for the role prefix
+        if count_tokens(content) > limit:
+            content = truncate_tokens(content, max(limit, 0)).rstrip() + " ..."
+        lines.append(f"{msg['role'].capitalize()}: {content}")
+
+    costs = [count_tokens(line) + 1 for line in lines]
+    while lines and sum(costs) > budget:
+        lines.pop(0)
+        costs.pop(0)
+    return "\n".join(lines), len(lines)
+
+
+def fit_passages(passages, budget):
+    """Keep passages in rank order until the budget is spent, cutting the last one if enough room is left"""
+    selected = []
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    for passage in passages:
+        tokens = count_tokens(passage) + (separator_tokens if selected else 0)
+        if tokens <= budget:
+            selected.append(passage)
+            budget -= tokens
+            continue
+        if budget >= MIN_PASSAGE_TOKENS:
+            selected.append(truncate_tokens(passage, budget - separator_tokens))
+        break
+    return selected
+
+
+def build_prompt(template, query, contexts, history, name, budget=PROMPT_TOKEN_BUDGET):
+    """Fill a prompt template ({name}, {query}, {history} and optionally {context}) within the token budget.
+    History is compacted first, then as many retrieved passages as still fit are included"""
+    overhead = count_tokens(template.format(name=name, query=query, history="", context=""))
+    formatted_history, history_turns = compact_history(history, min(HISTORY_TOKEN_BUDGET, max(0, budget - overhead)))
+    history_tokens = count_tokens(formatted_history)
+
+    passages = []
+    if "{context}" in template:
+        passages = fit_passages(merge_passages(contexts), budget - overhead - history_tokens)
+    combined_context = CONTEXT_SEPARATOR.join(passages)
+
+    prompt = template.format(name=name, query=query, history=formatted_history, context=combined_context)
+    logging.info(
+        f"[{name}] Prompt tokens: {count_tokens(prompt)} of {budget} "
+        f"(history {history_tokens} from {history_turns}/{len(history)} messages, "
+        f"context {count_tokens(combined_context)} from {len(passages)} passages of {len(contexts)} chunks)"
+    )
+    return prompt
@@ -0,0 +1,202 @@
+import os
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings model with a two-tier cache keyed by (model name, text hash):
+    an in-memory LRU in front of a SQLite store that persists across restarts and rebuilds.
+    Used in place of the wrapped model, so Chroma ingestion and similarity search both go through it.
+    The store is shared with other workers and index builds: when it is busy or fails, lookups count
+    as misses and new vectors are only kept in memory, so a query never fails on the cache."""
+
+    def __init__(self, embeddings, model_name, db_path=None, memory_entries=1024, busy_timeout=0.5):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.connection = None
+        # Size of the store, counted once and then as this process adds to it
+        self.stored_entries = 0
+        self.stored_bytes = 0
+
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self.connection = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False)
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                    "PRIMARY KEY (model, text_hash))"
+                )
+                self.connection.commit()
+                self.stored_entries, self.stored_bytes = self.connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ?",
+                    [self.model_name]
+                ).fetchone()
+            except sqlite3.Error as e:
+                logging.warning(f"Embedding cache store unavailable at {db_path}, using memory only: {e}")
+                self.connection = None
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _lookup(self, texts):
+        """Return cached vectors (None for misses) and the hashes of the texts"""
+        hashes = [self._hash(text) for text in texts]
+        vectors = [None] * len(texts)
+        with self._lock:
+            disk_lookups = []
+            for i, text_hash in enumerate(hashes):
+                if text_hash in self.memory:
+                    self.memory.move_to_end(text_hash)
+                    vectors[i] = self.memory[text_hash]
+                    self.hits["memory"] += 1
+                else:
+                    disk_lookups.append(i)
+
+            if disk_lookups and self.connection is not None:
+                wanted = list({hashes[i] for i in disk_lookups})
+                found = {}
+                try:
+                    # Stay below SQLite's bound parameter limit
+                    for start in range(0, len(wanted), 500):
+                        batch = wanted[start:start + 500]
+                        rows = self.connection.execute(
+                            f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                            [self.model_name, *batch]
+                        ).fetchall()
+                        found.update((text_hash, np.frombuffer(blob, dtype=np.float32)) for text_hash, blob in rows)
+                except sqlite3.Error as e:
+                    logging.warning(f"Embedding cache store lookup failed, treating it as a miss: {e}")
+                for i in disk_lookups:
+                    if hashes[i] in found:
+                        vectors[i] = found[hashes[i]]
+                        self._remember(hashes[i], vectors[i])
+                        self.hits["disk"] += 1
+
+            self.misses += sum(vector is None for vector in vectors)
+        return vectors, hashes
+
+    def _store(self, hashes, computed):
+        """Keep newly computed vectors in both tiers"""
+        with self._lock:
+            for text_hash, vector in zip(hashes, computed):
+                self._remember(text_hash, vector)
+            if self.connection is not None and hashes:
+                try:
+                    # A text's vector never changes, so rows written meanwhile by another process are kept
+                    cursor = self.connection.executemany(
+                        "INSERT OR IGNORE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                        [(self.model_name, text_hash, vector.tobytes()) for text_hash, vector in zip(hashes, computed)]
+                    )
+                    self.connection.commit()
+                    self.stored_entries += cursor.rowcount
+                    self.stored_bytes += cursor.rowcount * computed[0].nbytes
+                except sqlite3.Error as e:
+                    logging.warning(f"Embedding cache store write failed, keeping the vectors in memory only: {e}")
+                    try:
+                        self.connection.rollback()
+                    except sqlite3.Error:
+                        pass
+
+    def _missing(self, texts, vectors, hashes):
+        """Unique texts that still need to be embedded, with their hashes"""
+        missing = {}
+        for text, vector, text_hash in zip(texts, vectors, hashes):
+            if vector is None and text_hash not in missing:
+                missing[text_hash] = text
+        return list(missing.values()), list(missing.keys())
+
+    def _fill(self, vectors, hashes, missing_hashes, computed):
+        computed = [np.asarray(vector, dtype=np.float32) for vector in computed]
+        self._store(missing_hashes, computed)
+        by_hash = dict(zip(missing_hashes, computed))
+        return [(vector if vector is not None else by_hash[text_hash]).tolist() for vector, text_hash in zip(vectors, hashes)]
+
+    def embed_documents(self, texts):
+        vectors, hashes = self._lookup(texts)
+        missing_texts, missing_hashes = self._missing(texts, vectors, hashes)
+        computed = self.embeddings.embed_documents(missing_texts) if missing_texts else []
+        return self._fill(vectors, hashes, missing_hashes, computed)
+
+    def embed_query(self, text):
+        vectors, hashes = self._lookup([text])
+        computed = [self.embeddings.embed_query(text)] if vectors[0] is None else []
+        return self._fill(vectors, hashes, hashes if computed else [], computed)[0]
+
+    # The async variants read and write the SQLite store in a thread, so a slow disk or a WAL
+    # checkpoint does not stall the event loop (and every request on it) under the cache lock
+    async def aembed_documents(self, texts):
+        vectors, hashes = await asyncio.to_thread(self._lookup, texts)
+        missing_texts, missing_hashes = self._missing(texts, vectors, hashes)
+        computed = await self.embeddings.aembed_documents(missing_texts) if missing_texts else []
+        return await asyncio.to_thread(self._fill, vectors, hashes, missing_hashes, computed)
+
+    async def aembed_query(self, text):
+        vectors, hashes = await asyncio.to_thread(self._lookup, [text])
+        computed = [await self.embeddings.aembed_query(text)] if vectors[0] is None else []
+        return (await asyncio.to_thread(self._fill, vectors, hashes, hashes if computed else [], computed))[0]
+
+    def stats(self):
+        """Hit rates per tier and the size of the persistent store (without scanning it, so entries other
+        processes added since this one started are not included)"""
+        with self._lock:
+            lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+            stats = {
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "hit_rate": round((self.hits["memory"] + self.hits["disk"]) / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "stored_entries": self.stored_entries,
+                "stored_bytes": self.stored_bytes
+            }
+            return stats
+
+
+class LazyEmbeddings(Embeddings):
+    """Creates the wrapped embeddings model on first use, so its client library is only imported
+    once a worker actually embeds something"""
+
+    def __init__(self, create):
+        self.create = create
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.create()
+        return self._embeddings
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
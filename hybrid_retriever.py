@@ -0,0 +1,104 @@
+import re
+import math
+import logging
+from collections import Counter, defaultdict
+import numpy as np
+from langchain_core.documents import Document
+
+# Keeps course codes, form numbers and amounts together, e.g. "uecs3213", "dfn-01", "2,500.00"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/.,][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """A compact in-memory BM25 inverted index over an agent's stored chunks.
+    Each term maps to parallel int32/float32 arrays of chunk positions and term frequencies,
+    so scoring a query is a few vectorized array updates per query term."""
+
+    def __init__(self, ids, texts, metadatas, k1=1.5, b=0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            term_counts = Counter(tokenize(text))
+            doc_lengths[position] = sum(term_counts.values())
+            for term, count in term_counts.items():
+                postings[term][0].append(position)
+                postings[term][1].append(count)
+
+        self.doc_lengths = doc_lengths
+        self.average_length = float(doc_lengths.mean()) if len(texts) else 0.0
+        self.postings = {
+            term: (np.asarray(positions, dtype=np.int32), np.asarray(counts, dtype=np.float32))
+            for term, (positions, counts) in postings.items()
+        }
+        self.idf = {
+            term: math.log(1 + (len(texts) - len(positions) + 0.5) / (len(positions) + 0.5))
+            for term, (positions, _) in self.postings.items()
+        }
+
+    @classmethod
+    def from_vector_db(cls, vector_db):
+        """Build the index from the chunks stored in a Chroma collection"""
+        stored = vector_db.get(include=["documents", "metadatas"])
+        index = cls(stored["ids"], stored["documents"], stored["metadatas"])
+        logging.info(f"Built BM25 index over {len(index.ids)} chunks and {len(index.postings)} terms")
+        return index
+
+    def scores(self, query):
+        """BM25 score of every chunk for the query"""
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        if not len(self.texts):
+            return scores
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / (self.average_length or 1.0))
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                positions, counts = self.postings[term]
+                scores[positions] += self.idf[term] * counts * (self.k1 + 1) / (counts + length_norm[positions])
+        return scores
+
+    def search(self, query, k=3):
+        """Top-k (score, position) pairs with a positive score, best first"""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[position]), int(position)) for position in top if scores[position] > 0]
+
+    def document(self, position):
+        return Document(id=self.ids[position], page_content=self.texts[position], metadata=self.metadatas[position] or {})
+
+    def is_strong_keyword_hit(self, query, results, ratio=2.0):
+        """Whether the query names an exact identifier (a token with digits, like a course code or form number)
+        that occurs in the best lexical match, and that match beats the runner-up by at least ratio"""
+        if not results:
+            return False
+        top_position = results[0][1]
+        has_identifier = any(
+            any(ch.isdigit() for ch in term) and term in self.postings and bool((self.postings[term][0] == top_position).any())
+            for term in set(tokenize(query))
+        )
+        runner_up = results[1][0] if len(results) > 1 else 0.0
+        return has_identifier and results[0][0] >= ratio * runner_up
+
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """Fuse ranked lists of documents by summing 1 / (k + rank) per document ID"""
+    scores = {}
+    documents = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import logging
+from ingestion import file_hash
+
+RELEASE_FILE_NAME = "release.json"
+CURRENT_LINK_NAME = "current"
+
+
+def folder_checksums(folder):
+    """SHA-256 of every file under a folder, keyed by relative path"""
+    checksums = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, folder)
+            if relative_path != RELEASE_FILE_NAME:
+                checksums[relative_path] = file_hash(path)
+    return checksums
+
+
+def _sqlite_intact(path):
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return connection.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return False
+
+
+class IndexReleases:
+    """Versioned index artifacts built offline by build_index.py, one folder per version:
+
+        <root>/<version>/vector_db/<index name>   per-department databases (or vector_db/unified)
+        <root>/<version>/release.json             what was built, and a checksum of every file
+        <root>/current -> <version>               the published version
+
+    Publishing swaps the current symlink with a rename, so a reader always resolves a complete release"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, version):
+        return os.path.join(self.root, version)
+
+    def vector_db_folder(self, version):
+        return os.path.join(self.path(version), "vector_db")
+
+    def current(self):
+        """The published version, or None"""
+        try:
+            return os.path.basename(os.readlink(os.path.join(self.root, CURRENT_LINK_NAME)))
+        except OSError:
+            return None
+
+    def versions(self):
+        """Complete releases, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if not name.startswith(".") and not os.path.islink(os.path.join(self.root, name))
+            and os.path.exists(os.path.join(self.root, name, RELEASE_FILE_NAME))
+        )
+
+    def read(self, version):
+        with open(os.path.join(self.path(version), RELEASE_FILE_NAME)) as f:
+            return json.load(f)
+
+    def new_version(self):
+        return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + os.urandom(3).hex()
+
+    def staging_path(self, version):
+        return os.path.join(self.root, f".staging-{version}")
+
+    def finalize(self, version, info):
+        """Checksum a staged release, write its release.json and move it into place"""
+        staging_path = self.staging_path(version)
+        info = dict(info, version=version, files=folder_checksums(staging_path))
+        with open(os.path.join(staging_path, RELEASE_FILE_NAME), "w") as f:
+            json.dump(info, f, indent=2)
+        os.rename(staging_path, self.path(version))
+        return info
+
+    def verify(self, version):
+        """Names of files that are missing or differ from the release's checksums (empty if intact).
+        Chroma records every process that opens a database in its chroma.sqlite3, so once a release has
+        been served those files differ and are checked with SQLite's own integrity check instead"""
+        expected = self.read(version)["files"]
+        actual = folder_checksums(self.path(version))
+        damaged = []
+        for name, checksum in expected.items():
+            if actual.get(name) == checksum:
+                continue
+            if name in actual and name.endswith(".sqlite3") and _sqlite_intact(os.path.join(self.path(version), name)):
+                continue
+            damaged.append(name)
+        return sorted(damaged)
+
+    def publish(self, version):
+        """Point current at a release. Running servers pick it up on their next check"""
+        if version not in self.versions():
+            raise ValueError(f"No complete release {version} in {self.root}")
+        link_path = os.path.join(self.root, CURRENT_LINK_NAME)
+        tmp_link = f"{link_path}.{os.getpid()}.tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(version, tmp_link)
+        os.replace(tmp_link, link_path)
+        logging.info(f"Published index release {version}")
+
+    def prune(self, keep):
+        """Delete all but the newest `keep` releases, never the published one"""
+        current = self.current()
+        removed = []
+        for version in self.versions()[:-keep] if keep > 0 else []:
+            if version != current:
+                shutil.rmtree(self.path(version), ignore_errors=True)
+                removed.append(version)
+        return removed
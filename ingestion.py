@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# Only the manifest and hashing helpers are needed to serve. The download and PDF parsing libraries
+# (requests, PyMuPDF, Unstructured) are imported when an index is built. Pages are scraped in scraper.py
+
+# Pipeline tuning, see IngestionPipeline
+INGEST_DOWNLOAD_WORKERS = int(os.getenv("INGEST_DOWNLOAD_WORKERS", "4"))
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 2)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# PDFs are read from their text layer with PyMuPDF when it is usable, scanned or garbled files fall back
+# to Unstructured. Parse results are cached by file content, so an unchanged PDF is never parsed twice
+PDF_FAST_PARSE = os.getenv("PDF_FAST_PARSE", "true").lower() == "true"
+PDF_MIN_CHARS_PER_PAGE = int(os.getenv("PDF_MIN_CHARS_PER_PAGE", "100"))
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "/var/data/parse_cache")  # empty disables the cache
+PARSE_CACHE_VERSION = 1  # bump when extraction changes, so older results are parsed again
+
+MANIFEST_FILE_NAME = "index_manifest.json"
+DOWNLOAD_MANIFEST_FILE_NAME = "download_manifest.json"
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text):
+    """SHA-256 of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """Records, for each indexed source (PDF file name or page URL), the hash of the content
+    that was embedded and the IDs of the chunks it produced"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f).get("sources", {})
+
+    def sources(self):
+        return set(self.entries)
+
+    def is_current(self, source, content_hash):
+        return source in self.entries and self.entries[source]["hash"] == content_hash
+
+    def chunk_ids(self, source):
+        return self.entries.get(source, {}).get("chunk_ids", [])
+
+    def update(self, source, content_hash, chunk_ids):
+        self.entries[source] = {"hash": content_hash, "chunk_ids": chunk_ids}
+
+    def remove(self, source):
+        return self.entries.pop(source, {}).get("chunk_ids", [])
+
+    def save(self):
+        """Write atomically so a crash never leaves a half-written manifest"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"sources": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Pooled HTTP session shared by the page checks and PDF downloads, with a connection per download worker"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, INGEST_DOWNLOAD_WORKERS))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def verify_for(url):
+    """TLS verification setting for a URL. UTAR's certificate chain is broken, so it is not verified"""
+    if "utar.edu.my" in url.lower():
+        return False
+    import certifi
+    return certifi.where()
+
+
+def validators(headers):
+    """The ETag and Last-Modified of a response, from headers of any case"""
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    return {"etag": headers.get("etag"), "last_modified": headers.get("last-modified")}
+
+
+class DownloadManifest:
+    """Records, for each PDF in a download folder, where it came from, the validators the server sent
+    (for conditional requests and resuming) and the checksum, size and modification time of the file.
+    The checksum is reused while the file is untouched, so an index refresh does not hash it again"""
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, DOWNLOAD_MANIFEST_FILE_NAME)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f).get("files", {})
+
+    def get(self, name):
+        with self._lock:
+            return dict(self.entries.get(name, {}))
+
+    def set(self, name, entry):
+        with self._lock:
+            self.entries[name] = entry
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_untouched(self, name, path):
+        """Whether a file is still the one that was downloaded (same size and modification time)"""
+        entry = self.get(name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return bool(entry.get("sha256")) and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+    def checksum(self, path):
+        """SHA-256 of a PDF in the folder, from the manifest when the file is untouched"""
+        name = os.path.basename(path)
+        if self.is_untouched(name, path):
+            return self.get(name)["sha256"]
+        return file_hash(path)
+
+
+def _conditional_headers(entry, pdf_path, manifest):
+    """Headers asking the server to send the PDF only if it changed since it was downloaded"""
+    name = os.path.basename(pdf_path)
+    if not os.path.exists(pdf_path):
+        return {}
+    if entry:
+        if not manifest.is_untouched(name, pdf_path):
+            return {}  # changed or damaged locally, download it again
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    # Downloaded before the manifest existed: only changes since the file was written are fetched
+    from email.utils import formatdate
+    return {"If-Modified-Since": formatdate(os.path.getmtime(pdf_path), usegmt=True)}
+
+
+def download_pdf(url, pdf_path, manifest, attempts=3):
+    """Download a single PDF if it is new or changed, into a .part file renamed into place once complete.
+    An interrupted download resumes with a Range request when the server still has the same file.
+    Returns "downloaded", "unchanged" or None on failure"""
+    name = os.path.basename(pdf_path)
+    part_path = f"{pdf_path}.part"
+    entry = manifest.get(name)
+    if entry.get("url") not in (None, url):
+        entry = {}
+
+    for attempt in range(1, attempts + 1):
+        headers = _conditional_headers(entry, pdf_path, manifest)
+        partial = entry.get("partial") or {}
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and (partial.get("etag") or partial.get("last_modified")):
+            # If-Range: the rest of the file only if it is unchanged, otherwise the whole new file
+            headers.update({"Range": f"bytes={offset}-", "If-Range": partial.get("etag") or partial.get("last_modified")})
+        else:
+            offset = 0
+
+        response_validators = {}
+        try:
+            with http_session().get(url, headers=headers, stream=True, verify=verify_for(url), timeout=10) as r:
+                if r.status_code == 304:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)  # left from an update that did not complete
+                    if not entry.get("sha256"):
+                        stat = os.stat(pdf_path)
+                        manifest.set(name, dict(validators(r.headers), url=url, sha256=file_hash(pdf_path), size=stat.st_size, mtime_ns=stat.st_mtime_ns))
+                    print(f"Unchanged PDF: {name}")
+                    return "unchanged"
+                if r.status_code == 416:
+                    # The partial file does not fit the file on the server any more, start over
+                    os.remove(part_path)
+                    continue
+                if 400 <= r.status_code < 500:
+                    print(f"Failed to download {url}: HTTP {r.status_code}")
+                    return None
+                r.raise_for_status() # Check HTTP response for errors to avoid downloading broken files
+                response_validators = validators(r.headers)
+
+                digest = hashlib.sha256()
+                if r.status_code == 206 and r.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    with open(part_path, "rb") as f:
+                        for block in iter(lambda: f.read(1 << 20), b""):
+                            digest.update(block)
+                    mode = "ab"
+                else:
+                    offset = 0
+                    mode = "wb"
+                expected_size = int(r.headers["Content-Length"]) + offset if "Content-Length" in r.headers else None
+
+                with open(part_path, mode) as f: # Open pdf in binary write mode
+                    for chunk in r.iter_content(8192):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+
+            size = os.path.getsize(part_path)
+            if expected_size is not None and size != expected_size:
+                raise IOError(f"incomplete download, {size} of {expected_size} bytes")
+            with open(part_path, "rb") as f:
+                is_pdf = b"%PDF" in f.read(1024)
+            if not is_pdf:
+                os.remove(part_path)  # e.g. an HTML error page served with a 200
+                print(f"Failed to download {url}: not a PDF")
+                return None
+
+            os.replace(part_path, pdf_path)
+            stat = os.stat(pdf_path)
+            manifest.set(name, dict(response_validators, url=url, sha256=digest.hexdigest(), size=stat.st_size, mtime_ns=stat.st_mtime_ns))
+            print(f"{'Resumed' if offset else 'Downloaded'} PDF: {pdf_path}")
+            return "downloaded"
+        except Exception as e:
+            if os.path.exists(part_path) and (response_validators.get("etag") or response_validators.get("last_modified")):
+                # Keep what arrived, and what it was part of, so the next attempt or run resumes it
+                entry = dict(entry, partial=response_validators)
+                manifest.set(name, entry)
+            print(f"Failed to download {url} (attempt {attempt}/{attempts}): {e}")
+    return None
+
+
+def download_pdfs(pdf_urls, download_folder, max_workers=INGEST_DOWNLOAD_WORKERS):
+    """Download new and changed PDFs over a pooled session with a bounded pool.
+    Returns the paths of the PDFs that were downloaded"""
+    import urllib3
+    # Disable only insecure request warnings for UTAR's SSL issue
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    manifest = DownloadManifest(download_folder)
+    pending = {}
+    for url in pdf_urls:
+        pdf_path = os.path.join(download_folder, os.path.basename(url))
+        if pdf_path in pending:
+            # Files are named after the URL's last segment, so the first URL keeps the name
+            logging.warning(f"Skipping {url}: {os.path.basename(pdf_path)} is already taken by {pending[pdf_path]}")
+            continue
+        pending[pdf_path] = url
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(pending, pool.map(lambda item: download_pdf(item[1], item[0], manifest), pending.items())))
+    downloaded = [pdf_path for pdf_path, result in results.items() if result == "downloaded"]
+    print(f"PDFs: {len(downloaded)} downloaded, {list(results.values()).count('unchanged')} unchanged, "
+          f"{list(results.values()).count(None)} failed")
+    return downloaded
+
+
+def extract_text_layer(pdf_file, min_chars_per_page=PDF_MIN_CHARS_PER_PAGE):
+    """Text of each page from the PDF's own text layer, or None when the file needs Unstructured:
+    too little text for its pages (scanned), many image-only pages, or glyphs that do not decode"""
+    import pymupdf
+
+    with pymupdf.open(pdf_file) as pdf:
+        if pdf.needs_pass:
+            return None
+        pages = []
+        image_only = 0
+        for page in pdf:
+            text = page.get_text()
+            if not text.strip() and page.get_images():
+                image_only += 1
+            pages.append(text)
+
+    visible = sum(1 for c in "".join(pages) if not c.isspace())
+    if not pages or visible < min_chars_per_page * len(pages) or image_only > len(pages) / 4:
+        return None
+    undecoded = sum(text.count("\ufffd") + text.count("(cid:") for text in pages)
+    if undecoded > visible / 100:
+        return None
+    return pages
+
+
+def load_pdf_unstructured(pdf_file):
+    """Parse a PDF with Unstructured's layout analysis (and OCR for scanned pages)"""
+    from langchain_community.document_loaders import UnstructuredPDFLoader
+
+    loader = UnstructuredPDFLoader(file_path=pdf_file)
+    return loader.load()
+
+
+def _parse_cache_path(content_hash):
+    tiers = "tiered" if PDF_FAST_PARSE else "unstructured"
+    return os.path.join(PARSE_CACHE_PATH, f"{content_hash}-{tiers}-v{PARSE_CACHE_VERSION}.json")
+
+
+def load_pdf(pdf_file, content_hash=None):
+    """Parse one PDF into documents: from the parse cache when the same content was parsed before, else
+    from its text layer when usable, else with Unstructured. Pass the file's content hash when it is
+    already known to skip hashing it again. Runs in a worker process, so it must stay a module-level function"""
+    from langchain_core.documents import Document
+
+    cache_path = _parse_cache_path(content_hash or file_hash(pdf_file)) if PARSE_CACHE_PATH else None
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            data = [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in json.load(f)]
+    else:
+        pages = extract_text_layer(pdf_file) if PDF_FAST_PARSE else None
+        if pages is not None:
+            # One document per file, as Unstructured's single mode gives
+            data = [Document(page_content="\n\n".join(text.strip() for text in pages if text.strip()), metadata={})]
+            parser = "text_layer"
+        else:
+            data = load_pdf_unstructured(pdf_file)
+            parser = "unstructured"
+        for doc in data:
+            doc.metadata["parser"] = parser
+
+        if cache_path:
+            os.makedirs(PARSE_CACHE_PATH, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in data], f)
+            os.replace(tmp_path, cache_path)
+
+    # add source metadata
+    for doc in data:
+        doc.metadata["source"] = os.path.basename(pdf_file)
+    return data
+
+
+def iter_parsed_pdfs(pdf_files, max_workers=INGEST_PARSE_WORKERS, content_hashes=None):
+    """Parse PDFs across a process pool (parsing is CPU bound), yielding (pdf_file, documents) as each finishes.
+    content_hashes maps files to hashes already computed (e.g. from the manifests), the rest are hashed"""
+    if not pdf_files:
+        return
+
+    content_hashes = content_hashes or {}
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(pdf_files))) as pool:
+        futures = {pool.submit(load_pdf, pdf_file, content_hashes.get(pdf_file)): pdf_file for pdf_file in pdf_files}
+        for future in as_completed(futures):
+            pdf_file = futures[future]
+            try:
+                yield pdf_file, future.result()
+            except Exception as e:
+                logging.error(f"Failed to load {pdf_file}: {e}")
+
+
+class IngestionPipeline:
+    """Splits, embeds and inserts documents into a Chroma collection as they arrive.
+    Embedding requests are batched and run with bounded concurrency, and each batch is
+    inserted as soon as it is embedded, so memory stays flat regardless of corpus size."""
+
+    def __init__(self, vector_db, embedding_function, split_documents,
+                 batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY, name="ingestion"):
+        self.vector_db = vector_db
+        self.embedding_function = embedding_function
+        self.split_documents = split_documents
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.name = name
+        self.pending = []    # chunks waiting to fill a batch
+        self.in_flight = []  # embedding futures, at most `concurrency`
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+        self.insert_lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.timings = {"split": 0.0, "embed": 0.0, "insert": 0.0}
+        self.counts = {"documents": 0, "chunks": 0, "batches": 0}
+
+    def record(self, stage, seconds):
+        """Add time spent in a stage that runs outside the pipeline, e.g. downloading or parsing"""
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def add_documents(self, documents, id_prefix=None):
+        """Split documents and queue their chunks for embedding. Returns the chunk IDs,
+        which are deterministic when an ID prefix (e.g. a content hash) is given"""
+        start = time.perf_counter()
+        chunks = self.split_documents(documents)
+        self.timings["split"] += time.perf_counter() - start
+        self.counts["documents"] += len(documents)
+
+        chunk_ids = []
+        for i, chunk in enumerate(chunks):
+            chunk_id = f"{id_prefix}-{i}" if id_prefix else str(uuid.uuid4())
+            chunk_ids.append(chunk_id)
+            self.pending.append((chunk_id, chunk))
+            if len(self.pending) >= self.batch_size:
+                self._submit_batch()
+        return chunk_ids
+
+    def _submit_batch(self):
+        batch, self.pending = self.pending, []
+        # Bound in-flight batches so embedded-but-uninserted chunks never pile up
+        while len(self.in_flight) >= self.concurrency:
+            self.in_flight.pop(0).result()
+        self.in_flight.append(self.executor.submit(self._embed_and_insert, batch))
+
+    def _embed_and_insert(self, batch):
+        ids = [chunk_id for chunk_id, _ in batch]
+        texts = [chunk.page_content for _, chunk in batch]
+        metadatas = [chunk.metadata for _, chunk in batch]
+
+        start = time.perf_counter()
+        embeddings = self.embedding_function.embed_documents(texts)
+        embedded = time.perf_counter()
+
+        with self.insert_lock:
+            self.vector_db._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+            self.timings["embed"] += embedded - start
+            self.timings["insert"] += time.perf_counter() - embedded
+            self.counts["chunks"] += len(batch)
+            self.counts["batches"] += 1
+            logging.info(f"[{self.name}] Inserted {self.counts['chunks']} chunks in {self.counts['batches']} batches")
+
+    def flush(self):
+        """Embed and insert any remaining chunks and wait for in-flight batches"""
+        if self.pending:
+            self._submit_batch()
+        for future in self.in_flight:
+            future.result()
+        self.in_flight = []
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
+        self.report()
+
+    def report(self):
+        """Log chunk counts and per-stage timings. Embed and insert times are summed across workers"""
+        elapsed = time.perf_counter() - self.started
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.timings.items())
+        logging.info(
+            f"[{self.name}] Ingested {self.counts['documents']} documents into {self.counts['chunks']} chunks "
+            f"({self.counts['batches']} batches) in {elapsed:.2f}s: {stages}"
+        )
+        return {"elapsed": elapsed, **self.timings, **self.counts}
@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import atexit
+import random
+import logging
+import contextvars
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# "text" for readable lines, "json" for one JSON object per line (for log collectors)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Optional log file, rotated at LOG_FILE_MAX_BYTES keeping LOG_FILE_BACKUPS old files.
+# "{pid}" in the path gives each worker process its own file, rotation is not safe across processes
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 2**20)))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "3"))
+# Write log records from a background thread, so request threads never wait on console or disk I/O
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+# Fraction of requests whose full question, history and response are logged
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+_sampled = contextvars.ContextVar("payload_sampled", default=False)
+_listener = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp each record with the correlation ID of the request it was logged in"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging():
+    """Set up the root logger once per process: console and optional rotating file output,
+    written by a background thread when LOG_ASYNC is on"""
+    global _listener
+    root = logging.getLogger()
+    if getattr(root, "_chatbot_configured", False):
+        return
+    root._chatbot_configured = True
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        path = LOG_FILE.replace("{pid}", str(os.getpid()))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handlers.append(RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if LOG_ASYNC:
+        queue = SimpleQueue()
+        front = QueueHandler(queue)
+        _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # flush what is still queued
+        handlers = [front]
+
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        # On the front handler, so the ID is read in the request's thread or task
+        handler.addFilter(RequestContextFilter())
+        root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    # Per-request HTTP lines from the OpenAI client only add volume
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def start_request(request_id=None):
+    """Begin a request's logging context: a correlation ID (the caller's, e.g. from an X-Request-ID
+    header, or a new one) and whether its payloads are sampled. Returns the ID"""
+    request_id = (request_id or "")[:64] or os.urandom(8).hex()
+    _request_id.set(request_id)
+    _sampled.set(LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE)
+    return request_id
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def payload_sampled():
+    """Whether to log the current request's full payloads. Check before building the message"""
+    return _sampled.get()
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import nullcontext
+
+# Per-stage latency histograms, token usage and cache statistics, exposed at /metrics in Prometheus format.
+# Each worker process keeps its own counters
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# Attach a Server-Timing header with the request's stage timings to each non-streamed response
+TIMING_HEADER_ENABLED = os.getenv("TIMING_HEADER_ENABLED", "false").lower() == "true"
+
+ENABLED = METRICS_ENABLED or TIMING_HEADER_ENABLED
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NOOP_SPAN = nullcontext()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _format_labels(names, values):
+    return ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+
+
+class Histogram:
+    """A labelled Prometheus histogram with cumulative buckets"""
+
+    def __init__(self, name, description, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self.series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self.series.items()):
+                prefix = _format_labels(self.label_names, labels)
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{prefix},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{prefix},le="+Inf"}} {series[-1]}')
+                lines.append(f"{self.name}_sum{{{prefix}}} {series[-2]}")
+                lines.append(f"{self.name}_count{{{prefix}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """A labelled Prometheus counter"""
+
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self.series.items()):
+                lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+stage_seconds = Histogram("chatbot_stage_seconds", "Time spent in each request stage", ("stage", "agent"))
+tokens_total = Counter("chatbot_tokens_total", "OpenAI tokens used", ("agent", "kind"))
+_gauges = []  # (name, description, callable returning {label value: number})
+
+
+class _Span:
+    __slots__ = ("stage", "agent", "start")
+
+    def __init__(self, stage, agent):
+        self.stage = stage
+        self.agent = agent
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start, self.agent)
+        return False
+
+
+def span(stage, agent=""):
+    """Time a block as a request stage, e.g. with span("retrieve", agent.name). A shared no-op when disabled"""
+    if not ENABLED:
+        return _NOOP_SPAN
+    return _Span(stage, agent)
+
+
+def observe(stage, seconds, agent=""):
+    """Record a stage duration measured by the caller"""
+    if not ENABLED:
+        return
+    if METRICS_ENABLED:
+        stage_seconds.observe((stage, agent), seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def record_usage(agent, usage):
+    """Count the tokens of an OpenAI response's usage"""
+    if not METRICS_ENABLED or usage is None:
+        return
+    tokens_total.inc((agent, "prompt"), getattr(usage, "prompt_tokens", 0) or 0)
+    tokens_total.inc((agent, "completion"), getattr(usage, "completion_tokens", 0) or 0)
+
+
+def register_gauge(name, description, collect):
+    """Expose values read at scrape time, collect returns a number or {label value: number}"""
+    _gauges.append((name, description, collect))
+
+
+def start_request():
+    """Begin collecting the current request's stage timings (per thread or asyncio task)"""
+    if ENABLED:
+        _request_timings.set({})
+
+
+def request_timings():
+    return _request_timings.get() or {}
+
+
+def server_timing_header():
+    """The request's timings as a Server-Timing header value, or None"""
+    timings = request_timings()
+    if not TIMING_HEADER_ENABLED or not timings:
+        return None
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = stage_seconds.render() + tokens_total.render()
+    for name, description, collect in _gauges:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+        values = collect()
+        if isinstance(values, dict):
+            lines += [f'{name}{{key="{key}"}} {value}' for key, value in values.items()]
+        else:
+            lines.append(f"{name} {values}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import shutil
+import logging
+import numpy as np
+from langchain_core.documents import Document
+
+MATRIX_FILE_NAME = "embeddings.npy"
+RECORDS_FILE_NAME = "records.json"
+SOURCE_FILE_NAME = "source.json"  # stamp of the Chroma data the store was exported from
+SCORE_BLOCK_ROWS = 4096  # float16 rows are upcast to float32 this many at a time
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyVectorStore:
+    """Read-only vector store serving an agent's chunks from a memory-mapped embedding matrix.
+
+    Rows are unit-normalized, so top-k is one matrix-vector product followed by argpartition.
+    The matrix is opened with mmap, which loads in milliseconds and lets gunicorn workers share
+    the same page-cache pages. Chroma stays the source of truth, stores are exported from it."""
+
+    def __init__(self, path, embedding_function):
+        start = time.perf_counter()
+        self.path = path
+        self.embedding_function = embedding_function
+        self.matrix = np.load(os.path.join(path, MATRIX_FILE_NAME), mmap_mode="r")
+        with open(os.path.join(path, RECORDS_FILE_NAME)) as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.texts = records["documents"]
+        self.metadatas = records["metadatas"]
+        logging.info(f"Mapped {len(self.ids)} vectors ({self.matrix.dtype}) from {path} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, MATRIX_FILE_NAME)) and os.path.exists(os.path.join(path, RECORDS_FILE_NAME))
+
+    @staticmethod
+    def source_stamp(path):
+        """The stamp passed to export when the store was written, or None"""
+        try:
+            with open(os.path.join(path, SOURCE_FILE_NAME)) as f:
+                return json.load(f).get("stamp")
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def export(cls, vector_db, path, embedding_function, dtype="float32", source_stamp=None):
+        """Write a Chroma collection's embeddings, texts and metadata to path and open it, recording
+        source_stamp so readers can tell whether the export still matches the collection.
+        The export is written to a per-process staging folder and swapped in, so readers never see
+        a partial one and concurrent exports do not delete each other's files"""
+        start = time.perf_counter()
+        stored = vector_db.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = np.asarray(stored["embeddings"], dtype=np.float32)
+        if not stored["ids"]:
+            embeddings = np.zeros((0, 0), dtype=np.float32)  # e.g. an agent with no sources
+        elif embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(stored["ids"]), -1)
+        matrix = _normalize_rows(embeddings).astype(dtype)
+
+        staging_path = f"{path}.exporting-{os.getpid()}"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        np.save(os.path.join(staging_path, MATRIX_FILE_NAME), matrix)
+        with open(os.path.join(staging_path, RECORDS_FILE_NAME), "w") as f:
+            json.dump({"ids": stored["ids"], "documents": stored["documents"], "metadatas": stored["metadatas"]}, f)
+        with open(os.path.join(staging_path, SOURCE_FILE_NAME), "w") as f:
+            json.dump({"stamp": source_stamp}, f)
+
+        previous_path = f"{path}.previous-{os.getpid()}"
+        shutil.rmtree(previous_path, ignore_errors=True)
+        if os.path.lexists(path):
+            os.rename(path, previous_path)
+        os.rename(staging_path, path)
+        shutil.rmtree(previous_path, ignore_errors=True)
+        logging.info(f"Exported {len(stored['ids'])} vectors to {path} in {time.perf_counter() - start:.2f}s")
+        return cls(path, embedding_function)
+
+    def count(self):
+        return len(self.ids)
+
+    def scores(self, embeddings):
+        """Cosine similarity of every stored chunk to each embedding, as a (chunks, queries) matrix"""
+        queries = _normalize_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float32))).T
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ queries
+        scores = np.empty((len(self.matrix), queries.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.matrix), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ queries
+        return scores
+
+    def _top_k(self, scores, k):
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Document(id=self.ids[position], page_content=self.texts[position], metadata=self.metadatas[position] or {})
+            for position in top
+        ]
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return self.similarity_search_by_vectors([embedding], k=k)[0]
+
+    def similarity_search_by_vectors(self, embeddings, k=4):
+        """Top-k for several queries with a single matrix-matrix product"""
+        k = min(k, len(self.ids))
+        if k == 0:
+            return [[] for _ in embeddings]
+        scores = self.scores(embeddings)
+        return [self._top_k(scores[:, column], k) for column in range(scores.shape[1])]
+
+    def similarity_search(self, query, k=4):
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k)
+
+    def get(self, include=None, limit=None):
+        """Stored chunks in the same shape as Chroma's get(), e.g. for building the BM25 index or routing centroids"""
+        end = len(self.ids) if limit is None else limit
+        stored = {"ids": self.ids[:end], "documents": self.texts[:end], "metadatas": self.metadatas[:end]}
+        if include and "embeddings" in include:
+            stored["embeddings"] = np.asarray(self.matrix[:end], dtype=np.float32)
+        return stored
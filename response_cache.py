@@ -0,0 +1,120 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Words that usually refer back to an earlier turn of the conversation
+REFERENCE_WORDS = {
+    "it", "its", "they", "them", "their", "that", "this", "those", "these",
+    "he", "she", "him", "her", "there", "also", "same", "else", "above", "previous"
+}
+
+
+def has_unresolved_references(query, history):
+    """Check whether the query depends on earlier turns of the conversation to be understood"""
+    # The current question is already the last entry of the history
+    if len(history) <= 1:
+        return False
+    words = set(re.findall(r"[a-z']+", query.lower()))
+    return bool(words & REFERENCE_WORDS)
+
+
+class SemanticResponseCache:
+    """A bounded cache of generated answers, looked up by agent and query embedding similarity.
+    Entries are evicted least-recently-used first, expire after a TTL, and are dropped when
+    the owning agent's vector database is rebuilt."""
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()  # (agent name, entry id) -> entry, in LRU order
+        self.matrices = {}            # agent name -> (entry keys, stacked embeddings), rebuilt lazily
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key):
+        del self.entries[key]
+        self.matrices.pop(key[0], None)
+
+    def _agent_matrix(self, agent_name):
+        """Stacked embeddings of the agent's entries, so lookups are a single matrix-vector product"""
+        if agent_name not in self.matrices:
+            keys = [key for key in self.entries if key[0] == agent_name]
+            matrix = np.stack([self.entries[key]["embedding"] for key in keys]) if keys else None
+            self.matrices[agent_name] = (keys, matrix)
+        return self.matrices[agent_name]
+
+    def _purge_stale(self, agent):
+        """Drop expired entries and entries built against an older version of the agent's index"""
+        now = time.monotonic()
+        stale = [
+            key for key, entry in self.entries.items()
+            if now - entry["created"] > self.ttl_seconds
+            or (key[0] == agent.name and entry["index_version"] != agent.index_version)
+        ]
+        for key in stale:
+            self._remove(key)
+        self.evictions += len(stale)
+
+    def lookup(self, agent, query_embedding):
+        """Return a cached response for a similar query to the same agent, or None"""
+        with self._lock:
+            self._purge_stale(agent)
+            keys, matrix = self._agent_matrix(agent.name)
+            if matrix is not None:
+                similarities = matrix @ self._normalize(query_embedding)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    logging.info(f"Response cache hit for {agent.name} (similarity {similarities[best]:.3f})")
+                    return dict(self.entries[keys[best]]["response"])
+            self.misses += 1
+            return None
+
+    def store(self, agent, query_embedding, response):
+        """Cache a generated response, evicting the least recently used entry when full"""
+        with self._lock:
+            key = (agent.name, self._next_id)
+            self._next_id += 1
+            self.entries[key] = {
+                "embedding": self._normalize(query_embedding),
+                "response": dict(response),
+                "created": time.monotonic(),
+                "index_version": agent.index_version
+            }
+            self.matrices.pop(agent.name, None)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, agent_name=None):
+        """Remove all entries, or only those of a single agent"""
+        with self._lock:
+            for key in [key for key in self.entries if agent_name is None or key[0] == agent_name]:
+                self._remove(key)
+
+    def stats(self):
+        """Hit/miss counters for tuning the similarity threshold"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "similarity_threshold": self.similarity_threshold
+            }
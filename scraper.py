@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from urllib.parse import urljoin
+from ingestion import http_session, validators, verify_for
+
+# Pages are rendered in a headless browser (Playwright and BeautifulSoup are imported when scraping starts)
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "4"))  # browser contexts loading pages at once
+SCRAPE_NAVIGATION_TIMEOUT_MS = int(os.getenv("SCRAPE_NAVIGATION_TIMEOUT_MS", "30000"))
+# A page is read once the network has been idle for 500ms, or after this long at most
+SCRAPE_IDLE_TIMEOUT_MS = int(os.getenv("SCRAPE_IDLE_TIMEOUT_MS", "10000"))
+SCRAPE_READY_SELECTOR = os.getenv("SCRAPE_READY_SELECTOR", "")  # optionally also wait for an element, e.g. "div.mg"
+
+# Rendered pages are cached with their ETag and Last-Modified, and only rendered again when a conditional
+# request says they changed. Content loaded by scripts can change on its own, so entries also expire
+SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", "/var/data/scrape_cache")  # empty disables the cache
+SCRAPE_CACHE_MAX_AGE_SECONDS = int(os.getenv("SCRAPE_CACHE_MAX_AGE_SECONDS", "86400"))
+
+
+class PageCache:
+    """Rendered HTML per URL, one JSON file each, with the validators the page had when it was rendered"""
+
+    def __init__(self, folder, max_age_seconds=SCRAPE_CACHE_MAX_AGE_SECONDS):
+        self.folder = folder
+        self.max_age_seconds = max_age_seconds
+
+    def _path(self, url):
+        return os.path.join(self.folder, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, html, page_validators):
+        entry = dict(page_validators, url=url, html=html, rendered_at=time.time())
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = f"{self._path(url)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(url))
+
+    def is_fresh(self, entry):
+        """Whether a cached render can be reused: not expired, and the page reports it unchanged"""
+        if time.time() - entry["rendered_at"] > self.max_age_seconds:
+            return False
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if not headers:
+            return False
+
+        url = entry["url"]
+        try:
+            with http_session().get(url, headers=headers, timeout=10, verify=verify_for(url), stream=True) as response:
+                if response.status_code == 304:
+                    return True
+                # Some servers ignore conditional headers but still send validators
+                current = validators(response.headers)
+                return response.ok and any(current[name] and current[name] == entry.get(name) for name in current)
+        except Exception as e:
+            logging.warning(f"Could not check {url} for changes, rendering it again: {e}")
+            return False
+
+
+async def _render_all(urls, concurrency=SCRAPE_CONCURRENCY):
+    """Render pages concurrently over a pool of browser contexts in one browser.
+    Returns {url: (html, validators)} and {url: error} for pages that failed"""
+    from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+    rendered = {}
+    errors = {}
+    async with async_playwright() as p:
+        browser = await p.chromium.launch()
+        contexts = asyncio.Queue()
+        for _ in range(max(1, min(concurrency, len(urls)))):
+            contexts.put_nowait(await browser.new_context())
+
+        async def render(url):
+            context = await contexts.get()
+            page = None
+            try:
+                page = await context.new_page()
+                response = await page.goto(url, wait_until="domcontentloaded", timeout=SCRAPE_NAVIGATION_TIMEOUT_MS)
+                try:
+                    # Wait for the page's scripts to finish loading content instead of a fixed sleep
+                    await page.wait_for_load_state("networkidle", timeout=SCRAPE_IDLE_TIMEOUT_MS)
+                    if SCRAPE_READY_SELECTOR:
+                        await page.wait_for_selector(SCRAPE_READY_SELECTOR, state="attached", timeout=SCRAPE_IDLE_TIMEOUT_MS)
+                except PlaywrightTimeoutError:
+                    logging.warning(f"{url} did not settle within {SCRAPE_IDLE_TIMEOUT_MS}ms, reading it as rendered so far")
+                rendered[url] = (await page.content(), validators(response.headers if response else {}))
+            except Exception as e:
+                errors[url] = e
+            finally:
+                try:
+                    if page is not None:
+                        await page.close()
+                except Exception as e:
+                    logging.warning(f"Failed to close the page for {url}: {e}")
+                # Always hand the context back, or the remaining renders wait on an empty queue
+                contexts.put_nowait(context)
+
+        await asyncio.gather(*(render(url) for url in urls))
+        await browser.close()
+    return rendered, errors
+
+
+class RenderedPages:
+    """The rendered HTML of a set of pages, rendered once on first use and shared by every extractor
+    (page text and PDF links), with unchanged pages served from the page cache"""
+
+    def __init__(self, urls, cache_path=SCRAPE_CACHE_PATH, concurrency=SCRAPE_CONCURRENCY):
+        self.urls = list(dict.fromkeys(urls))
+        self.concurrency = concurrency
+        self.cache = PageCache(cache_path) if cache_path else None
+        self._pages = None
+        self._lock = threading.Lock()
+
+    def items(self):
+        """(url, html) for every page, in the order the URLs were given"""
+        with self._lock:
+            if self._pages is None:
+                self._pages = self._render()
+            return [(url, self._pages[url]) for url in self.urls if url in self._pages]
+
+    def _render(self):
+        start = time.perf_counter()
+        pages = {}
+        cached = {}
+        if self.cache is not None:
+            for url in self.urls:
+                entry = self.cache.get(url)
+                if entry is not None:
+                    cached[url] = entry
+                    if self.cache.is_fresh(entry):
+                        pages[url] = entry["html"]
+
+        pending = [url for url in self.urls if url not in pages]
+        if pending:
+            rendered, errors = asyncio.run(_render_all(pending, self.concurrency))
+            for url, (html, page_validators) in rendered.items():
+                pages[url] = html
+                if self.cache is not None:
+                    self.cache.put(url, html, page_validators)
+            for url, error in errors.items():
+                if url not in cached:
+                    # Leaving the page out would remove its content from the index
+                    raise RuntimeError(f"Failed to render {url}: {error}")
+                logging.warning(f"Failed to render {url}, using the copy rendered before: {error}")
+                pages[url] = cached[url]["html"]
+
+        logging.info(f"Rendered {len(pending)} pages, {len(self.urls) - len(pending)} unchanged since cached, in {time.perf_counter() - start:.1f}s")
+        return pages
+
+
+def page_document(url, html_content):
+    """One document holding the text of the page's content sections (or its link texts when it has none)"""
+    from bs4 import BeautifulSoup
+    from langchain_core.documents import Document
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # ---- Collect Text ----
+    page_text_parts = []
+    for div in soup.find_all('div', class_='mg'):
+        section_text = div.get_text(separator='\n', strip=True)
+        if section_text:
+            page_text_parts.append(section_text)
+
+    # ---- Collect Unique Links ----
+    seen_links = set()
+    link_texts = []
+    for link in soup.find_all('a', href=True):
+        full_url = urljoin(url, link['href'])
+        if full_url not in seen_links:  # ensure uniqueness
+            seen_links.add(full_url)
+            text = link.get_text(strip=True)
+            if text:
+                link_texts.append(text)
+
+    # ---- Decide How to Combine ----
+    if not page_text_parts:  # if no main text, combine link texts
+        combined_text = " | ".join(link_texts)
+    else:
+        combined_text = "\n".join(page_text_parts)
+        if link_texts:
+            combined_text += "\nLinks: " + " | ".join(link_texts)
+
+    return Document(page_content=combined_text, metadata={"source": url})
+
+
+def pdf_links(url, html_content):
+    """URLs of the PDFs a page links to"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    links = []
+    for link in soup.find_all('a', href=True):
+        full_url = urljoin(url, link['href'])
+        if full_url.lower().endswith(".pdf"):
+            links.append(full_url)
+    return links
+
+
+def scrape_webpages(urls, pages=None):
+    """One document per page. Pass the RenderedPages shared with find_pdf_links to render each page once"""
+    print("\nScrapping some UTAR Webpages.")
+    results = [page_document(url, html_content) for url, html_content in (pages or RenderedPages(urls)).items()]
+    print("\nDone Scraping UTAR Webpages.")
+    return results
+
+
+def find_pdf_links(urls, pages=None):
+    """URLs of the PDFs linked from the given pages, in order of first appearance"""
+    print("Looking for PDF files in some UTAR Webpages to download...")
+    pdf_urls = []
+    for url, html_content in (pages or RenderedPages(urls)).items():
+        pdf_urls.extend(pdf_links(url, html_content))
+    return list(dict.fromkeys(pdf_urls))
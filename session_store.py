@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Where chat histories live: "sqlite" (shared by the workers of one host), "redis" (shared across hosts)
+# or "memory" (per process, for local development)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "/var/data/sessions.sqlite3")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://127.0.0.1:6379/0")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))  # idle sessions expire after a day
+SESSION_HISTORY_MESSAGES = int(os.getenv("SESSION_HISTORY_MESSAGES", "6"))
+
+COMPRESS_OVER_BYTES = 512
+PURGE_INTERVAL_SECONDS = 300
+
+
+def encode_history(history):
+    """Serialize a chat history compactly: one [role initial, text, references] array per message,
+    zlib-compressed when large. The first byte says which"""
+    messages = []
+    for msg in history:
+        content = msg["content"]
+        if isinstance(content, dict):
+            messages.append([msg["role"][0], content.get("response", ""), content.get("references", [])])
+        else:
+            messages.append([msg["role"][0], content])
+    data = json.dumps(messages, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) > COMPRESS_OVER_BYTES:
+        return b"z" + zlib.compress(data)
+    return b"j" + data
+
+
+def decode_history(data):
+    """Inverse of encode_history, returning messages in the shape the chat endpoints use"""
+    if not data:
+        return []
+    payload = zlib.decompress(data[1:]) if data[:1] == b"z" else data[1:]
+    history = []
+    for message in json.loads(payload):
+        role = "user" if message[0] == "u" else "assistant"
+        if len(message) > 2:
+            history.append({"role": role, "content": {"response": message[1], "references": message[2]}})
+        else:
+            history.append({"role": role, "content": message[1]})
+    return history
+
+
+class SQLiteSessionStore:
+    """Chat histories in a SQLite database in WAL mode, shared by every worker process on the host"""
+
+    def __init__(self, db_path, ttl_seconds=SESSION_TTL_SECONDS, max_messages=SESSION_HISTORY_MESSAGES):
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, history BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self.connection.commit()
+
+    def load(self, sid):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT history FROM sessions WHERE id = ? AND expires_at > ?", (sid, time.time())
+            ).fetchone()
+        return decode_history(row[0]) if row else []
+
+    def save(self, sid, history):
+        now = time.time()
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sessions (id, history, expires_at) VALUES (?, ?, ?)",
+                (sid, encode_history(history[-self.max_messages:]), now + self.ttl_seconds)
+            )
+            if now - self._purged_at > PURGE_INTERVAL_SECONDS:
+                self._purged_at = now
+                purged = self.connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+                if purged:
+                    logging.info(f"Purged {purged} expired chat sessions")
+            self.connection.commit()
+
+    def delete(self, sid):
+        with self._lock:
+            self.connection.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            self.connection.commit()
+
+
+class RedisSessionStore:
+    """Chat histories in Redis, shared across hosts. Expiry is left to Redis, each save resets
+    the session's TTL. redis-py is imported here, so it is only needed with SESSION_BACKEND=redis"""
+
+    def __init__(self, url, ttl_seconds=SESSION_TTL_SECONDS, max_messages=SESSION_HISTORY_MESSAGES, key_prefix="chat-session:"):
+        import redis
+        from redis.backoff import ExponentialBackoff
+        from redis.retry import Retry
+
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.key_prefix = key_prefix
+        # Thread-safe connection pool; broken connections are dropped and commands retried on a new one
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=5,
+            socket_connect_timeout=5,
+            health_check_interval=30,
+            retry=Retry(ExponentialBackoff(cap=1.0), 2),
+            retry_on_error=[redis.exceptions.ConnectionError, redis.exceptions.TimeoutError]
+        )
+
+    def load(self, sid):
+        return decode_history(self.client.get(self.key_prefix + sid))
+
+    def save(self, sid, history):
+        self.client.set(self.key_prefix + sid, encode_history(history[-self.max_messages:]), ex=self.ttl_seconds)
+
+    def delete(self, sid):
+        self.client.delete(self.key_prefix + sid)
+
+
+class MemorySessionStore:
+    """Chat histories in process memory, least recently used sessions are dropped first"""
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_messages=SESSION_HISTORY_MESSAGES, max_sessions=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()  # sid -> (encoded history, expires at)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self.sessions.get(sid)
+            if entry is None or entry[1] <= time.time():
+                self.sessions.pop(sid, None)
+                return []
+            self.sessions.move_to_end(sid)
+        return decode_history(entry[0])
+
+    def save(self, sid, history):
+        with self._lock:
+            self.sessions[sid] = (encode_history(history[-self.max_messages:]), time.time() + self.ttl_seconds)
+            self.sessions.move_to_end(sid)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self.sessions.pop(sid, None)
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    """The configured session store. Falls back to memory if SQLite cannot be opened"""
+    if backend == "redis":
+        logging.info(f"Storing chat sessions in Redis at {urlparse(SESSION_REDIS_URL).hostname}")
+        return RedisSessionStore(SESSION_REDIS_URL)
+    if backend == "sqlite":
+        try:
+            store = SQLiteSessionStore(SESSION_DB_PATH)
+            logging.info(f"Storing chat sessions in {SESSION_DB_PATH}")
+            return store
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Session store unavailable at {SESSION_DB_PATH}, keeping sessions in memory: {e}")
+    return MemorySessionStore()
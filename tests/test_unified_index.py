@@ -0,0 +1,35 @@
+import os
+
+import agent_classes
+from unified_index import UnifiedIndex
+
+
+def make_agent(tmp_path, name):
+    agent = agent_classes.BaseAgent(name, "test agent", vector_db_path=str(tmp_path / name.lower()), department=name)
+    agent.unified_index = UnifiedIndex(str(tmp_path / "unified"), agent_classes.embedding_model)
+    return agent
+
+
+def test_empty_slice_with_manifest_loads(tmp_path, monkeypatch):
+    # build_index.py publishes agents without sources (General) as an empty slice with a manifest
+    monkeypatch.setattr(agent_classes, "INDEX_BUILD_ON_DEMAND", False)
+    agent = make_agent(tmp_path, "General")
+    os.makedirs(agent.unified_index.path)
+    with open(agent.unified_index.manifest_path(agent.index_name), "w") as f:
+        f.write('{"sources": {}}')
+
+    agent.initialize()
+
+    assert agent.load_status()["state"] == "ready"
+    assert agent.vector_db.count() == 0
+
+
+def test_missing_slice_fails_without_on_demand_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent_classes, "INDEX_BUILD_ON_DEMAND", False)
+    agent = make_agent(tmp_path, "Finance")
+    os.makedirs(agent.unified_index.path)
+
+    agent.initialize()
+
+    assert agent.load_status()["state"] == "failed"
+    assert "build_index.py" in agent.load_status()["error"]
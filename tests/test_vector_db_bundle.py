@@ -0,0 +1,40 @@
+import os
+import zipfile
+
+from vector_db_bundle import VectorDBBundle
+
+
+def write_bundle(zip_path, entries):
+    with zipfile.ZipFile(zip_path, "w") as zip_ref:
+        for name, content in entries.items():
+            zip_ref.writestr(name, content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_reextraction_keeps_files_only_on_disk(tmp_path):
+    zip_path = str(tmp_path / "vector_db.zip")
+    data_path = tmp_path / "data"
+    bundle = VectorDBBundle(zip_path, str(data_path), str(data_path / "vector_db"))
+
+    write_bundle(zip_path, {"vector_db/finance/chroma.sqlite3": "v1", "finance/guide.pdf": "pdf v1"})
+    bundle.prepare()
+    assert bundle.status()["state"] == "ready"
+
+    # Written next to the databases after the first extraction: downloads and their manifest
+    (data_path / "finance" / "fees.pdf").write_text("local pdf")
+    (data_path / "finance" / ".download_manifest.json").write_text("{}")
+
+    write_bundle(zip_path, {"vector_db/examinations/chroma.sqlite3": "v2", "finance/guide.pdf": "pdf v2"})
+    bundle.prepare()
+    assert bundle.status()["state"] == "ready"
+
+    # vector_db is swapped as a whole, the rest is merged
+    assert sorted(os.listdir(data_path / "vector_db")) == [".bundle_version", "examinations"]
+    assert read(data_path / "finance" / "guide.pdf") == "pdf v2"
+    assert read(data_path / "finance" / "fees.pdf") == "local pdf"
+    assert read(data_path / "finance" / ".download_manifest.json") == "{}"
+    assert not os.path.exists(data_path / ".vector_db.extracting")
@@ -0,0 +1,123 @@
+import os
+import shutil
+import logging
+import threading
+from langchain_core.documents import Document
+from ingestion import MANIFEST_FILE_NAME
+
+DEPARTMENT_FIELD = "department"
+MIGRATE_BATCH_SIZE = 1000
+
+
+def query_by_vectors(collection, embeddings, k, where=None):
+    """Top-k documents for several query embeddings in one Chroma query"""
+    results = collection.query(query_embeddings=embeddings, n_results=k, where=where, include=["documents", "metadatas"])
+    return [
+        [Document(id=chunk_id, page_content=text, metadata=metadata or {}) for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+        for ids, texts, metadatas in zip(results["ids"], results["documents"], results["metadatas"])
+    ]
+
+
+class UnifiedIndex:
+    """One Chroma collection holding every department's chunks, tagged with a department metadata field.
+    The collection is opened once and shared, and each agent searches its own slice through a DepartmentView,
+    so memory and file handles scale with the total corpus rather than with the number of agents"""
+
+    def __init__(self, path, embedding_function):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.vector_db = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Open the shared collection, once"""
+        with self._lock:
+            if self.vector_db is None:
+                from langchain_chroma import Chroma
+                logging.info(f"Opening unified vector database at {self.path}")
+                self.vector_db = Chroma(persist_directory=self.path, embedding_function=self.embedding_function)
+            return self.vector_db
+
+    def view(self, department):
+        """A store scoped to one department, or to all departments when department is None"""
+        return DepartmentView(self, department)
+
+    def manifest_path(self, department):
+        return os.path.join(self.path, f"{department}.{MANIFEST_FILE_NAME}")
+
+    def migrate(self, department, source_path):
+        """Copy a per-department Chroma database into the department's slice, reusing its stored
+        embeddings and index manifest so nothing is re-embedded"""
+        from langchain_chroma import Chroma
+        source = Chroma(persist_directory=source_path)
+        stored = source.get(include=["embeddings", "documents", "metadatas"])
+        collection = self.view(department)._collection
+        for start in range(0, len(stored["ids"]), MIGRATE_BATCH_SIZE):
+            end = start + MIGRATE_BATCH_SIZE
+            collection.upsert(
+                ids=stored["ids"][start:end],
+                embeddings=stored["embeddings"][start:end],
+                documents=stored["documents"][start:end],
+                metadatas=stored["metadatas"][start:end]
+            )
+        manifest = os.path.join(source_path, MANIFEST_FILE_NAME)
+        if os.path.exists(manifest):
+            shutil.copyfile(manifest, self.manifest_path(department))
+        logging.info(f"Migrated {len(stored['ids'])} chunks of {department} from {source_path} into the unified index")
+        return len(stored["ids"])
+
+
+class DepartmentCollection:
+    """The subset of the Chroma collection API used by ingestion, scoped to one department.
+    Chunk IDs are namespaced by department, so the same source indexed by two departments never collides"""
+
+    def __init__(self, collection, department):
+        self.collection = collection
+        self.department = department
+
+    def _id(self, chunk_id):
+        return f"{self.department}:{chunk_id}"
+
+    def _where(self, where=None):
+        scope = {DEPARTMENT_FIELD: self.department}
+        return {"$and": [scope, where]} if where else scope
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        metadatas = [{**(metadata or {}), DEPARTMENT_FIELD: self.department} for metadata in metadatas]
+        self.collection.upsert(ids=[self._id(chunk_id) for chunk_id in ids], embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        if ids is not None:
+            self.collection.delete(ids=[self._id(chunk_id) for chunk_id in ids])
+        else:
+            self.collection.delete(where=self._where(where))
+
+
+class DepartmentView:
+    """A department's slice of the unified index, searchable like a Chroma store"""
+
+    def __init__(self, index, department):
+        self.index = index
+        self.department = department
+
+    @property
+    def _collection(self):
+        return DepartmentCollection(self.index.load()._collection, self.department)
+
+    def _filter(self):
+        return {DEPARTMENT_FIELD: self.department} if self.department else None
+
+    def similarity_search(self, query, k=4):
+        return self.index.load().similarity_search(query, k=k, filter=self._filter())
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return self.index.load().similarity_search_by_vector(embedding, k=k, filter=self._filter())
+
+    def similarity_search_by_vectors(self, embeddings, k=4):
+        return query_by_vectors(self.index.load()._collection, embeddings, k, where=self._filter())
+
+    def get(self, include=None, limit=None):
+        return self.index.load().get(where=self._filter(), include=include or ["documents", "metadatas"], limit=limit)
+
+    def count(self):
+        return len(self.get(include=[])["ids"])
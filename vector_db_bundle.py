@@ -0,0 +1,143 @@
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import zipfile
+import threading
+
+MARKER_FILE_NAME = ".bundle_version"
+
+
+def zip_fingerprint(zip_path):
+    """Content fingerprint of a ZIP built from its central directory (names, CRC-32s and sizes),
+    so a changed bundle is detected without decompressing or hashing the whole archive"""
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        for info in sorted(zip_ref.infolist(), key=lambda info: info.filename):
+            digest.update(f"{info.filename}:{info.CRC}:{info.file_size}\n".encode())
+    return digest.hexdigest()
+
+
+class VectorDBBundle:
+    """Makes the bundled vector databases available under the data directory at startup.
+
+    A ZIP bundle is only extracted when its fingerprint differs from the marker written by the
+    last extraction, so recycled workers start without decompressing anything. Extraction goes to a
+    temporary folder that is swapped in atomically, under a file lock so concurrent workers extract
+    once. A directory bundle is served in place through a symlink, letting the OS share its pages."""
+
+    def __init__(self, bundle_path, extract_path, vector_db_folder):
+        self.bundle_path = bundle_path
+        self.extract_path = extract_path
+        self.vector_db_folder = vector_db_folder
+        self.marker_path = os.path.join(vector_db_folder, MARKER_FILE_NAME)
+        self.state = "pending"
+        self.error = None
+        self.seconds = None
+        self._ready = threading.Event()
+
+    def prepare(self, background=False):
+        """Check and, if needed, extract the bundle. In the background, /health reports "warming" until done"""
+        if background:
+            self.state = "warming"
+            threading.Thread(target=self._prepare, name="vector-db-bundle", daemon=True).start()
+        else:
+            self._prepare()
+
+    def _prepare(self):
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.extract_path, exist_ok=True)
+            if os.path.isdir(self.bundle_path):
+                self._link_directory()
+            elif os.path.exists(self.bundle_path):
+                self._extract_if_changed()
+            else:
+                logging.warning(f"No bundled vector DB found at {self.bundle_path}. Continuing without preload.")
+                # Create empty directory as fallback
+                os.makedirs(self.vector_db_folder, exist_ok=True)
+            self.state = "ready"
+        except Exception as e:
+            logging.error(f"Failed to prepare bundled vector DB from {self.bundle_path}: {e}")
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self.seconds = time.perf_counter() - start
+            logging.info(f"Vector DB startup finished in {self.seconds:.2f}s ({self.state})")
+            self._ready.set()
+
+    def _link_directory(self):
+        """Serve an uncompressed bundle in place instead of copying it"""
+        bundle_path = os.path.abspath(self.bundle_path)
+        if os.path.islink(self.vector_db_folder) and os.path.realpath(self.vector_db_folder) == os.path.realpath(bundle_path):
+            logging.info(f"Vector DB already linked to {bundle_path}")
+            return
+        if os.path.lexists(self.vector_db_folder):
+            raise RuntimeError(f"{self.vector_db_folder} already exists, remove it to serve the bundle from {bundle_path}")
+        os.symlink(bundle_path, self.vector_db_folder)
+        logging.info(f"Linked vector DB {self.vector_db_folder} -> {bundle_path}")
+
+    def _read_marker(self):
+        if not os.path.exists(self.marker_path):
+            return None
+        with open(self.marker_path) as f:
+            return f.read().strip()
+
+    def _extract_if_changed(self):
+        fingerprint = zip_fingerprint(self.bundle_path)
+        if self._read_marker() == fingerprint:
+            logging.info(f"Vector DB at {self.vector_db_folder} matches bundle {fingerprint[:12]}, skipping extraction")
+            return
+
+        # Only one worker extracts; the others wait on the lock and then find the marker up to date
+        with open(os.path.join(self.extract_path, ".vector_db.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._read_marker() == fingerprint:
+                    logging.info("Vector DB was extracted by another worker")
+                    return
+                self._extract(fingerprint)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _extract(self, fingerprint):
+        staging_path = os.path.join(self.extract_path, ".vector_db.extracting")
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+        logging.info(f"Unzipping bundled vector DB from {self.bundle_path} to {self.extract_path}")
+        with zipfile.ZipFile(self.bundle_path, 'r') as zip_ref:
+            zip_ref.extractall(staging_path)
+
+        # The archive contains the vector_db folder itself
+        extracted_folder = os.path.join(staging_path, os.path.basename(self.vector_db_folder))
+        if not os.path.isdir(extracted_folder):
+            raise RuntimeError(f"Extraction failed - {os.path.basename(self.vector_db_folder)} not found in {self.bundle_path}")
+        with open(os.path.join(extracted_folder, MARKER_FILE_NAME), "w") as f:
+            f.write(fingerprint)
+
+        # Swap the new folder in with renames so readers never see a half-extracted database
+        previous_folder = f"{self.vector_db_folder}.previous"
+        shutil.rmtree(previous_folder, ignore_errors=True)
+        if os.path.lexists(self.vector_db_folder):
+            os.rename(self.vector_db_folder, previous_folder)
+        os.rename(extracted_folder, self.vector_db_folder)
+        shutil.rmtree(previous_folder, ignore_errors=True)
+
+        # Anything else in the archive is merged into the data directory file by file, as a plain
+        # extractall did: files on disk that the archive does not have (PDFs, manifests) are kept
+        for folder, _, file_names in os.walk(staging_path):
+            target_folder = os.path.join(self.extract_path, os.path.relpath(folder, staging_path))
+            os.makedirs(target_folder, exist_ok=True)
+            for file_name in file_names:
+                os.replace(os.path.join(folder, file_name), os.path.join(target_folder, file_name))
+        shutil.rmtree(staging_path, ignore_errors=True)
+        logging.info(f"Successfully extracted vector DB to {self.vector_db_folder}")
+
+    def wait_ready(self, timeout=None):
+        """Block until the bundle is ready (or failed). Returns False on timeout"""
+        return self._ready.wait(timeout)
+
+    def status(self):
+        return {"state": self.state, "seconds": round(self.seconds, 3) if self.seconds is not None else None, "error": self.error}